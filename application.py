@@ -6,6 +6,8 @@ import routes.auth as auth
 import routes.api as api
 
 import utils.web_utils as utils
+from utils.ingest_jobs import DEFAULT_RETENTION_DAYS, cleanup_jobs
+from fixity.fixity_stage import cleanup_fixity_jobs
 
 
 logger = logging.getLogger(__name__)
@@ -41,6 +43,9 @@ application.config['DEBUG'] = True
 
 # empty upload directory on startup
 utils.cleanup(application.config['UPLOADS'])
+# and remove ingest and fixity jobs past their retention
+cleanup_jobs(retention_days=os.environ.get('INGEST_JOB_RETENTION_DAYS') or DEFAULT_RETENTION_DAYS)
+cleanup_fixity_jobs()
 
 
 # === Routes === 
@@ -56,6 +61,14 @@ def ingest_form():
 def submit():
     return pages.submit(application)
 
+@application.route('/jobs/<job_id>')
+def job(job_id):
+    return pages.job(job_id)
+
+@application.route('/jobs/<job_id>/results/<filename>')
+def job_results(job_id, filename):
+    return pages.job_results(job_id, filename)
+
 
 #auth
 @application.route('/login')
@@ -84,6 +97,18 @@ def get_tables():
 def env_defaults():
     return api.env_defaults(application)
 
+@application.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    return api.get_job_status(job_id)
+
+@application.route('/api/jobs/<job_id>/log')
+def stream_job_log(job_id):
+    return api.stream_job_log(job_id)
+
+@application.route('/api/fixity/<job_id>')
+def get_fixity_status(job_id):
+    return api.get_fixity_status(job_id)
+
 
 if __name__ == '__main__':
     application.run()
\ No newline at end of file
@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""
+Compares collection map building on a synthetic hierarchy.
+
+    python benchmarks/collection_map_benchmark.py [--collections 10000] [--fanout 8]
+
+"legacy" is the old per-node walk: every node runs a full filtered scan of the
+Collection table. "single scan" builds the parent -> children index from one scan.
+Both run against an in-memory table that counts the items each scan reads, which
+is what DynamoDB charges read capacity for. The legacy walk is quadratic, so
+it runs on the first --legacy-collections nodes only. The two maps are compared
+on that subset.
+"""
+import argparse, json, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.collection_tree import build_collection_map, children_by_parent
+
+
+def synthetic_collections(count, fanout):
+    # breadth-first tree: collection n's parent is collection (n - 1) // fanout
+    items = []
+    for n in range(count):
+        item = {
+            "id": f"id-{n:06d}",
+            "title": f"Collection {n}",
+            "custom_key": f"ark:/53696/{n:08x}",
+        }
+        if n > 0:
+            item["parent_collection"] = [f"id-{(n - 1) // fanout:06d}"]
+        items.append(item)
+    return items
+
+
+class CountingTable:
+    def __init__(self, items):
+        self.items = items
+        self.scans = 0
+        self.items_read = 0
+
+    def scan(self, parent_id=None):
+        self.scans += 1
+        self.items_read += len(self.items)
+        if parent_id is None:
+            return [item for item in self.items if "parent_collection" in item]
+        return [item for item in self.items if parent_id in item.get("parent_collection", [])]
+
+
+def legacy_walk(table, parent):
+    location = {
+        "id": parent["id"],
+        "name": parent["title"],
+        "custom_key": parent["custom_key"].replace("ark:/53696/", ""),
+    }
+    children = table.scan(parent["id"])
+    if len(children) > 0:
+        location["children"] = [legacy_walk(table, child) for child in children]
+    return location
+
+
+def single_scan(table, root):
+    return build_collection_map(root, children_by_parent(table.scan()))
+
+
+def run(label, fn, table, root):
+    start = time.perf_counter()
+    map_obj = fn(table, root)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>12}: {len(table.items):>6} collections, {table.scans:>6} scan(s), "
+          f"{table.items_read:>11} items read, {elapsed * 1000:9.1f} ms")
+    return map_obj
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collections", type=int, default=10000)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--legacy-collections", type=int, default=2000)
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+
+    items = synthetic_collections(args.legacy_collections, args.fanout)
+    legacy = run("legacy", legacy_walk, CountingTable(items), items[0])
+    single = run("single scan", single_scan, CountingTable(items), items[0])
+    assert json.dumps(legacy) == json.dumps(single), "map_object mismatch"
+
+    items = synthetic_collections(args.collections, args.fanout)
+    run("single scan", single_scan, CountingTable(items), items[0])
+
+    # a chain deeper than the default recursion limit
+    items = synthetic_collections(args.collections, 1)
+    run("deep chain", single_scan, CountingTable(items), items[0])
+
+
+if __name__ == "__main__":
+    main()
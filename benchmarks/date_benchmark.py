@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+"""
+Compares date validation and normalization on a synthetic date column.
+
+    python benchmarks/date_benchmark.py [--rows 100000] [--distinct 500]
+
+"legacy" is the old code: up to seven strptime formats per value for validation,
+and dateutil's parse() on every value for the search index form. "engine" is
+utils.date_tools, which picks the format from the value's separators and
+memoizes each distinct string. Both are run over the same column, which repeats
+--distinct values the way dates repeat across a collection, and their results
+must match.
+"""
+import argparse, os, random, re, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime
+from dateutil.parser import parse
+from utils.date_tools import index_date_cached, index_dates, parse_date_cached, valid_date, valid_dates
+
+LEGACY_FORMATS = ["%Y/%m/%d %H:%M:%S", "%Y/%m/%d", "%Y/%m", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%Y-%m", "%Y"]
+
+
+def legacy_valid(value):
+    if not value:
+        return True
+    for fmt in LEGACY_FORMATS:
+        try:
+            datetime.strptime(value, fmt)
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+def legacy_index(value):
+    if value is None or str(value).strip().lower() == "none" or not str(value).strip():
+        return ""
+    if re.fullmatch(r"\d{4}", value):
+        return value
+    try:
+        return parse(value).strftime("%Y/%m/%d")
+    except Exception as e:
+        return type(e)
+
+
+def synthetic_dates(rows, distinct, seed=1):
+    rng = random.Random(seed)
+    shapes = [
+        "{y}/{m}/{d} {H}:{M}:{S}", "{y}/{m}/{d}", "{y}/{m}", "{y}-{m}-{d} {H}:{M}:{S}",
+        "{y}-{m}-{d}", "{y}-{m}", "{y}", "{m}/{d}/{y}", "{y}-{m:02d}-{d:02d}", "circa {y}",
+        "{y}/13/01", "{y}-02-30", "", "None", "not a date",
+    ]
+    values = []
+    for _ in range(distinct):
+        values.append(rng.choice(shapes).format(
+            y=rng.randint(1850, 2030), m=rng.randint(1, 12), d=rng.randint(1, 28),
+            H=rng.randint(0, 23), M=rng.randint(0, 59), S=rng.randint(0, 59),
+        ))
+    return [rng.choice(values) for _ in range(rows)]
+
+
+def run(label, fn, column):
+    start = time.perf_counter()
+    results = fn(column)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>20}: {len(column):>8} values, {elapsed * 1000:9.1f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--distinct", type=int, default=500)
+    args = parser.parse_args()
+
+    column = synthetic_dates(args.rows, args.distinct)
+    for cache in (valid_date, index_date_cached, parse_date_cached):
+        cache.cache_clear()
+
+    legacy = run("legacy validate", lambda values: [legacy_valid(value) for value in values], column)
+    engine = run("engine validate", valid_dates, column)
+    assert legacy == engine, "validation mismatch"
+
+    legacy = run("legacy index date", lambda values: [legacy_index(value) for value in values], column)
+    engine = run("engine index date", index_dates, column)
+    engine = [indexed if error is None else type(error) for indexed, error in engine]
+    assert legacy == engine, "index date mismatch"
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
-import boto3, json, logging, os, uuid
+import boto3, csv, io, json, logging, os, tempfile, uuid
 import pandas as pd
-from boto3.dynamodb.conditions import Attr
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from io import StringIO
+from utils.dynamo_tools import batch_put_items
+from utils.thread_context import with_context
+from fixity.content_verifier import ContentVerifier
+from fixity.etag_check import EtagChecker
+from fixity.fixity_paths import FixityPaths
+from fixity.ledger import DEFAULT_LEDGER_PATH, ManifestLedger, row_fingerprint
+from fixity.s3_index import build_object_index
 
 logger = logging.getLogger()
 
@@ -16,6 +24,13 @@ logger = logging.getLogger()
     FIXITY_TABLE_NAME <string> - DynamoDB table name to write file records to
     S3_BUCKET_NAME <string> - S3 bucket to write results to
     S3_PREFIX <string> - S3 prefix for the collection
+    FIXITY_WORKERS <int> - concurrent manifest downloads and S3/DynamoDB lookups (default 8)
+    FIXITY_MANIFESTS <int> - checksum files stored at once, and downloaded ahead (default 2)
+    VERIFY_CONTENT <bool> - read new files back from S3 and check their MD5 and SHA1 (default false)
+    VERIFY_WORKERS <int> - files hashed at once when verifying (default 4)
+    VERIFY_MAX_MBPS <number> - cap on read throughput when verifying, in MB/s (default unlimited)
+    FIXITY_LEDGER <string> - local file recording the checksum files already processed
+    FIXITY_RESCAN <bool> - process every checksum file and row, even ones the ledger has (default false)
 
     Script expects the csv headers defined in vtdlp/checksumgenerator
     https://github.com/vt-digital-libraries-platform/checksumgenerator
@@ -30,6 +45,8 @@ except Exception as e:
     raise e
 
 
+RESULTS_SPOOL_SIZE = 8 * 1024 ** 2
+
 csv_headers = {
     "created": 'CreatedDate',
     "fileExt": 'FileExtension', 
@@ -42,28 +59,6 @@ csv_headers = {
 
 
 
-def get_matching_s3_keys(bucket, prefix="", suffix=""):
-    s3 = boto3.client("s3")
-    kwargs = {"Bucket": bucket, "Prefix": prefix}
-    matches = []
-    while True:
-        resp = s3.list_objects_v2(**kwargs)
-        try:
-            contents = resp["Contents"]
-        except KeyError:
-            return
-        for obj in contents:
-            key = obj["Key"]
-            if key.startswith(prefix) and key.endswith(suffix):
-                if key not in matches and "/ingest_results/" not in key:
-                    matches.append(key)
-        try:
-            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
-        except KeyError:
-            break
-    return matches
-
-
 def csv_to_dataframe(csv_path):
     df = pd.read_csv(
         csv_path,
@@ -75,8 +70,8 @@ def csv_to_dataframe(csv_path):
             'end_date': str})
     return df
 
-def get_checksum_file_paths(s3_bucket, collection_path):
-    checksum_files = get_matching_s3_keys(s3_bucket, os.path.join(collection_path,"checksum"), suffix=".csv")
+def get_checksum_file_paths(object_index, collection_path):
+    checksum_files = object_index.match(os.path.join(collection_path,"checksum"), suffix=".csv")
     return checksum_files
 
 
@@ -93,29 +88,18 @@ def get_fileList_df(s3_bucket, checksum_file_path):
     return dataframe
 
 
-def record_exists_in_db(fixity_table_name, key):
-    fixity_table = dynamo_resource.Table(fixity_table_name)
+def manifest_keys(object_index, file_list):
+    # the S3 keys a checksum manifest refers to, so their fixity records can be looked up together
+    if csv_headers['fileName'] not in file_list.columns:
+        return []
+    file_paths = file_list[csv_headers['filePath']] if csv_headers['filePath'] in file_list.columns else [None] * len(file_list)
+    return [object_index.find(name, path) for name, path in zip(file_list[csv_headers['fileName']], file_paths)]
 
-    scan_kwargs = {
-            "FilterExpression": Attr("s3_file_path").contains(key),
-            "ProjectionExpression": "#id",
-            "ExpressionAttributeNames": {"#id": "id"},
-        }
-    source_table_items = []
-    try:
-        done = False
-        start_key = None
-        while not done:
-            if start_key:
-                scan_kwargs["ExclusiveStartKey"] = start_key
-            response = fixity_table.scan(**scan_kwargs)
-            source_table_items.extend(response["Items"])
-            start_key = response.get("LastEvaluatedKey", None)
-            done = start_key is None
-    except Exception as e:
-        logger.error(f"An error occurred scanning for {key}: {str(e)}")
 
-    return len(source_table_items) > 0
+def manifest_fingerprints(file_list):
+    # one per row, from the checksum columns; a missing column fingerprints as empty
+    columns = file_list.reindex(columns=list(csv_headers.values()), fill_value="").astype(str)
+    return [row_fingerprint(row) for row in columns.itertuples(index=False)]
 
 
 def create_s3_file_metadata(filePath, response):
@@ -128,33 +112,69 @@ def create_s3_file_metadata(filePath, response):
     return metadata
 
 
+def fetch_file_type(file_record):
+    # the stored type and headers are S3's own, from head_object; runs on the fixity pool
+    try:
+        response = s3_client.head_object(Bucket=file_record['s3_bucket'], Key=file_record['s3_file_path'])
+        file_record['file_type'] = response['ContentType']
+        file_record['s3_file_metadata'] = create_s3_file_metadata(file_record['orig_file_path'], response)
+    except Exception as e:
+        logger.error(f"Error fetching head object for file: {file_record['orig_file_path']}")
+
+
+def store_file_records(executor, etag_checker, verifier, fixity_table_name, path, file_records):
+    # completes a manifest's new records on the fixity pool and writes them; runs on the manifest pool
+    # head_object for every record, concurrently
+    list(executor.map(with_context(fetch_file_type), file_records))
+    # with verification on, multipart ETags need S3 calls for their part layout, so these run on the pool too
+    list(executor.map(with_context(etag_checker.check), file_records))
+    ingested_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    for file_record in file_records:
+        file_record['file_ingested_date'] = ingested_date
+
+    if verifier is not None and file_records:
+        logger.info(f"Verifying the content of {len(file_records)} file(s) from checksum file: {path}")
+        verifier.verify_all(file_records)
+
+    logger.info(f"Writing {len(file_records)} file record(s) to DynamoDB from checksum file: {path}")
+    # several manifests are stored at once; the resource's client is thread safe, the resource isn't
+    written = batch_put_items(dynamo_resource.meta.client, fixity_table_name, file_records)
+    return {"records": file_records, "written": written}
+
+
 def write_results_to_s3(s3_bucket, s3_results_path, ingest_job, type, results):
-    results_string = "original_file_path,s3_key"
-    all_results = ""
-    for result in results:
-        file_result = ",".join(result)
-        all_results += f"\n{file_result}"
-    results_string += all_results
+    # Rows are csv-quoted as they are written, to a buffer that moves to disk past
+    # RESULTS_SPOOL_SIZE; upload_fileobj sends large results as a multipart upload
     key = os.path.join(s3_results_path, f"{ingest_job}_{type}.csv")
-    s3_client.put_object(Bucket=s3_bucket, Key=key, Body=results_string)
-
-def write_summary_to_s3(s3_bucket, s3_results_path, ingest_job, total_files_listed, ingested, existing, not_found):
+    with tempfile.SpooledTemporaryFile(max_size=RESULTS_SPOOL_SIZE) as body:
+        text = io.TextIOWrapper(body, encoding="utf-8", newline="")
+        writer = csv.writer(text, lineterminator="\n")
+        writer.writerow(["original_file_path", "s3_key"])
+        writer.writerows(results)
+        text.flush()
+        text.detach()
+        body.seek(0)
+        s3_client.upload_fileobj(body, s3_bucket, key)
+
+def write_summary_to_s3(s3_bucket, s3_results_path, ingest_job, total_files_listed, ingested, existing, not_found, unchanged=0):
     results_string = f"Ingest job: {ingest_job}\n\n"
     results_string += f"Files listed in checksum file(s): {total_files_listed}\n"
     results_string += f"Files ingested: {len(ingested)}\n"
     results_string += f"Files previously ingested: {len(existing)}\n"
+    results_string += f"Files unchanged since an earlier run: {unchanged}\n"
     results_string += f"Files not found: {len(not_found)}\n\n"
 
-    if len(ingested) + len(existing) == total_files_listed:
+    if len(ingested) + len(existing) + unchanged == total_files_listed:
         results_string += "All files in checksum lists located successfully.\n"
 
     key = os.path.join(s3_results_path, f"{ingest_job}_summary.txt")
     s3_client.put_object(Bucket=s3_bucket, Key=key, Body=results_string)
 
 def checksum_handler(event, context):
-    existing = []
-    ingested = []
-    not_found = []
+    # (original file path, s3 key) -> None; dicts keep the first-seen order of a set of results
+    existing = {}
+    ingested = {}
+    not_found = {}
 
     """
         Lambda invocation event must contain: 
@@ -171,12 +191,26 @@ def checksum_handler(event, context):
     fixity_table_name = event.get('FIXITY_TABLE_NAME') or os.getenv('FIXITY_TABLE_NAME')
     s3_bucket = event.get('S3_BUCKET_NAME') or os.getenv('S3_BUCKET_NAME')
     s3_prefix = event.get('S3_PREFIX') or os.getenv('S3_PREFIX')
+    max_workers = max(1, int(event.get('FIXITY_WORKERS') or os.getenv('FIXITY_WORKERS') or 8))
+    manifest_workers = max(1, int(event.get('FIXITY_MANIFESTS') or os.getenv('FIXITY_MANIFESTS') or 2))
+    verifier = None
+    if str(event.get('VERIFY_CONTENT') or os.getenv('VERIFY_CONTENT') or '').lower() == 'true':
+        verifier = ContentVerifier(
+            s3_client,
+            max_workers=event.get('VERIFY_WORKERS') or os.getenv('VERIFY_WORKERS') or 4,
+            max_bytes_per_second=float(event.get('VERIFY_MAX_MBPS') or os.getenv('VERIFY_MAX_MBPS') or 0) * 1024 ** 2,
+        )
+    ledger = ManifestLedger(event.get('FIXITY_LEDGER') or os.getenv('FIXITY_LEDGER') or DEFAULT_LEDGER_PATH, fixity_table_name)
+    rescan = str(event.get('FIXITY_RESCAN') or os.getenv('FIXITY_RESCAN') or '').lower() == 'true'
     logger.info(
         f"checksum_handler start: collection_identifier={collection_identifier}, "
-        f"fixity_table_name={fixity_table_name}, s3_bucket={s3_bucket}, s3_prefix={s3_prefix}"
+        f"fixity_table_name={fixity_table_name}, s3_bucket={s3_bucket}, s3_prefix={s3_prefix}, "
+        f"fixity_job={event.get('FIXITY_JOB_ID')}"
     )
     collection_path = os.path.join(s3_prefix, collection_identifier)
-    checksum_file_paths = get_checksum_file_paths(s3_bucket, collection_path)
+    # every lookup below is answered from this one listing of the collection
+    object_index = build_object_index(s3_client, s3_bucket, collection_path)
+    checksum_file_paths = get_checksum_file_paths(object_index, collection_path)
     logger.info(
         f"Discovered {len(checksum_file_paths) if checksum_file_paths else 0} checksum file(s) under {collection_path}/checksum"
     )
@@ -184,89 +218,134 @@ def checksum_handler(event, context):
     s3_results_path = os.path.join(collection_path, "ingest_results", ingest_job)
 
     fixity_table = dynamo_resource.Table(fixity_table_name)
+    # multipart objects only need their part layout looked up when they'll be read back
+    etag_checker = EtagChecker(s3_client, verify=verifier is not None)
+    existing_paths = FixityPaths(fixity_table, os.path.join(collection_path, ""), max_workers=max_workers)
 
     total_files_listed = 0
+    unchanged = 0
     # Process checksum file(s)
     if checksum_file_paths is not None and len(checksum_file_paths) > 0:
-        for path in checksum_file_paths:
-            logger.info(f"Processing checksum file: {path}")
-            file_list = get_fileList_df(s3_bucket, path)
-            logger.info(f"Loaded {len(file_list)} row(s) from checksum file: {path}")
-            total_files_listed += len(file_list)
-            # Loop through checksum file and process each file listed
-            for idx, record in file_list.iterrows():
-                try:
-                    created = record[csv_headers['created']]
-                    fileExt = record[csv_headers['fileExt']]
-                    fileName = record[csv_headers['fileName']]
-                    filePath = record[csv_headers['filePath']]
-                    fileSize = record[csv_headers['fileSize']]
-                    md5 = record[csv_headers['md5']]
-                    sha1 = record[csv_headers['sha1']]
-                except KeyError as e:
-                    logger.error(
-                        f"Missing required checksum header {str(e)} in {path} at row {idx + 1}. Skipping row."
-                    )
-                    continue
-
-                # find file(s) based on collection path and filename
-                obj_keys = get_matching_s3_keys(s3_bucket, collection_path, fileName)
-                key = obj_keys[0] if obj_keys else None
-                if not key:
-                    logger.warning(f"File not found: {fileName}")
-                    not_found_tuple = (filePath, "not found")
-                    if not_found_tuple not in not_found:
-                        not_found.append(not_found_tuple)
-                    continue
-                    
-
-                # Check if fileCharacterization record is already in dynamo
-                if record_exists_in_db(fixity_table_name, key):
-                    existing_tuple = (filePath, key)
-                    if existing_tuple not in existing:
-                        existing.append(existing_tuple)
-                    continue
-
-                # File found and needs to be ingested
-                metadata = None
-                mime_type = None
-                try:
-                    response = s3_client.head_object(Bucket=s3_bucket, Key=key)
-                    mime_type = response['ContentType']
-                    metadata = create_s3_file_metadata(filePath, response)
-                except Exception as e:
-                    logger.error(f"Error fetching head object for file: {filePath}")
-                    
-                ingested_date = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
-
-                file_record = {
-                    'id': str(uuid.uuid4()),
-                    'collection_identifier': collection_identifier,
-                    'file_name': fileName,
-                    'file_size': fileSize,
-                    'file_extension': fileExt,
-                    'file_type': mime_type,
-                    'orig_file_path': filePath,
-                    's3_bucket': s3_bucket,
-                    's3_file_metadata': metadata,
-                    's3_file_path': key,
-                    'sha1': sha1,
-                    'md5': md5,
-                    'created_date': created,
-                    'file_ingested_date': ingested_date,
-                    'ingest_job': ingest_job,
-                    'md5_matches_etag': md5 == metadata['etag'].replace('\"', '')
-                }
-                    
-                try:
-                    logger.info(f"Writing file record to DynamoDB for file: {filePath}")
-                    logger.info(f"File record: {file_record}")
-                    fixity_table.put_item(Item=file_record)
-                    ingested_tuple = (filePath, key)
-                    if ingested_tuple not in ingested:  
-                        ingested.append(ingested_tuple)
-                except Exception as e:
-                    logger.error(f"Error writing to DynamoDB for file: {filePath}: {e}")
+        manifest_etags = {path: (object_index.objects.get(path) or {}).get("ETag") for path in checksum_file_paths}
+        if not rescan:
+            # manifests the ledger has, unchanged and fully processed, aren't read again
+            skipped = [path for path in checksum_file_paths if ledger.unchanged(s3_bucket, path, manifest_etags[path])]
+            for path in skipped:
+                entry = ledger.entry(s3_bucket, path)
+                logger.info(f"Skipping checksum file {path}: unchanged since {entry['processed_at']}")
+                total_files_listed += entry["listed"]
+                unchanged += entry["listed"]
+            checksum_file_paths = [path for path in checksum_file_paths if path not in skipped]
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fixity") as executor, \
+                ThreadPoolExecutor(max_workers=manifest_workers, thread_name_prefix="fixity-manifest") as manifest_executor:
+            # at most manifest_workers manifests are downloaded ahead and as many are being
+            # stored, so only those are in memory however many the collection has
+            paths = iter(checksum_file_paths)
+            downloads = deque()
+            storing = deque()
+
+            def download_next():
+                path = next(paths, None)
+                if path is not None:
+                    downloads.append((path, executor.submit(with_context(get_fileList_df), s3_bucket, path)))
+
+            def finish(path, all_fingerprints, settled, record_fingerprints, stored):
+                # results are taken in manifest order, so they come out as they would one at a time
+                written = stored.result()
+                for file_record in written["records"]:
+                    if written["written"].get(file_record['id']):
+                        ingested_tuple = (file_record['orig_file_path'], file_record['s3_file_path'])
+                        ingested.setdefault(ingested_tuple)
+                        settled.add(record_fingerprints[file_record['id']])
+                    else:
+                        logger.error(f"Error writing to DynamoDB for file: {file_record['orig_file_path']}")
+                ledger.record(s3_bucket, path, manifest_etags[path], len(set(all_fingerprints)), settled, len(all_fingerprints))
+
+            for _ in range(manifest_workers):
+                download_next()
+            while downloads:
+                path, download = downloads.popleft()
+                file_list = download.result()
+                download_next()
+                logger.info(f"Processing checksum file: {path}")
+                logger.info(f"Loaded {len(file_list)} row(s) from checksum file: {path}")
+                total_files_listed += len(file_list)
+                # rows settled in an earlier run (ingested, or found already recorded) are skipped
+                all_fingerprints = manifest_fingerprints(file_list)
+                previously_settled = set() if rescan else ledger.settled(s3_bucket, path)
+                settled = previously_settled.intersection(all_fingerprints)
+                pending = [fingerprint not in settled for fingerprint in all_fingerprints]
+                if not all(pending):
+                    logger.info(f"Skipping {pending.count(False)} row(s) of {path} unchanged since an earlier run")
+                    unchanged += pending.count(False)
+                    file_list = file_list[pending]
+                fingerprints = [fingerprint for fingerprint in all_fingerprints if fingerprint not in settled]
+                existing_paths.prefetch(manifest_keys(object_index, file_list))
+                file_records = []
+                record_fingerprints = {}
+                # Rows are classified here, in manifest order, so a file listed twice is ingested
+                # once and reported as previously ingested after that, even across manifests
+                for (idx, record), fingerprint in zip(file_list.iterrows(), fingerprints):
+                    try:
+                        created = record[csv_headers['created']]
+                        fileExt = record[csv_headers['fileExt']]
+                        fileName = record[csv_headers['fileName']]
+                        filePath = record[csv_headers['filePath']]
+                        fileSize = record[csv_headers['fileSize']]
+                        md5 = record[csv_headers['md5']]
+                        sha1 = record[csv_headers['sha1']]
+                    except KeyError as e:
+                        logger.error(
+                            f"Missing required checksum header {str(e)} in {path} at row {idx + 1}. Skipping row."
+                        )
+                        continue
+
+                    # find file based on collection path and filename
+                    key = object_index.find(fileName, filePath)
+                    if not key:
+                        logger.warning(f"File not found: {fileName}")
+                        not_found_tuple = (filePath, "not found")
+                        not_found.setdefault(not_found_tuple)
+                        continue
+
+                    # Check if fileCharacterization record is already in dynamo
+                    if key in existing_paths:
+                        existing_tuple = (filePath, key)
+                        existing.setdefault(existing_tuple)
+                        settled.add(fingerprint)
+                        continue
+                    existing_paths.add(key)
+
+                    # File found and needs to be ingested.
+                    # The type and S3 headers are filled in by head_object when the manifest is stored
+                    file_records.append({
+                        'id': str(uuid.uuid4()),
+                        'collection_identifier': collection_identifier,
+                        'file_name': fileName,
+                        'file_size': fileSize,
+                        'file_extension': fileExt,
+                        'file_type': None,
+                        'orig_file_path': filePath,
+                        's3_bucket': s3_bucket,
+                        's3_file_metadata': None,
+                        's3_file_path': key,
+                        'sha1': sha1,
+                        'md5': md5,
+                        'created_date': created,
+                        'ingest_job': ingest_job,
+                    })
+                    record_fingerprints[file_records[-1]['id']] = fingerprint
+                del file_list
+
+                # the S3 lookups, verification and writes of this manifest overlap the next ones
+                stored = manifest_executor.submit(
+                    with_context(store_file_records), executor, etag_checker, verifier, fixity_table_name, path, file_records
+                )
+                storing.append((path, all_fingerprints, settled, record_fingerprints, stored))
+                if len(storing) > manifest_workers:
+                    finish(*storing.popleft())
+            while storing:
+                finish(*storing.popleft())
     else:
         logger.warning(f"No checksum file(s) found under {collection_path}/checksum")
 
@@ -281,15 +360,22 @@ def checksum_handler(event, context):
     if len(ingested) > 0:
         write_results_to_s3(s3_bucket, s3_results_path, ingest_job, "ingested", ingested)
     
-    write_summary_to_s3(s3_bucket, s3_results_path, ingest_job, total_files_listed, ingested, existing, not_found)
+    write_summary_to_s3(s3_bucket, s3_results_path, ingest_job, total_files_listed, ingested, existing, not_found, unchanged)
     logger.info(
         f"checksum_handler complete: listed={total_files_listed}, ingested={len(ingested)}, "
-        f"existing={len(existing)}, not_found={len(not_found)}"
+        f"existing={len(existing)}, unchanged={unchanged}, not_found={len(not_found)}"
     )
     
     return {
         "statusCode": 200,
         "body": json.dumps({
             "message": "Process completed.",
+            "ingest_job": ingest_job,
+            "results_path": f"s3://{s3_bucket}/{s3_results_path}",
+            "listed": total_files_listed,
+            "ingested": len(ingested),
+            "existing": len(existing),
+            "unchanged": unchanged,
+            "not_found": len(not_found),
         }),
     }
\ No newline at end of file
@@ -0,0 +1,198 @@
+import base64, hashlib, logging, threading, time, zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fixity.etag_check import multipart_etag, split_etag
+from utils.thread_context import with_context
+
+logger = logging.getLogger()
+
+RANGE_SIZE = 64 * 1024 ** 2
+READ_SIZE = 1024 ** 2
+
+
+class ThroughputLimit:
+    """Token bucket shared by the hashing workers, in bytes per second. 0 or None is unlimited."""
+
+    def __init__(self, bytes_per_second=None):
+        self.rate = float(bytes_per_second or 0)
+        self.allowance = self.rate
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, size):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            self.allowance -= size
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class Crc32:
+    """zlib.crc32 behind the hashlib interface, as S3 computes ChecksumCRC32."""
+
+    def __init__(self, value=0):
+        self.value = value
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def digest(self):
+        return self.value.to_bytes(4, "big")
+
+    def copy(self):
+        return Crc32(self.value)
+
+
+PART_HASHES = {"sha1": hashlib.sha1, "crc32": Crc32}
+
+
+class ContentVerifier:
+    """
+    Reads S3 objects back and hashes them, MD5 and SHA1 in the same pass.
+
+    Objects are read with ranged GETs of `range_size` bytes and hashed as each block
+    arrives, so memory use is a read buffer per worker whatever the object size.
+    A range that fails is retried from the hash state before it. Objects are hashed
+    concurrently on `max_workers` threads, all under one throughput limit.
+    Given the part size of a multipart upload, the same pass also rebuilds its ETag,
+    and checks each part against the SHA1 or CRC32 S3 stored for it, when it has them.
+    """
+
+    def __init__(self, s3_client, max_workers=4, max_bytes_per_second=None, range_size=RANGE_SIZE, retries=3):
+        self.s3_client = s3_client
+        self.max_workers = max(1, int(max_workers))
+        self.limit = ThroughputLimit(max_bytes_per_second)
+        self.range_size = max(READ_SIZE, int(range_size))
+        self.retries = max(0, int(retries))
+
+    def hash_object(self, bucket, key, size, part_size=None, part_algorithm=None):
+        # -> (md5, sha1, multipart ETag or None, base64 part checksums or None)
+        part_hash = PART_HASHES.get(part_algorithm) if part_size else None
+        state = {
+            "md5": hashlib.md5(),
+            "sha1": hashlib.sha1(),
+            "part": hashlib.md5(),
+            "part_left": part_size,
+            "parts": [],
+            "part_hash": part_hash,
+            "part_check": part_hash() if part_hash else None,
+            "part_checks": [],
+        }
+        start = 0
+        while start < size:
+            end = min(start + self.range_size, size) - 1
+            attempts = 0
+            while True:
+                range_state = self.copy_state(state)
+                try:
+                    response = self.s3_client.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")
+                    for block in response["Body"].iter_chunks(READ_SIZE):
+                        self.limit.consume(len(block))
+                        self.update(range_state, block, part_size)
+                    break
+                except Exception as e:
+                    attempts += 1
+                    if attempts > self.retries:
+                        raise
+                    logger.warning(f"Retrying bytes {start}-{end} of s3://{bucket}/{key}: {e}")
+                    time.sleep(2 ** (attempts - 1))
+            state = range_state
+            start = end + 1
+        etag = None
+        part_checks = None
+        if part_size:
+            if state["part_left"] != part_size or not state["parts"]:
+                self.end_part(state)
+            etag = multipart_etag(state["parts"])
+            if part_hash:
+                part_checks = [base64.b64encode(digest).decode() for digest in state["part_checks"]]
+        return state["md5"].hexdigest(), state["sha1"].hexdigest(), etag, part_checks
+
+    def copy_state(self, state):
+        return dict(
+            state,
+            md5=state["md5"].copy(),
+            sha1=state["sha1"].copy(),
+            part=state["part"].copy(),
+            parts=list(state["parts"]),
+            part_check=state["part_check"].copy() if state["part_check"] else None,
+            part_checks=list(state["part_checks"]),
+        )
+
+    def end_part(self, state):
+        state["parts"].append(state["part"].digest())
+        state["part"] = hashlib.md5()
+        if state["part_check"]:
+            state["part_checks"].append(state["part_check"].digest())
+            state["part_check"] = state["part_hash"]()
+
+    def update(self, state, block, part_size):
+        state["md5"].update(block)
+        state["sha1"].update(block)
+        if not part_size:
+            return
+        view = memoryview(block)
+        while view:
+            take = min(len(view), state["part_left"])
+            state["part"].update(view[:take])
+            if state["part_check"]:
+                state["part_check"].update(view[:take])
+            view = view[take:]
+            state["part_left"] -= take
+            if state["part_left"] == 0:
+                self.end_part(state)
+                state["part_left"] = part_size
+
+    def verify(self, file_record):
+        """
+        Hashes the record's object and records the result on it:
+        verified_md5/verified_sha1, md5_verified/sha1_verified against the manifest,
+        and fixity_mismatch listing the hashes that differ. For a multipart object whose
+        part size is known, the rebuilt ETag settles md5_matches_etag and etag_check, and
+        part_checksums_verified says whether each part matched the checksum S3 stored
+        for it (the record's part_checksums, which is removed as it isn't kept).
+        """
+        size = (file_record.get("s3_file_metadata") or {}).get("content-length")
+        part_checksums = file_record.pop("part_checksums", None) or {}
+        try:
+            if size is None:
+                size = self.s3_client.head_object(Bucket=file_record["s3_bucket"], Key=file_record["s3_file_path"])["ContentLength"]
+            md5, sha1, etag, part_checks = self.hash_object(
+                file_record["s3_bucket"],
+                file_record["s3_file_path"],
+                int(size),
+                file_record.get("etag_part_size"),
+                part_checksums.get("algorithm"),
+            )
+        except Exception as e:
+            logger.error(f"Error verifying content of {file_record['s3_file_path']}: {e}")
+            file_record["verification_error"] = str(e)
+            return file_record
+        file_record["verified_md5"] = md5
+        file_record["verified_sha1"] = sha1
+        file_record["md5_verified"] = md5 == str(file_record.get("md5", "")).strip().lower()
+        file_record["sha1_verified"] = sha1 == str(file_record.get("sha1", "")).strip().lower()
+        file_record["fixity_mismatch"] = [name for name in ("md5", "sha1") if not file_record[f"{name}_verified"]]
+        if part_checks is not None:
+            file_record["part_checksums_verified"] = part_checks == part_checksums["values"]
+            if not file_record["part_checksums_verified"]:
+                file_record["fixity_mismatch"].append(f"part_{part_checksums['algorithm']}")
+        if etag is not None:
+            digest, parts = split_etag((file_record.get("s3_file_metadata") or {}).get("etag"))
+            etag_matches = etag == f"{digest}-{parts}"
+            # the bytes read are the ones S3 stored, and their MD5 is the manifest's
+            file_record["md5_matches_etag"] = etag_matches and file_record["md5_verified"]
+            file_record["etag_check"] = "multipart_match" if file_record["md5_matches_etag"] else "multipart_mismatch"
+        file_record["content_verified_date"] = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        if file_record["fixity_mismatch"]:
+            logger.warning(f"Fixity mismatch ({', '.join(file_record['fixity_mismatch'])}) for {file_record['s3_file_path']}")
+        return file_record
+
+    def verify_all(self, file_records):
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fixity-verify") as executor:
+            return list(executor.map(with_context(self.verify), file_records))
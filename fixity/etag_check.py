@@ -0,0 +1,108 @@
+import hashlib, logging, math
+
+logger = logging.getLogger()
+
+MiB = 1024 ** 2
+# part sizes used by the AWS CLI/SDKs and common upload tools, most likely first
+COMMON_PART_SIZES = [8 * MiB, 16 * MiB, 5 * MiB, 64 * MiB, 100 * MiB, 10 * MiB, 15 * MiB, 25 * MiB, 50 * MiB, 128 * MiB, 256 * MiB, 512 * MiB]
+
+
+def split_etag(etag):
+    # '"<md5>-<parts>"' -> ("<md5>", parts); a single-part ETag has no part count
+    etag = (etag or "").strip().strip('"')
+    digest, _, parts = etag.partition("-")
+    return digest.lower(), int(parts) if parts.isdigit() else None
+
+
+def multipart_etag(part_digests):
+    # the ETag S3 gives a multipart upload: MD5 of the parts' binary MD5s, and the part count
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def guess_part_size(size, parts):
+    for part_size in COMMON_PART_SIZES:
+        if math.ceil(size / part_size) == parts:
+            return part_size
+    # evenly split, rounded up to a whole MiB, as some tools do
+    part_size = math.ceil(math.ceil(size / parts) / MiB) * MiB
+    return part_size if math.ceil(size / part_size) == parts else None
+
+
+# GetObjectAttributes per-part checksums a content verification can compare, by attribute name
+PART_CHECKSUMS = {"ChecksumSHA1": "sha1", "ChecksumCRC32": "crc32"}
+
+
+class EtagChecker:
+    """
+    Checks a fixity record's manifest MD5 against its S3 ETag without downloading the object.
+
+    A single-part ETag is the object's MD5 and is compared directly. A multipart ETag
+    ("<md5>-<parts>") is an MD5 of the parts' MD5s, which can't be compared with a whole-file
+    MD5; S3's own SHA1 checksums of multipart uploads are composite too. Such an object is
+    recorded as multipart_unverified, with md5_matches_etag None rather than a mismatch.
+    With `verify`, when the content will be read back anyway, its part size is also worked
+    out (from GetObjectAttributes, part 1's length, or the part count and object size) so the
+    read can rebuild the ETag, and the per-part SHA1 or CRC32 checksums GetObjectAttributes
+    returns are kept in part_checksums for the read to compare. Without it no S3 calls are made.
+    Sets md5_matches_etag, etag_check, and etag_part_count/etag_part_size for multipart objects.
+    """
+
+    def __init__(self, s3_client, verify=False):
+        self.s3_client = s3_client
+        self.verify = verify
+
+    def check(self, file_record):
+        metadata = file_record.get("s3_file_metadata") or {}
+        digest, parts = split_etag(metadata.get("etag"))
+        md5 = str(file_record.get("md5", "")).strip().lower()
+        if not digest:
+            file_record["md5_matches_etag"] = False
+            file_record["etag_check"] = "no_etag"
+        elif parts is None:
+            file_record["md5_matches_etag"] = md5 == digest
+            file_record["etag_check"] = "match" if md5 == digest else "mismatch"
+        else:
+            file_record["md5_matches_etag"] = None
+            file_record["etag_check"] = "multipart_unverified"
+            file_record["etag_part_count"] = parts
+            if self.verify:
+                part_size, part_checksums = self.part_layout(file_record["s3_bucket"], file_record["s3_file_path"], metadata, parts)
+                file_record["etag_part_size"] = part_size
+                if part_checksums:
+                    file_record["part_checksums"] = part_checksums
+        return file_record
+
+    def part_layout(self, bucket, key, metadata, parts):
+        # -> (part size or None, {"algorithm": ..., "values": [base64 checksum per part]} or None)
+        size = metadata.get("content-length")
+        try:
+            object_parts = []
+            request = {"Bucket": bucket, "Key": key, "ObjectAttributes": ["ObjectParts", "ObjectSize"], "MaxParts": 1000}
+            while True:
+                attributes = self.s3_client.get_object_attributes(**request)
+                size = attributes.get("ObjectSize") or size
+                page = attributes.get("ObjectParts") or {}
+                object_parts.extend(page.get("Parts") or [])
+                if not page.get("IsTruncated"):
+                    break
+                request["PartNumberMarker"] = page["NextPartNumberMarker"]
+            if object_parts and object_parts[0].get("PartNumber") == 1 and object_parts[0].get("Size"):
+                return object_parts[0]["Size"], self.part_checksums(object_parts, parts)
+        except Exception as e:
+            logger.info(f"GetObjectAttributes unavailable for {key}: {e}")
+        return self.part_size(bucket, key, size, parts), None
+
+    def part_checksums(self, object_parts, parts):
+        if len(object_parts) != parts:
+            return None
+        for name, algorithm in PART_CHECKSUMS.items():
+            if all(part.get(name) for part in object_parts):
+                return {"algorithm": algorithm, "values": [part[name] for part in object_parts]}
+        return None
+
+    def part_size(self, bucket, key, size, parts):
+        try:
+            return self.s3_client.head_object(Bucket=bucket, Key=key, PartNumber=1)["ContentLength"]
+        except Exception as e:
+            logger.info(f"Couldn't read the size of part 1 of {key}: {e}")
+        return guess_part_size(int(size), parts) if size else None
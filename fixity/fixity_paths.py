@@ -0,0 +1,75 @@
+import logging
+from boto3.dynamodb.conditions import Attr
+from utils.dynamo_tools import TableAccess, query_index_concurrently
+
+logger = logging.getLogger()
+
+
+class FixityPaths:
+    """
+    The s3_file_path values already recorded in the fixity table for one collection,
+    so that each existence check is a set lookup.
+
+    If the table has a GSI keyed on s3_file_path, the paths a manifest refers to are
+    looked up on it concurrently. Otherwise every record under the collection prefix
+    is read with one paginated scan, the first time a check is needed.
+    """
+
+    def __init__(self, fixity_table, collection_prefix, max_workers=8):
+        self.table = fixity_table
+        self.collection_prefix = collection_prefix
+        self.max_workers = max_workers
+        self.paths = set()
+        self.checked = set()
+        self.scanned = False
+        index_name, key_attr = TableAccess(fixity_table).index_for("s3_file_path")
+        self.index_name = index_name if key_attr == "s3_file_path" else None
+
+    def prefetch(self, keys):
+        if self.index_name is None:
+            self.scan()
+            return
+        keys = [key for key in dict.fromkeys(keys) if key and key not in self.checked]
+        if not keys:
+            return
+        found = query_index_concurrently(
+            self.table.meta.client,
+            self.table.name,
+            "s3_file_path",
+            keys,
+            index_name=self.index_name,
+            max_workers=self.max_workers,
+        )
+        # keys whose query failed stay unchecked and are tried again next time
+        self.checked.update(found)
+        self.paths.update(key for key, item in found.items() if item)
+
+    def scan(self):
+        if self.scanned:
+            return
+        scan_kwargs = {
+            "FilterExpression": Attr("s3_file_path").begins_with(self.collection_prefix),
+            "ProjectionExpression": "s3_file_path",
+        }
+        try:
+            while True:
+                response = self.table.scan(**scan_kwargs)
+                self.paths.update(item["s3_file_path"] for item in response["Items"] if "s3_file_path" in item)
+                if "LastEvaluatedKey" not in response:
+                    break
+                scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+            logger.info(f"Loaded {len(self.paths)} fixity record path(s) under {self.collection_prefix}")
+        except Exception as e:
+            logger.error(f"An error occurred scanning {self.table.name} for {self.collection_prefix}: {str(e)}")
+        # not retried on every check; a failed scan leaves the paths it did read
+        self.scanned = True
+
+    def __contains__(self, key):
+        if key not in self.paths and key not in self.checked and not self.scanned:
+            self.prefetch([key])
+        return key in self.paths
+
+    def add(self, key):
+        # a record written during this run
+        self.paths.add(key)
+        self.checked.add(key)
@@ -0,0 +1,123 @@
+import json, logging, os, tempfile, threading, uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from utils.ingest_jobs import DEFAULT_RETENTION_DAYS, cleanup_jobs
+from utils.thread_context import with_context
+
+logger = logging.getLogger()
+
+FIXITY_MODES = ("background", "lambda", "sync")
+DEFAULT_STATUS_DIR = os.getenv("FIXITY_STATUS_DIR") or os.path.join(tempfile.gettempdir(), "dlp-ingest", "fixity_jobs")
+
+# one fixity run at a time per process; later runs wait in the queue
+fixity_executor = None
+executor_lock = threading.Lock()
+
+
+def fixity_mode(env):
+    mode = str(env.get("FIXITY_MODE") or "").lower()
+    if mode in FIXITY_MODES:
+        return mode
+    if env.get("FIXITY_FUNCTION"):
+        return "lambda"
+    # a Lambda is frozen once it returns, so a local worker thread wouldn't finish there
+    return "sync" if env.get("IS_LAMBDA") else "background"
+
+
+def fixity_status(job_id, status_dir=DEFAULT_STATUS_DIR):
+    try:
+        with open(os.path.join(status_dir, f"{os.path.basename(job_id)}.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def cleanup_fixity_jobs(status_dir=DEFAULT_STATUS_DIR):
+    retention_days = os.getenv("INGEST_JOB_RETENTION_DAYS") or DEFAULT_RETENTION_DAYS
+    cleanup_jobs(status_dir, retention_days, kind="fixity job")
+
+
+def get_fixity_executor():
+    global fixity_executor
+    with executor_lock:
+        if fixity_executor is None:
+            fixity_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fixity-stage")
+        return fixity_executor
+
+
+class FixityStage:
+    """
+    Runs the checksum handler as a stage of its own after media and metadata ingest.
+
+    "background" queues the run on a local worker thread and returns at once, "lambda"
+    invokes FIXITY_FUNCTION asynchronously with the same event, and "sync" runs it in
+    line. Each run gets an id and a status file (queued, running, succeeded, failed, or
+    invoked) holding the handler's counts and results path, readable with fixity_status.
+    Status files older than INGEST_JOB_RETENTION_DAYS are removed as runs are submitted.
+    """
+
+    def __init__(self, env, status_dir=DEFAULT_STATUS_DIR):
+        self.env = env
+        self.mode = fixity_mode(env)
+        self.status_dir = status_dir
+
+    def submit(self, checksum_options):
+        cleanup_fixity_jobs(self.status_dir)
+        job_id = f"{checksum_options.get('COLLECTION_IDENTIFIER')}-{uuid.uuid4().hex[:12]}"
+        self.write_status(job_id, {"job_id": job_id, "mode": self.mode, "state": "queued", "queued_at": now()})
+        if self.mode == "lambda":
+            self.invoke(job_id, checksum_options)
+        elif self.mode == "background":
+            # run with the caller's context, so its logs go to the ingest job that started it
+            get_fixity_executor().submit(with_context(self.run), job_id, checksum_options)
+        else:
+            self.run(job_id, checksum_options)
+        return job_id
+
+    def run(self, job_id, checksum_options):
+        # imported here so that a Lambda-invoked stage doesn't need local AWS clients
+        from fixity.checksum_handler import checksum_handler
+
+        self.update_status(job_id, state="running", started_at=now())
+        try:
+            response = checksum_handler(checksum_options, None)
+            self.update_status(job_id, state="succeeded", finished_at=now(), result=json.loads(response["body"]))
+        except Exception as e:
+            logger.error(f"Fixity job {job_id} failed: {e}")
+            self.update_status(job_id, state="failed", finished_at=now(), error=str(e))
+
+    def invoke(self, job_id, checksum_options):
+        import boto3
+
+        try:
+            region = self.env.get("REGION")
+            lambda_client = boto3.client("lambda", region_name=region) if region else boto3.client("lambda")
+            response = lambda_client.invoke(
+                FunctionName=self.env["FIXITY_FUNCTION"],
+                InvocationType="Event",
+                Payload=json.dumps(dict(checksum_options, FIXITY_JOB_ID=job_id)).encode("utf-8"),
+            )
+            # the invoked function's own results land under the collection's ingest_results
+            self.update_status(job_id, state="invoked", invoked_at=now(), status_code=response.get("StatusCode"))
+        except Exception as e:
+            logger.error(f"Error invoking {self.env.get('FIXITY_FUNCTION')} for fixity job {job_id}: {e}")
+            self.update_status(job_id, state="failed", finished_at=now(), error=str(e))
+
+    def update_status(self, job_id, **changes):
+        status = fixity_status(job_id, self.status_dir) or {"job_id": job_id, "mode": self.mode}
+        status.update(changes)
+        self.write_status(job_id, status)
+
+    def write_status(self, job_id, status):
+        try:
+            os.makedirs(self.status_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.status_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(status, f)
+            os.replace(tmp_path, os.path.join(self.status_dir, f"{job_id}.json"))
+        except Exception as e:
+            logger.error(f"Error writing status of fixity job {job_id}: {e}")
+
+
+def now():
+    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
@@ -0,0 +1,85 @@
+import hashlib, json, logging, os, tempfile, threading
+from datetime import datetime
+
+logger = logging.getLogger()
+
+DEFAULT_LEDGER_PATH = os.path.join(tempfile.gettempdir(), "dlp-ingest", "fixity_ledger.json")
+ledger_lock = threading.Lock()
+
+
+def row_fingerprint(values):
+    # identifies a manifest row by its content, so an edited manifest's unchanged rows are recognised
+    return hashlib.sha1("\x1f".join(str(value) for value in values).encode("utf-8")).hexdigest()
+
+
+class ManifestLedger:
+    """
+    Local record of the checksum manifests the fixity handler has processed.
+
+    Each manifest is stored by fixity table, bucket and key with its ETag, its row counts
+    and the fingerprints of its rows that are settled (ingested, or already in `table`),
+    so a run against another fixity table starts afresh. A manifest whose ETag hasn't
+    changed and has no unsettled rows is skipped without being read; otherwise only rows
+    that aren't settled are processed.
+
+    Writes replace the file atomically and merge with entries other runs wrote. The
+    read-merge-write is only serialised between threads of one process: two processes
+    (gunicorn workers, say) saving at the same moment can drop one's entry, which then
+    only costs that manifest being read again next time.
+    """
+
+    def __init__(self, path=DEFAULT_LEDGER_PATH, table=None):
+        self.path = path
+        self.table = table
+        self.entries = self.read()
+
+    def ledger_key(self, bucket, key):
+        return f"{self.table}:{bucket}/{key}"
+
+    def read(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error reading fixity ledger {self.path}, starting a new one: {e}")
+            return {}
+
+    def entry(self, bucket, key):
+        return self.entries.get(self.ledger_key(bucket, key))
+
+    def unchanged(self, bucket, key, etag):
+        entry = self.entry(bucket, key)
+        return bool(entry and etag and entry["etag"] == etag and len(entry["settled"]) >= entry["rows"])
+
+    def settled(self, bucket, key):
+        entry = self.entry(bucket, key)
+        return set(entry["settled"]) if entry else set()
+
+    def record(self, bucket, key, etag, rows, settled, listed):
+        # rows: distinct row fingerprints; listed: rows in the file, duplicates included
+        self.entries[self.ledger_key(bucket, key)] = {
+            "etag": etag,
+            "rows": rows,
+            "listed": listed,
+            "settled": sorted(settled),
+            "processed_at": datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.save(self.ledger_key(bucket, key))
+
+    def save(self, ledger_key):
+        if not self.path:
+            return
+        with ledger_lock:
+            try:
+                entries = self.read()
+                entries[ledger_key] = self.entries[ledger_key]
+                directory = os.path.dirname(self.path) or "."
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w") as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.error(f"Error writing fixity ledger {self.path}: {e}")
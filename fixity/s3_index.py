@@ -0,0 +1,45 @@
+import logging, os
+from utils.s3_tools import S3Inventory
+
+logger = logging.getLogger()
+
+RESULTS_DIR = "/ingest_results/"
+
+
+def build_object_index(s3_client, s3_bucket, collection_path):
+    # one paginated listing of the whole collection per run
+    listing = S3Inventory(s3_client).list_prefix(s3_bucket, os.path.join(collection_path, ""))
+    return ObjectIndex(listing, os.path.join(collection_path, ""))
+
+
+class ObjectIndex:
+    """
+    The objects under a collection prefix, from a single listing, indexed by file name.
+    Each object keeps the Size, ETag and LastModified from the listing.
+    """
+
+    def __init__(self, listing, prefix):
+        self.prefix = prefix
+        self.objects = listing["objects"]
+        self.keys = [key for key in listing["keys"] if RESULTS_DIR not in key]
+        self.by_name = {}
+        for key in self.keys:
+            self.by_name.setdefault(os.path.basename(key), []).append(key)
+
+    def match(self, prefix="", suffix=""):
+        return [key for key in self.keys if key.startswith(prefix) and key.endswith(suffix)]
+
+    def find(self, file_name, file_path=None):
+        """
+        The key for a checksum manifest row. When several objects share the file name,
+        the one whose path relative to the collection ends the row's original FilePath
+        wins; otherwise the first in listing order, as a prefix search would return.
+        """
+        file_name = str(file_name)
+        candidates = [key for key in self.by_name.get(os.path.basename(file_name), []) if key.endswith(file_name)]
+        if len(candidates) > 1 and file_path:
+            original = "/" + str(file_path).replace("\\", "/").lstrip("/")
+            for key in candidates:
+                if original.endswith("/" + key[len(self.prefix):]):
+                    return key
+        return candidates[0] if candidates else None
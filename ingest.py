@@ -1,11 +1,12 @@
 import logging, os, sys, urllib.parse
 from ingest_classes.media_types_map import media_types_map
+from utils.s3_tools import S3Inventory
 
 logger = logging.getLogger()
 
 # Environment variables
 env = {}
-def set_environment(app_config=None):
+def set_environment(app_config=None, env=env):
     env["SCRIPT_ROOT"] = os.path.abspath(os.path.dirname(__file__))
 
     # try to load environment variables from app_config (passed when run via GUI, not CLI)
@@ -29,6 +30,17 @@ def set_environment(app_config=None):
         env["LONG_URL_PATH"] = os.getenv("LONG_URL_PATH")
         env["SHORT_URL_PATH"] = os.getenv("SHORT_URL_PATH")
         env["MEDIA_TYPE"] = os.getenv("MEDIA_TYPE")
+        env["COPY_WORKERS"] = os.getenv("COPY_WORKERS")
+        env["COPY_RETRIES"] = os.getenv("COPY_RETRIES")
+        env["CSV_CHUNK_SIZE"] = os.getenv("CSV_CHUNK_SIZE")
+        env["CSV_ENGINE"] = os.getenv("CSV_ENGINE")
+        env["PREFETCH_WORKERS"] = os.getenv("PREFETCH_WORKERS")
+        env["MANIFEST_CACHE_DIR"] = os.getenv("MANIFEST_CACHE_DIR")
+        env["MANIFEST_WORKERS"] = os.getenv("MANIFEST_WORKERS")
+        env["VERIFY_WORKERS"] = os.getenv("VERIFY_WORKERS")
+        env["VERIFY_MAX_MBPS"] = os.getenv("VERIFY_MAX_MBPS")
+        env["FIXITY_MODE"] = os.getenv("FIXITY_MODE")
+        env["FIXITY_FUNCTION"] = os.getenv("FIXITY_FUNCTION")
 
         # Booleans
         env["DRY_RUN"] = (
@@ -59,6 +71,12 @@ def set_environment(app_config=None):
         env["UPDATE_METADATA"] = (
             os.getenv("UPDATE_METADATA") is not None and os.getenv("UPDATE_METADATA").lower() == "true"
         )
+        env["SYNC_MEDIA"] = (
+            os.getenv("SYNC_MEDIA") is not None and os.getenv("SYNC_MEDIA").lower() == "true"
+        )
+        env["VERIFY_CONTENT"] = (
+            os.getenv("VERIFY_CONTENT") is not None and os.getenv("VERIFY_CONTENT").lower() == "true"
+        )
 
 
 def new_media_type_handler(env, filename, bucket):
@@ -66,9 +84,22 @@ def new_media_type_handler(env, filename, bucket):
     return media_type["handler"](env, filename, bucket, media_type["assets"])
 
 
-def main(event, context, csv_file=None, app_config=None):
+def main(event, context, csv_file=None, app_config=None, progress=None):
     logger.info("Starting ingest process at src.ingest.main()")
-    set_environment(app_config)
+    # each run gets its own env, so runs in concurrent ingest jobs don't share state
+    env = {}
+    set_environment(app_config, env)
+    # S3 listings are indexed once per run, then shared by media and metadata ingest
+    env["s3_inventory"] = S3Inventory()
+    # DynamoDB table schemas are likewise described once per run
+    env["table_access"] = {}
+    env["collection_cache"] = {}
+    env["noid_allocator"] = None
+    env["manifest_resolver"] = None
+    # problems that need someone's attention after the run, reported in errors.csv
+    env["errors"] = []
+    # a JobProgress when run as a background ingest job
+    env["progress"] = progress
     filename = None
     if event:
         bucket = event["Records"][0]["s3"]["bucket"]["name"]
@@ -1,6 +1,6 @@
-import boto3, datetime, io, json, logging, os, pathlib
-from botocore.response import StreamingBody
-from utils.s3_tools import get_matching_s3_keys
+import boto3, datetime, functools, json, logging, os, pathlib
+from utils.csv_tools import close_body, metadata_body
+from utils.s3_tools import S3CopyEngine, SYNC_TRANSFER_CONFIG, get_s3_inventory, same_object
 from ingest_classes.metadata.generic_metadata import GenericMetadata
 
 
@@ -14,6 +14,8 @@ class GenericDigitalObject:
         self.s3_client = s3_client or boto3.client("s3")
         self.s3_resource = s3_resource or boto3.resource("s3")
         self.lambda_client = boto3.client("lambda")
+        self.inventory = get_s3_inventory(self.env)
+        self.copy_engine = None
         self.logger = logging.getLogger()
 
 
@@ -23,21 +25,57 @@ class GenericDigitalObject:
         )
         metadata = self.local_metadata()
         source_bucket, dest_bucket = self.get_buckets()
-        df = metadataHandler.csv_to_dataframe(io.BytesIO(metadata["Body"].read()))
 
         source_dir = os.path.join(
             self.env["COLLECTION_CATEGORY"], self.env["COLLECTION_IDENTIFIER"]
         )
-        # collection assets
-        results = self.import_collection_objects(source_bucket, source_dir, dest_bucket)
+        self.copy_engine = self.new_copy_engine()
+        try:
+            # collection assets
+            self.import_collection_objects(source_bucket, source_dir, dest_bucket)
+
+            # item assets, a chunk of the metadata csv at a time
+            for df in metadataHandler.metadata_chunks(metadata["Body"], stage="media"):
+                self.import_item_objects(df, source_bucket, dest_bucket)
+        finally:
+            close_body(metadata)
+            results = self.copy_engine.report()
+            self.copy_engine.shutdown()
+            self.copy_engine = None
+        self.log_copy_report(results)
+        return results
+
+
+    def new_copy_engine(self):
+        return S3CopyEngine(
+            s3_client=self.s3_client,
+            max_workers=self.env.get("COPY_WORKERS") or 8,
+            retries=self.env.get("COPY_RETRIES") or 3,
+            dry_run=self.env["DRY_RUN"],
+            inventory=self.inventory,
+            verbose=self.env["VERBOSE"],
+            transfer_config=SYNC_TRANSFER_CONFIG if self.env.get("SYNC_MEDIA") else None,
+        )
 
-        # item assets
-        results = self.import_item_objects(df, source_bucket, dest_bucket)
+
+    def log_copy_report(self, report):
+        summary = report["summary"]
+        self.logger.info(
+            f"Media copy complete: copied={summary.get('copied', 0)}, skipped={summary.get('skipped', 0)}, "
+            f"overwritten={summary.get('overwritten', 0)}, simulated={summary.get('simulated', 0)}, "
+            f"failed={summary.get('failed', 0)}"
+        )
+        for result in report["results"]:
+            if result["status"] == "failed":
+                self.logger.error(f"Copy failed: {result['source_key']} -> {result['dest_key']}: {result['error']}")
+            elif self.env["VERBOSE"] and result["status"] in ("skipped", "overwritten"):
+                self.logger.info(f"{result['status'].capitalize()}: {result['dest_key']}")
 
 
 
     def import_collection_objects(self, source_bucket, source_dir, dest_bucket):
         self.logger.info(f"Beginning collection asset copy")
+        collection_root = os.path.join(source_dir, "")
         for asset in self.assets["collection"]:
             formatted_asset = None
             local_asset = self.assets["collection"][asset] # this is the filename idiot
@@ -47,7 +85,7 @@ class GenericDigitalObject:
             success = False
             matches = None
             try:
-                matches = get_matching_s3_keys(source_bucket.name, source_dir, formatted_asset)
+                matches = self.inventory.match(source_bucket.name, source_dir, formatted_asset, root=collection_root)
             except Exception as e:
                 self.logger.error(e)
 
@@ -57,22 +95,15 @@ class GenericDigitalObject:
             
             if not success:
                 # case insensitive search
-                matches = None
                 matching_key = None
                 asset_path = os.path.join(source_dir, formatted_asset)
-                asset_path_no_filename = asset_path.replace(
-                    asset_path.split("/")[-1], ""
-                )
                 try:
-                    matches = get_matching_s3_keys(source_bucket.name, asset_path_no_filename)
+                    matching_key = self.inventory.find(source_bucket.name, asset_path, root=collection_root)
                 except Exception as e:
                     self.logger.error(e)
-                if matches:
-                    for key in matches:
-                        if key.lower() == asset_path.lower():
-                            matching_key = key
-                            success = self.format_and_copy(source_bucket, source_dir, matching_key, dest_bucket)
-                if matching_key is None:
+                if matching_key:
+                    success = self.format_and_copy(source_bucket, source_dir, matching_key, dest_bucket)
+                else:
                     self.logger.info("No match found.")
 
 
@@ -80,9 +111,14 @@ class GenericDigitalObject:
     def import_item_objects(self, df, source_bucket, dest_bucket):
         # item assets
         self.logger.info(f"Beginning item asset copy")
+        collection_root = self.collection_root()
         for idx, row in df.iterrows():
             source_dir, dest_dir = self.get_bucket_paths(row)
             self.logger.info(f"identifier: {row['identifier']}, source_dir: {source_dir}, dest_dir: {dest_dir}")
+            # thumbnails are requested once the copy has actually finished
+            on_success = None
+            if self.env["GENERATE_THUMBNAILS"]:
+                on_success = functools.partial(self.generate_thumbnail, dest_dir=dest_dir)
             for asset in self.assets["item"]:
                 success = False
                 # if we're supposed to generate thumbnails then just skip the copy here
@@ -98,37 +134,27 @@ class GenericDigitalObject:
 
                 # exact, case sensitive search
                 try:
-                    matches = get_matching_s3_keys(source_bucket.name, source_dir, formatted_asset)
+                    matches = self.inventory.match(source_bucket.name, source_dir, formatted_asset, root=collection_root)
                 except Exception as e:
                     self.logger.error(e)
 
                 if matches:
                     for key in matches:
                         matching_key = key
-                        success = self.format_and_copy(source_bucket, source_dir, key, dest_bucket, dest_dir)
-                        
-                        if success and self.env["GENERATE_THUMBNAILS"]:
-                            self.generate_thumbnail(matching_key, dest_dir)
+                        success = self.format_and_copy(source_bucket, source_dir, key, dest_bucket, dest_dir, on_success)
                 else:
                     # case insensitive search
-                    asset_path = os.path.join(source_dir, "")
-                    matching_key = None
-                    matches = None
+                    asset_path = os.path.join(source_dir, os.path.basename(formatted_asset))
                     try:
-                        matches = get_matching_s3_keys(source_bucket.name, source_dir)
+                        matching_key = self.inventory.find(source_bucket.name, asset_path, root=collection_root)
                     except Exception as e:
                         self.logger.error(e)
 
-                    if matches:
-                        for key in matches:
-                            if key.lower() == asset_path.lower() and not key.endswith("/"):
-                                matching_key = key
-                                success = self.format_and_copy(source_bucket,source_dir,matching_key,dest_bucket)
-                                if success and self.env["GENERATE_THUMBNAILS"]:
-                                    self.generate_thumbnail(matching_key, dest_dir)
-                                
-                                if not success:
-                                    self.logger.error(f"No match found for identifier {row['identifier']}")
+                    if matching_key:
+                        success = self.format_and_copy(source_bucket, source_dir, matching_key, dest_bucket, dest_dir, on_success)
+
+                    if not success:
+                        self.logger.error(f"No match found for identifier {row['identifier']}")
 
                 
     def generate_thumbnail(self, matching_key, dest_dir):
@@ -166,36 +192,37 @@ class GenericDigitalObject:
 
 
     def format_and_copy(
-        self, source_bucket, source_dir, key, dest_bucket, dest_dir=None
+        self, source_bucket, source_dir, key, dest_bucket, dest_dir=None, on_success=None
     ):
         filename = key.split("/")[-1]
         dest_key = os.path.join((dest_dir or source_dir), filename).replace(" ", "_")
-        return self.s3_copy(source_bucket, key, dest_bucket, dest_key)
+        return self.s3_copy(source_bucket, key, dest_bucket, dest_key, on_success)
 
 
-    def s3_copy(self, source_bucket, source_key, dest_bucket, dest_key):
-        if self.env["VERBOSE"]:
-            self.logger.info(f"Copying: {source_bucket.name}:{source_key}, To: {dest_bucket.name}:{dest_key}")
-        if not dest_key.endswith("/"):
-            if self.env["DRY_RUN"]:
-                self.logger.info(f"DRYRUN: s3 copy: simulated")
-                return True
-            else:
-                try:
-                    dest_bucket.copy(
-                        {
-                            "Bucket": source_bucket.name,
-                            "Key": source_key,
-                        },
-                        dest_key,
-                    )
-                    return True
-                except Exception as e:
-                    self.logger.error(e)
-                    return False
-            
-        else:
+    def s3_copy(self, source_bucket, source_key, dest_bucket, dest_key, on_success=None):
+        # Queues the copy on the copy engine when one is running; returns True once the job is accepted.
+        # Outside of import_digital_objects() the copy runs in line.
+        if dest_key.endswith("/"):
             return False
+        engine = self.copy_engine or self.new_copy_engine()
+        source_meta = self.inventory.head(source_bucket.name, source_key, root=self.collection_root())
+        overwrite = False
+        if self.env.get("SYNC_MEDIA"):
+            # incremental sync: compare listing metadata and leave identical objects alone
+            dest_meta = self.inventory.head(dest_bucket.name, dest_key, root=self.collection_root())
+            if same_object(source_meta, dest_meta):
+                engine.skip(source_bucket.name, source_key, dest_bucket.name, dest_key)
+                return True
+            overwrite = dest_meta is not None
+        engine.submit(source_bucket.name, source_key, dest_bucket.name, dest_key, on_success, source_meta, overwrite)
+        if engine is self.copy_engine:
+            return True
+        report = engine.report()
+        engine.shutdown()
+        return report["results"][0]["status"] != "failed"
+
+    def collection_root(self):
+        return os.path.join(self.env["COLLECTION_CATEGORY"], self.env["COLLECTION_IDENTIFIER"], "")
 
     def get_buckets(self):
         return self.s3_resource.Bucket(self.env["AWS_SRC_BUCKET"]), self.s3_resource.Bucket(self.env["AWS_DEST_BUCKET"])
@@ -214,6 +241,5 @@ class GenericDigitalObject:
         return src_dir, dest_dir
 
     def local_metadata(self):
-        body_encoded = open(self.filename).read().encode()
-        stream = StreamingBody(io.BytesIO(body_encoded), len(body_encoded))
-        return {"Body": stream}
+        # from the event's bucket when the run was triggered by an S3 upload
+        return metadata_body(self.filename, self.bucket, self.s3_client)
@@ -1,5 +1,5 @@
 import logging
-from fixity.checksum_handler import checksum_handler
+from fixity.fixity_stage import FixityStage
 
 class GenericType:
     def __init__(
@@ -30,13 +30,20 @@ class GenericType:
             "COLLECTION_IDENTIFIER": self.env["COLLECTION_IDENTIFIER"],
             "FIXITY_TABLE_NAME": self.env["DYNAMODB_FILE_CHAR_TABLE"],
             "S3_BUCKET_NAME": self.env["AWS_SRC_BUCKET"],
-            "S3_PREFIX": self.env["COLLECTION_CATEGORY"]
+            "S3_PREFIX": self.env["COLLECTION_CATEGORY"],
+            "VERIFY_CONTENT": self.env.get("VERIFY_CONTENT"),
+            "VERIFY_WORKERS": self.env.get("VERIFY_WORKERS"),
+            "VERIFY_MAX_MBPS": self.env.get("VERIFY_MAX_MBPS"),
         }
         self.logger.info("checksum_options: {}".format(checksum_options))
-        checksum_handler(checksum_options, None)
+        # fixity runs as its own stage, so ingest doesn't wait for it
+        fixity_stage = FixityStage(self.env)
+        fixity_job = fixity_stage.submit(checksum_options)
+        self.logger.info(f"Fixity job {fixity_job} ({fixity_stage.mode}) submitted")
 
         self.logger.info("Ingest process completed")
         self.logger.info("====================================================")
+        return {"fixity_job": fixity_job, "errors": self.env.get("errors", [])}
 
     def import_digital_objects(self):
         return self.media_handler.import_digital_objects()
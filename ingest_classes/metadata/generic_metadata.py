@@ -1,11 +1,14 @@
-import sys
-import time
-import boto3, http, io, json, logging, os, uuid, urllib.request
-import pandas as pd
+import boto3, json, logging, os, uuid
 from datetime import datetime, timezone
-from dateutil.parser import parse
-from boto3.dynamodb.conditions import Key, Attr
-from botocore.response import StreamingBody
+from boto3.dynamodb.conditions import Attr
+from utils.csv_tools import close_body, metadata_body, read_csv_chunks
+from utils.dynamo_tools import MAX_BATCH_WRITE, batch_put_items, get_table_access, put_item, query_index_concurrently
+from utils.column_plan import ColumnPlan, load_headers_keys
+from utils.date_tools import index_date, parse_date, valid_dates
+from utils.collection_tree import build_collection_map, children_by_parent, map_location
+from utils.manifest_resolver import get_manifest_resolver
+from utils.noid_allocator import get_noid_allocator
+from utils.s3_tools import get_s3_inventory
 import re
 
 
@@ -20,6 +23,13 @@ class GenericMetadata:
         self.single_value_headers = None
         self.multi_value_headers = None
         self.results = []
+        # new Archive records (and their NOID records) are buffered and written in batches
+        self.pending_archives = []
+        self.archive_write_results = {}
+        # identifier -> existing Archive record (None if not in the table), filled by prefetch_archives()
+        self.archive_cache = {}
+        # top-level collection id -> collections created under it this batch, or None if its map needs a full rebuild
+        self.pending_map_updates = {}
         self.logger = logging.getLogger()
 
         try:
@@ -46,10 +56,7 @@ class GenericMetadata:
 
         try:
             headers_file = os.path.join(self.env["APP_SRC_DIR"],"data","headers_keys.json")
-            with open(headers_file) as f:
-                headers_keys = json.load(f)
-                self.single_value_headers = headers_keys["single_value_headers"]
-                self.multi_value_headers = headers_keys["multi_value_headers"]
+            self.single_value_headers, self.multi_value_headers = load_headers_keys(headers_file)
         except Exception as e:
             self.logger.error(f"An error occurred reading headers_keys.json: {str(e)}")
             raise e
@@ -68,21 +75,30 @@ class GenericMetadata:
             self.logger.error("No metadata file was provided for the selected ingest type")
             return {"statusCode": 400, "body": json.dumps("No metadata file provided.")}
 
-        metadata_stream = self.get_metadata(metadata_filename)
+        # a configured metadata file is local; the file that triggered the run is in self.bucket
+        bucket = self.bucket if metadata_filename == self.filename else None
+        metadata_stream = self.get_metadata(metadata_filename, bucket)
 
-        if ingest_type == "collection":
-            self.batch_import_collections(metadata_stream)
-        elif ingest_type == "archive":
-            self.batch_import_archives(metadata_stream)
+        try:
+            if ingest_type == "collection":
+                self.batch_import_collections(metadata_stream)
+                self.flush_collection_map_updates()
+            elif ingest_type == "archive":
+                self.batch_import_archives(metadata_stream)
+                self.flush_archives()
+                self.log_archive_write_results()
+        finally:
+            close_body(metadata_stream)
+            # give back NOIDs reserved for this run but never used
+            get_noid_allocator(self.env).close()
+        self.log_table_calls()
         return {"statusCode": 200, "body": json.dumps("Finish metadata import.")}
 
 
     def batch_import_collections(self, response):
         self.logger.info("Parsing collection metadata")
         # process the metadata csv row by row
-        df = self.csv_to_dataframe(io.BytesIO(response["Body"].read()))
-        for idx, row in df.iterrows():
-            collection_dict = self.process_metadata_and_env(row, "Collection")
+        for idx, collection_dict in self.metadata_records(response, "Collection"):
             if not collection_dict:
                 self.logger.error(f"Error: Collection {idx+1} has failed to be imported.")
                 return False
@@ -119,11 +135,13 @@ class GenericMetadata:
             if "archived" not in collection_dict:
                 collection_dict["archived"] = True
 
-            existing_collection = self.query_by_index(self.env["collection_table"], "Identifier", collection_dict["identifier"])
+            existing_collection = self.find_collection("Identifier", collection_dict["identifier"])
+            created = False
             if existing_collection:
                 if self.env["UPDATE_METADATA"]:
                     self.logger.info(f"Collection with identifier {collection_dict['identifier']} already exists. Updating existing record.")
                     self.update_item_in_table(self.env["collection_table"], existing_collection["id"], collection_dict, collection_dict["identifier"])
+                    self.refresh_collection(existing_collection)
                 else:
                     self.logger.warning(f"Collection with identifier {collection_dict['identifier']} already exists. Select the UPDATE_METADATA option to update existing records.")
                     self.logger.warning("Skipping this record...")
@@ -131,19 +149,19 @@ class GenericMetadata:
             else:
                 self.logger.info(f"Creating Collection with identifier {collection_dict['identifier']}.")
                 self.create_item_in_table(self.env["collection_table"], collection_dict, "Collection")
+                created = True
                 
 
-            # after this collection has been created, it needs to be added to the appropriate collectionmap
+            # after this collection has been created, it needs to be added to the appropriate collectionmap.
+            # maps are updated once per top-level collection, after the whole batch.
             if "heirarchy_path" in collection_dict:
-                self.update_collection_map(collection_dict["heirarchy_path"][0])
+                self.queue_collection_map_update(collection_dict, created)
 
 
 
     def batch_import_archives(self, response):
         self.logger.info("Parsing archive metadata")
-        df = self.csv_to_dataframe(io.BytesIO(response["Body"].read()))
-        for idx, row in df.iterrows():
-            archive_dict = self.process_metadata_and_env(row, "Archive")
+        for idx, archive_dict in self.metadata_records(response, "Archive", self.prefetch_chunk):
             if not archive_dict:
                 self.logger.error(f"Error: Archive row {idx+1} could not be parsed.")
                 continue
@@ -166,13 +184,7 @@ class GenericMetadata:
                     archive_dict["parent_collection"] = [collection["id"]]
                     archive_dict["parent_collection_identifier"] = [collection["identifier"]]
                     archive_dict["heirarchy_path"] = collection["heirarchy_path"]
-                    archive_dict["manifest_url"] = os.path.join(
-                        self.env["APP_IMG_ROOT_PATH"],
-                        self.env["COLLECTION_CATEGORY"],
-                        collection["identifier"],
-                        archive_dict["identifier"],
-                        "manifest.json",
-                    )
+                    archive_dict["manifest_url"] = self.manifest_url(collection["identifier"], archive_dict["identifier"])
                     archive_dict["thumbnail_path"] = self.get_thumbnail_path_for_archive(archive_dict, collection)
                     
                     # if you can't find the thumbnail for an iiif item, skip it, because that means the manifest couldn't be found or read
@@ -191,7 +203,7 @@ class GenericMetadata:
                     if "archived" not in archive_dict:
                         archive_dict["archived"] = True
 
-                    existing_archive = self.query_by_index(self.env["archive_table"], "Identifier", archive_dict["identifier"])
+                    existing_archive = self.find_archive(archive_dict["identifier"])
                     if existing_archive:
                         if self.env["UPDATE_METADATA"]:
                             self.logger.info(f"Item with identifier {archive_dict['identifier']} already exists. Updating existing record.")
@@ -206,50 +218,119 @@ class GenericMetadata:
                 
 
     
-    def archive_exists(self, table, identifier):
-        items = self.query_by_index(table, "Identifier", identifier)
-        return items and len(items) >= 1
+    def prefetch_chunk(self, df):
+        self.prefetch_archives(df)
+        self.prefetch_manifests(df)
 
 
-    def get_metadata(self, filename):
-        body_encoded = open(filename).read().encode()
-        stream = StreamingBody(io.BytesIO(body_encoded), len(body_encoded))
-        return {"Body": stream}
-    
+    def prefetch_archives(self, df):
+        # One concurrent bulk lookup for every identifier in the chunk, instead of a query per row
+        identifiers = self.csv_identifiers(df)
+        if not identifiers:
+            return
+        table = self.env["archive_table"]
+        access = get_table_access(self.env, table)
+        index_name, key_attr = access.index_for("Identifier")
+        found = query_index_concurrently(
+            self.dyndb.meta.client,
+            table.name,
+            key_attr,
+            identifiers,
+            index_name=index_name,
+            max_workers=self.env.get("PREFETCH_WORKERS") or 8,
+        )
+        access.calls["query"] += len(identifiers)
+        self.archive_cache.update(found)
+        existing = len([item for item in found.values() if item])
+        self.logger.info(f"Prefetched {len(found)} identifier(s) from {table.name}: {existing} existing record(s)")
+
 
-    def csv_to_dataframe(self, csv_path):
-        df = pd.read_csv(
-            csv_path,
-            na_values="NaN",
-            keep_default_na=False,
-            encoding="utf-8",
-            dtype={"date": str, "end_date": str, "start_date": str, "embargo_start_date": str, "embargo_end_date": str}
+    def prefetch_manifests(self, df):
+        # Fetch the manifests of every row concurrently before the rows are processed.
+        # Rows under a collection other than COLLECTION_IDENTIFIER are fetched when they come up.
+        if "iiif" not in str(self.env["MEDIA_TYPE"]):
+            return
+        identifiers = self.csv_identifiers(df)
+        collection = self.get_collection({})
+        if not identifiers or not collection:
+            return
+        self.manifest_resolver().prefetch(
+            [self.manifest_url(collection["identifier"], identifier) for identifier in identifiers],
+            root=self.collection_root(collection["identifier"]),
         )
-        return df
-    
+
+
+    def csv_identifiers(self, df):
+        if "identifier" not in df.columns:
+            return []
+        return [
+            str(value).strip().strip("\"").strip()
+            for value in df["identifier"]
+            if self.valid_value(value)
+        ]
+
+
+    def manifest_url(self, collection_identifier, identifier):
+        return os.path.join(
+            self.env["APP_IMG_ROOT_PATH"],
+            self.env["COLLECTION_CATEGORY"],
+            collection_identifier,
+            identifier,
+            "manifest.json",
+        )
+
+
+    def manifest_resolver(self):
+        return get_manifest_resolver(self.env, get_s3_inventory(self.env))
+
+
+    def find_archive(self, identifier):
+        # a buffered, not yet written record would be missed by the lookup, so write it first
+        if any(item["identifier"] == identifier for item, noid_record in self.pending_archives):
+            self.flush_archives()
+        if identifier in self.archive_cache:
+            return self.archive_cache[identifier]
+        return self.query_by_index(self.env["archive_table"], "Identifier", identifier)
+
+
+    def get_metadata(self, filename, bucket=None):
+        # an open file or S3 object body, parsed a chunk at a time by metadata_records()
+        return metadata_body(filename, bucket, self.env["s3_client"])
+
+
+    def metadata_chunks(self, source, stage="metadata"):
+        chunks = read_csv_chunks(
+            source,
+            chunksize=self.env.get("CSV_CHUNK_SIZE"),
+            engine=self.env.get("CSV_ENGINE"),
+        )
+        progress = self.env.get("progress")
+        return chunks if progress is None else progress.track(chunks, stage)
+
+
+    def metadata_records(self, response, item_type, on_chunk=None):
+        """
+        Yields (row number, record) for each row of a metadata csv, with records built
+        a chunk at a time by a ColumnPlan and completed by complete_metadata(). A record
+        is None if the row can't be imported.
+        on_chunk(df) is called with each chunk before its records are yielded.
+        """
+        plan = None
+        for df in self.metadata_chunks(response["Body"]):
+            if on_chunk is not None:
+                on_chunk(df)
+            if plan is None:
+                plan = ColumnPlan(df.columns, self.single_value_headers, self.multi_value_headers)
+            for idx, attributes in plan.rows(df, self.set_attribute):
+                yield idx, self.complete_metadata(attributes, item_type)
+
 
     # Checks all the dates for the row at the same time.
     # Returns false if ANY fail
     def validate_archive_dates(self, archive_dict):
         date_fields = ["embargo_end_date", "embargo_start_date", "end_date", "start_date"]
-        date_formats = ["%Y/%m/%d %H:%M:%S","%Y/%m/%d", "%Y/%m", "%Y-%m-%d %H:%M:%S","%Y-%m-%d", "%Y-%m", "%Y"]
-        all_valid = True
-        for field in date_fields:
-            field_valid = False
-            if field in archive_dict and archive_dict[field]:
-                for fmt in date_formats:
-                    try:
-                        datetime.strptime(archive_dict[field], fmt)
-                        field_valid = True
-                        break  # if parsing is successful, break out of the loop
-                    except ValueError:
-                        continue  # if parsing fails, try the next format
-            else:
-                field_valid = True
-            if not field_valid:
-                all_valid = False
-
-        return all_valid
+        # each distinct date string is only checked once per process
+        return all(valid_dates([archive_dict.get(field) for field in date_fields]))
 
 
     def get_thumbnail_path_for_archive(self, archive_dict, collection):
@@ -293,19 +374,34 @@ class GenericMetadata:
 
 
     def get_thumbnail_path_for_iiif(self, archive_dict):
+        # the resolver skips manifests missing from the destination bucket and caches every result
+        collection_identifier = archive_dict.get("parent_collection_identifier") or [self.env["COLLECTION_IDENTIFIER"]]
+        if isinstance(collection_identifier, list):
+            collection_identifier = collection_identifier[0]
         try:
-            json_url = urllib.request.urlopen(archive_dict["manifest_url"])            
-            if json_url:
-                return json.loads(json_url.read())["thumbnail"]["@id"]
+            return self.manifest_resolver().thumbnail(
+                archive_dict["manifest_url"], root=self.collection_root(collection_identifier)
+            )
         except Exception as e:
             self.logger.error(f"Error fetching thumbnail for IIIF archive {archive_dict['identifier']}: {str(e)}")
             return None
 
 
+    def log_table_calls(self):
+        for name, access in (self.env.get("table_access") or {}).items():
+            if access.calls:
+                self.logger.info(f"DynamoDB calls for {name}: {dict(access.calls)}")
+
+
     def get_table_name(self, table_name):
         return f"{table_name}-{self.env['DYNAMODB_TABLE_SUFFIX']}" 
 
 
+    def collection_root(self, collection_identifier):
+        # S3 prefix that the per-run inventory lists once for all of a collection's items
+        return os.path.join(self.env["COLLECTION_CATEGORY"], collection_identifier, "")
+
+
     def update_item_in_table(self, table, item_id, attr_dict, identifier):
         """
         Updates an existing item in the DynamoDB table with the provided attributes.
@@ -402,6 +498,9 @@ class GenericMetadata:
         utc_now = self.utcformat(datetime.now())
         attr_dict["createdAt"] = utc_now  # Set createdAt to the current time
         attr_dict["updatedAt"] = utc_now  # Set updatedAt to the current time
+        if item_type == "Archive" and not self.env["DRY_RUN"]:
+            self.queue_archive(attr_dict, short_id, utc_now)
+            return attr_dict["id"]
         success = False
         try:
             if self.env["DRY_RUN"]:
@@ -415,6 +514,9 @@ class GenericMetadata:
         except Exception as e:
             self.logger.info(e)
             self.logger.info(f"Error PutItem failed: {attr_dict['identifier']}")
+        if item_type == "Collection" and (success or self.env["DRY_RUN"]):
+            # the Identifier GSI may not have the new record yet, so lookups this run use the cache
+            self.cache_collection(attr_dict)
         if short_id:
             if success:
                 long_url = os.path.join(
@@ -428,26 +530,88 @@ class GenericMetadata:
                 )
                 self.create_NOID_record(short_id, attr_dict, long_url, short_url, utc_now)
             else:
-                self.delete_NOID_record(short_id)
+                get_noid_allocator(self.env).release(short_id)
 
         return attr_dict["id"]
 
 
+    def queue_archive(self, attr_dict, short_id, utc_now):
+        attr_dict["__typename"] = "Archive"
+        noid_record = None
+        if short_id:
+            long_url = os.path.join(self.env["LONG_URL_PATH"], "archive", short_id)
+            short_url = os.path.join(
+                self.env["SHORT_URL_PATH"],
+                self.env["NOID_SCHEME"],
+                self.env["NOID_NAA"],
+                short_id,
+            )
+            noid_record = self.new_NOID_record(short_id, attr_dict, long_url, short_url, utc_now)
+        self.pending_archives.append((attr_dict, noid_record))
+        if len(self.pending_archives) >= MAX_BATCH_WRITE:
+            self.flush_archives()
+
+
+    def flush_archives(self):
+        # Archive records go first; a NOID record is only written once its Archive record is in the table
+        if not self.pending_archives:
+            return
+        pending = self.pending_archives
+        self.pending_archives = []
+        archive_results = batch_put_items(
+            self.dyndb, self.env["archive_table"].name, [item for item, noid_record in pending]
+        )
+        noid_records = []
+        for item, noid_record in pending:
+            success = archive_results.get(item["id"], False)
+            self.archive_write_results[item["identifier"]] = success
+            if success:
+                self.archive_cache[item["identifier"]] = item
+                self.logger.info(f"PutItem succeeded: {item['identifier']}")
+                if noid_record:
+                    noid_records.append(noid_record)
+            else:
+                self.logger.info(f"Error PutItem failed: {item['identifier']}")
+                if noid_record:
+                    get_noid_allocator(self.env).release(noid_record["short_id"])
+        if noid_records:
+            noid_results = batch_put_items(
+                self.dyndb, self.env["mint_table"].name, noid_records, key_name="short_id"
+            )
+            for noid_record in noid_records:
+                if noid_results.get(noid_record["short_id"], False):
+                    continue
+                # the Archive record is written and points at this NOID, so try once more on its own
+                if not put_item(self.dyndb, self.env["mint_table"].name, noid_record):
+                    self.record_error(
+                        f"NOID record {noid_record['short_id']} for {noid_record['identifier']} was not written; "
+                        f"its Archive record points at a Reserved placeholder in {self.env['mint_table'].name}"
+                    )
+
+
+    def record_error(self, message):
+        # logged, and kept for the run's errors.csv
+        self.logger.error(message)
+        self.env.setdefault("errors", []).append(message)
+
+
+    def log_archive_write_results(self):
+        if not self.archive_write_results:
+            return
+        failed = [identifier for identifier, success in self.archive_write_results.items() if not success]
+        self.logger.info(
+            f"Batched Archive writes: {len(self.archive_write_results) - len(failed)} succeeded, {len(failed)} failed"
+        )
+        if failed:
+            self.logger.error(f"Archive records not written: {failed}")
+
+
     def utcformat(self, dt, timespec="milliseconds"):
         # convert datetime to string in UTC format (YYYY-mm-ddTHH:MM:SS.mmmZ)
         iso_str = dt.astimezone(timezone.utc).isoformat("T", timespec)
         return iso_str.replace("+00:00", "Z")
 
 
-    def valid_key(self, key):
-        return (
-            key is not None and 
-            isinstance(key, str) and 
-            str(key).strip() != "" and 
-            not key.lower().startswith("unnamed")
-        )
-
-
     def valid_value(self, value):
         return (
             value is not None and (
@@ -457,14 +621,8 @@ class GenericMetadata:
         )
 
 
-    def process_metadata_and_env(self, data_row, item_type):
-        dict = {}
-        items = data_row.items()
+    def complete_metadata(self, dict, item_type):
         identifier = None
-        for key, value in items:
-            if(self.valid_key(key) and self.valid_value(value)):
-                dict = self.set_attribute(dict, key.strip(), str(value).strip().strip("\"").strip())
-
         if ("identifier" not in dict.keys()) or ("title" not in dict.keys()):
             dict = None
             self.logger.error(f"Missing required attribute in this row!")
@@ -480,8 +638,8 @@ class GenericMetadata:
             # Add embargo date error checking if start date is after end date:
             if embargo_start and embargo_end:
                 try:
-                    start_dt = parse(str(embargo_start))
-                    end_dt = parse(str(embargo_end))
+                    start_dt = parse_date(str(embargo_start))
+                    end_dt = parse_date(str(embargo_end))
                     if start_dt > end_dt:
                         self.logger.error(f"\033[91m⚠️  Error: Embargo start date ({embargo_start}) is after embargo end date ({embargo_end}) for identifier {identifier}\033[0m")
                         dict = None
@@ -531,7 +689,7 @@ class GenericMetadata:
             else:
                 dict[lower_attr] = False
         elif attr == "parent_collection_identifier":
-            parent = self.query_by_index(self.env["collection_table"], "Identifier", value)
+            parent = self.find_collection("Identifier", value)
 
             if parent is not None:
                 parent_collection_id = parent["id"]
@@ -579,26 +737,18 @@ class GenericMetadata:
     def print_index_date(self, attr_dict, value, attr):
         # If the value is None, "None", or an empty string, set the attribute to an empty string.
         # This is to ensure that the attribute is removed from the table if it is not set.
-        if value is None or str(value).strip().lower() == "none" or not str(value).strip():
-            attr_dict[attr] = ""
-            return
-        # Check if the value is a year-only format (e.g., "2023")
-        if re.fullmatch(r"\d{4}", value):
-            attr_dict[attr] = value
-            return
-        try:
-            parsed_date = parse(value)
-            # dates in Elasticsearch are formatted, e.g. "2015/01/01" or
-            # "2015/01/01 12:10:30"
-            # full list of accepted formats:
-            # "yyyy/MM/dd HH:mm:ss||yyyy/MM/dd||yyyy/MM||yyyy/M||yyyy-MM-dd HH:mm:ss||yyyy-MM-dd||yyyy-MM||yyyy-M||yyyyMM||yyyy||epoch_millis"
-            attr_dict[attr] = parsed_date.strftime("%Y/%m/%d")
-        except ValueError:
+        # A year-only value (e.g. "2023") is kept as is. Anything else is formatted for Elasticsearch,
+        # e.g. "2015/01/01". full list of accepted formats:
+        # "yyyy/MM/dd HH:mm:ss||yyyy/MM/dd||yyyy/MM||yyyy/M||yyyy-MM-dd HH:mm:ss||yyyy-MM-dd||yyyy-MM||yyyy-M||yyyyMM||yyyy||epoch_millis"
+        indexed, error = index_date(value)
+        if error is None:
+            attr_dict[attr] = indexed
+        elif isinstance(error, ValueError):
             self.logger.error(f"Error - Unknown date format: {value} for {attr}")
-        except OverflowError:
+        elif isinstance(error, OverflowError):
             self.logger.error(f"Error - Invalid date range: {value} for {attr}")
-        except BaseException as e:
-            self.logger.error(f"Error - Unexpected error: {value} for {attr}, Exception: {e}")
+        else:
+            self.logger.error(f"Error - Unexpected error: {value} for {attr}, Exception: {error}")
 
 
     def query_by_index(self, table, index_name, value):
@@ -607,31 +757,14 @@ class GenericMetadata:
             self.logger.error(f"Error: arg is None for query_by_index()")
             self.logger.error(f"table: {table or 'None'}, index_name: {index_name or 'None'}, value: {value or 'None'}")
             return None
-        index_key = index_name.lower()
-        response = None
         ret_val = None
 
         if type(value) is list:
             value = value[0]
 
         try:
-            found = []
-            indexes = table.global_secondary_indexes
-            for index in indexes:
-                found.append(index["IndexName"])
-            if index_name in found:
-                response = table.query(
-                    IndexName=index_name,
-                    KeyConditionExpression=Key(index_key).eq(value),
-                    Limit=1,
-                )
-            else:
-                response = table.query(
-                    KeyConditionExpression=Key(index_key).eq(value),
-                    Limit=1,
-                )
-            if "Items" in response and len(response["Items"]) == 1:
-                ret_val = response["Items"][0]
+            # the table's key schema and indexes are described once per run, not on every lookup
+            ret_val = get_table_access(self.env, table).query_one(index_name, value)
         except Exception as e:
             self.logger.error(f"Error querying {table} by {index_name}: {str(e)}")
             pass
@@ -651,11 +784,7 @@ class GenericMetadata:
             if "heirarchy_path" in archive_dict:
                 collection = self.collection_by_header("heirarchy_path", archive_dict)
         if not collection:
-            collection = self.query_by_index(
-                self.env["collection_table"],
-                "Identifier",
-                self.env["COLLECTION_IDENTIFIER"],
-            )
+            collection = self.find_collection("Identifier", self.env["COLLECTION_IDENTIFIER"])
         return collection
 
 
@@ -663,14 +792,69 @@ class GenericMetadata:
         value = (
             archive[header] if isinstance(archive[header], str) else archive[header][0]
         )
-        collection = self.query_by_index(self.env["collection_table"], "id", value)
+        collection = self.find_collection("id", value)
         if not collection:
-            collection = self.query_by_index(
-                self.env["collection_table"], "Identifier", value
-            )
+            collection = self.find_collection("Identifier", value)
         return collection
 
 
+    def find_collection(self, key_name, value):
+        """
+        Collection lookup by "id" or "Identifier", memoized for the run.
+        Misses are cached too; records this run writes replace their entries, see cache_collection().
+        """
+        if type(value) is list:
+            value = value[0] if value else None
+        if not value:
+            return None
+        cache = self.collection_cache()
+        cache_key = (key_name.lower(), value)
+        if cache_key in cache:
+            return cache[cache_key]
+        try:
+            collection = get_table_access(self.env, self.env["collection_table"]).query_one(key_name, value)
+        except Exception as e:
+            # don't cache lookups that failed
+            self.logger.error(f"Error querying {self.env['collection_table']} by {key_name}: {str(e)}")
+            return None
+        cache[cache_key] = collection
+        if collection:
+            cache[("id", collection["id"])] = collection
+            if "identifier" in collection:
+                cache[("identifier", collection["identifier"])] = collection
+        return collection
+
+
+    def collection_cache(self):
+        # shared by every handler in the run; ingest.main() resets it
+        if self.env.get("collection_cache") is None:
+            self.env["collection_cache"] = {}
+        return self.env["collection_cache"]
+
+
+    def cache_collection(self, collection):
+        # a record this run wrote, under both of find_collection()'s keys
+        cache = self.collection_cache()
+        cache[("id", collection["id"])] = collection
+        if "identifier" in collection:
+            cache[("identifier", collection["identifier"])] = collection
+
+
+    def refresh_collection(self, collection):
+        # an updated record, read back by id; a consistent read doesn't depend on the GSI catching up
+        try:
+            item = self.env["collection_table"].get_item(Key={"id": collection["id"]}, ConsistentRead=True).get("Item")
+        except Exception as e:
+            self.logger.error(f"Error reading back collection {collection.get('identifier')}: {str(e)}")
+            item = None
+        if item:
+            self.cache_collection(item)
+        else:
+            cache = self.collection_cache()
+            for cache_key in [("id", collection.get("id")), ("identifier", collection.get("identifier"))]:
+                cache.pop(cache_key, None)
+
+
     def extract_attribute(self, header, value):
         if header in self.single_value_headers:
             return value
@@ -694,10 +878,11 @@ class GenericMetadata:
             parent_identifier = self.env["PARENT_COLLECTION_IDENTIFIER"]
         
         if parent_identifier:
-            parent = self.query_by_index(self.env["collection_table"], "Identifier", parent_identifier)
+            parent = self.find_collection("Identifier", parent_identifier)
 
         if parent and "heirarchy_path" in parent:
-            heirarchy_path = parent["heirarchy_path"] 
+            # copy, so the cached parent record isn't modified
+            heirarchy_path = list(parent["heirarchy_path"])
             
         heirarchy_path.append(collection_dict["id"])    
             
@@ -705,24 +890,14 @@ class GenericMetadata:
 
 
     def walk_collection(self, parent):
-        custom_key = parent["custom_key"].replace("ark:/53696/", "")
-        map_location = {
-            "id": parent["id"],
-            "name": parent["title"],
-            "custom_key": custom_key,
-        }
-        children = self.get_collection_children(parent["id"])
-        if len(children) > 0:
-            map_location["children"] = []
-            for child in children:
-                map_location["children"].append(self.walk_collection(child))
-        return map_location
+        # one projected scan for the whole tree instead of a full-table scan per node
+        return build_collection_map(parent, self.get_collection_tree_index())
 
 
-    def get_collection_children(self, parent_id):
+    def get_collection_tree_index(self):
         scan_kwargs = {
-            "FilterExpression": Attr("parent_collection").contains(parent_id),
-            "ProjectionExpression": "#id, title, custom_key",
+            "FilterExpression": Attr("parent_collection").exists(),
+            "ProjectionExpression": "#id, title, custom_key, parent_collection",
             "ExpressionAttributeNames": {"#id": "id"},
         }
         source_table_items = []
@@ -739,43 +914,70 @@ class GenericMetadata:
         except Exception as e:
             self.logger.error(f"An error occurred: {str(e)}")
             raise e
-        return source_table_items
+        return children_by_parent(source_table_items)
+
+
+    def queue_collection_map_update(self, collection_dict, created):
+        root_id = collection_dict["heirarchy_path"][0]
+        if created and self.pending_map_updates.get(root_id, []) is not None:
+            self.pending_map_updates.setdefault(root_id, []).append(collection_dict)
+        else:
+            # an updated collection may have a new title or parent, so walk the whole tree
+            self.pending_map_updates[root_id] = None
+
+
+    def flush_collection_map_updates(self):
+        pending = self.pending_map_updates
+        self.pending_map_updates = {}
+        for root_id, created in pending.items():
+            if created and not self.env["DRY_RUN"] and self.patch_collection_map(root_id, created):
+                continue
+            self.update_collection_map(root_id)
+
+
+    def patch_collection_map(self, top_parent_id, new_collections):
+        """
+        Adds newly created collections to the root's stored map_object without re-walking the tree.
+        Returns False when the map has to be rebuilt instead: no stored map yet, a new
+        collection with several parents, or a parent that isn't in the map.
+        """
+        parent = self.find_collection("id", top_parent_id)
+        if parent is None or "parent_collection" in parent or "collectionmap_id" not in parent:
+            return False
+        try:
+            response = self.env["collectionmap_table"].get_item(Key={"id": parent["collectionmap_id"]})
+            map_obj = json.loads(response["Item"]["map_object"])
+        except Exception as e:
+            self.logger.info(f"Rebuilding collection map for {top_parent_id}; stored map unavailable: {str(e)}")
+            return False
+
+        nodes = {}
+        stack = [map_obj]
+        while stack:
+            node = stack.pop()
+            nodes[node["id"]] = node
+            stack.extend(node.get("children", []))
+
+        for collection in new_collections:
+            if collection["id"] in nodes:
+                continue
+            parents = collection.get("parent_collection") or []
+            if len(parents) != 1 or parents[0] not in nodes:
+                return False
+            node = map_location(collection)
+            nodes[parents[0]].setdefault("children", []).append(node)
+            nodes[collection["id"]] = node
+
+        self.write_collection_map(parent, map_obj)
+        self.logger.info(f"Added {len(new_collections)} collection(s) to the collection map for {parent['identifier']}")
+        return True
+
 
     def update_collection_map(self, top_parent_id):
-        parent = self.query_by_index(self.env["collection_table"], "id", top_parent_id)
+        parent = self.find_collection("id", top_parent_id)
         if parent is not None and "parent_collection" not in parent:
             map_obj = self.walk_collection(parent)
-            utc_now = self.utcformat(datetime.now())
-            if "collectionmap_id" in parent:
-                self.env["collectionmap_table"].update_item(
-                    Key={"id": parent["collectionmap_id"]},
-                    AttributeUpdates={
-                        "map_object": {"Value": json.dumps(map_obj), "Action": "PUT"},
-                        "collectionmap_category": {
-                            "Value": parent["collection_category"],
-                            "Action": "PUT",
-                        },
-                        "updatedAt": {"Value": utc_now, "Action": "PUT"},
-                    },
-                )
-            else:
-                map_id = str(uuid.uuid4())
-                self.env["collectionmap_table"].put_item(
-                    Item={
-                        "id": map_id,
-                        "map_object": json.dumps(map_obj),
-                        "collection_id": parent["id"],
-                        "collectionmap_category": parent["collection_category"],
-                        "createdAt": utc_now,
-                        "updatedAt": utc_now,
-                    }
-                )
-                self.env["collection_table"].update_item(
-                    Key={"id": parent["id"]},
-                    AttributeUpdates={
-                        "collectionmap_id": {"Value": map_id, "Action": "PUT"}
-                    },
-                )
+            self.write_collection_map(parent, map_obj)
         else:
             if self.env["DRY_RUN"]:
                 self.logger.info("Collection map creation SIMULATED.")
@@ -785,26 +987,71 @@ class GenericMetadata:
                 )
 
 
-    def mint_NOID(self):
-        noid = str(uuid.uuid4()).replace("-", "")[:8]
-        in_table = self.query_by_index(self.env["mint_table"], "short_id", noid)
-        while in_table:
-            noid = str(uuid.uuid4()).replace("-", "")[:8]
-            in_table = self.query_by_index(self.env["mint_table"], "short_id", noid)
+    def write_collection_map(self, parent, map_obj):
+        utc_now = self.utcformat(datetime.now())
+        if "collectionmap_id" in parent:
+            self.env["collectionmap_table"].update_item(
+                Key={"id": parent["collectionmap_id"]},
+                AttributeUpdates={
+                    "map_object": {"Value": json.dumps(map_obj), "Action": "PUT"},
+                    "collectionmap_category": {
+                        "Value": parent["collection_category"],
+                        "Action": "PUT",
+                    },
+                    "updatedAt": {"Value": utc_now, "Action": "PUT"},
+                },
+            )
+        else:
+            map_id = str(uuid.uuid4())
+            self.env["collectionmap_table"].put_item(
+                Item={
+                    "id": map_id,
+                    "map_object": json.dumps(map_obj),
+                    "collection_id": parent["id"],
+                    "collectionmap_category": parent["collection_category"],
+                    "createdAt": utc_now,
+                    "updatedAt": utc_now,
+                }
+            )
+            self.env["collection_table"].update_item(
+                Key={"id": parent["id"]},
+                AttributeUpdates={
+                    "collectionmap_id": {"Value": map_id, "Action": "PUT"}
+                },
+            )
+            parent["collectionmap_id"] = map_id
+            self.cache_collection(parent)
+
 
-        return noid
+    def mint_NOID(self):
+        # ids come from a block already reserved in the mint table, so no collision check is needed
+        try:
+            return get_noid_allocator(self.env).mint()
+        except Exception as e:
+            self.logger.error(f"Error minting NOID: {str(e)}")
+            return None
 
 
     def create_NOID_record(self, noid, item, long_url, short_url, now):
         if self.env["DRY_RUN"]:
             self.logger.info("create_NOID_record: New NOID SIMULATED.")
             return "12345678"
+        noid_record = self.new_NOID_record(noid, item, long_url, short_url, now)
+        newNoidResponse = self.env["mint_table"].put_item(Item=noid_record)
+        success = (newNoidResponse["ResponseMetadata"]["HTTPStatusCode"] == 200)
+        if success:
+            return noid
+        else:
+            return None
+
+
+    def new_NOID_record(self, noid, item, long_url, short_url, now):
         category = None
         if "collection_category" in item:
             category = item["collection_category"]
         elif "item_category" in item:
             category = item["item_category"]
-        noid_record = {
+        return {
             "short_id": noid,
             "type": "Collection" if "collection_category" in item else "Item",
             "collection_category": category,
@@ -814,17 +1061,3 @@ class GenericMetadata:
             "created_at": now,
             "hits": 0
         }
-        newNoidResponse = self.env["mint_table"].put_item(Item=noid_record)
-        success = (newNoidResponse["ResponseMetadata"]["HTTPStatusCode"] == 200)
-        if success:
-            return noid
-        else:
-            return None
-        
-
-    def delete_NOID_record(self, noid):
-        if self.env["DRY_RUN"]:
-            self.logger.info("delete_NOID: SIMULATED.")
-        else:
-            self.env["mint_table"].delete_item(Key={"short_id": noid})
-            self.logger.info(f"delete_NOID: {noid}")
\ No newline at end of file
@@ -1,5 +1,5 @@
-import io, logging, os
-from utils.s3_tools import get_matching_s3_keys
+import logging, os
+from utils.s3_tools import get_s3_inventory
 from ingest_classes.metadata.generic_metadata import GenericMetadata
 
 
@@ -14,9 +14,7 @@ class PDFMetadata(GenericMetadata):
         super().__init__(self.env, self.filename, self.bucket, self.assets)
 
     def batch_import_archives(self, response):
-        df = self.csv_to_dataframe(io.BytesIO(response["Body"].read()))
-        for idx, row in df.iterrows():
-            archive_dict = self.process_metadata_and_env(row, "Archive")
+        for idx, archive_dict in self.metadata_records(response, "Archive", self.prefetch_archives):
             if not archive_dict:
                 self.logger.error(f"Error: Archive {idx+1} has failed to be imported.")
                 continue
@@ -52,7 +50,7 @@ class PDFMetadata(GenericMetadata):
                     )
                     self.archive_option_additions = self.set_archive_option_additions()
 
-                    existing_archive = self.query_by_index(self.env["archive_table"], "Identifier", archive_dict["identifier"])
+                    existing_archive = self.find_archive(archive_dict["identifier"])
                     if existing_archive:
                         if self.env["UPDATE_METADATA"]:
                             self.update_item_in_table(self.env["archive_table"], existing_archive["id"], archive_dict, archive_dict["identifier"])
@@ -79,7 +77,9 @@ class PDFMetadata(GenericMetadata):
         except Exception as e:
             self.logger.error(e)
             return ""
-        matches = get_matching_s3_keys(self.env["AWS_DEST_BUCKET"], prefix, suffix)
+        matches = get_s3_inventory(self.env).match(
+            self.env["AWS_DEST_BUCKET"], prefix, suffix, root=self.collection_root(collection_identifier)
+        )
         if matches:
             for key in matches:
                 asset_url = os.path.join(self.env["APP_IMG_ROOT_PATH"], key)
@@ -89,20 +89,17 @@ class PDFMetadata(GenericMetadata):
 
     def key_by_asset_path(self, asset_path):
         matching_key = None
-        matches = get_matching_s3_keys(self.env["AWS_DEST_BUCKET"], asset_path)
+        inventory = get_s3_inventory(self.env)
+        root = self.collection_root(self.env["COLLECTION_IDENTIFIER"])
+        matches = inventory.match(self.env["AWS_DEST_BUCKET"], asset_path, root=root)
         if matches:
             for key in matches:
                 matching_key = key
+        if matching_key is None:
+            # try ignoring the filename case
+            matching_key = inventory.find(self.env["AWS_DEST_BUCKET"], asset_path, root=root)
             if matching_key is None:
-                # try ignoring the filename case
-                asset_path_no_filename = asset_path.replace(asset_path.split("/")[-1], "")
-                matches = get_matching_s3_keys(self.env["AWS_DEST_BUCKET"], asset_path_no_filename)
-                if matches:
-                    for key in matches:
-                        if key.lower() == asset_path.lower():
-                            matching_key = key
-                    if matching_key is None:
-                        self.logger.error(f"Couldn't find key for: {asset_path}.")
+                self.logger.error(f"Couldn't find key for: {asset_path}.")
         return matching_key
 
 
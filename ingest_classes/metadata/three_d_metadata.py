@@ -1,5 +1,5 @@
 import io, json, logging, os, urllib
-from utils.s3_tools import get_matching_s3_keys
+from utils.s3_tools import get_s3_inventory
 from ingest_classes.metadata.generic_metadata import GenericMetadata
 
 
@@ -13,9 +13,7 @@ class ThreeDMetadata(GenericMetadata):
         super().__init__(self.env, self.filename, self.bucket, self.assets)
 
     def batch_import_archives(self, response):
-        df = self.csv_to_dataframe(io.BytesIO(response["Body"].read()))
-        for idx, row in df.iterrows():
-            archive_dict = self.process_metadata_and_env(row, "Archive")
+        for idx, archive_dict in self.metadata_records(response, "Archive", self.prefetch_chunk):
             if not archive_dict:
                 self.logger.error(f"Error: reading item on line {idx+1} from csv.")
                 continue
@@ -40,13 +38,7 @@ class ThreeDMetadata(GenericMetadata):
                     
                     # try to load iiif manifest, in case it's a 3d + iiif record
                     if "iiif" in self.env["MEDIA_TYPE"]:
-                        archive_dict["manifest_url"] = os.path.join(
-                            self.env["APP_IMG_ROOT_PATH"],
-                            self.env["COLLECTION_CATEGORY"],
-                            collection_identifier,
-                            archive_dict["identifier"],
-                            "manifest.json",
-                        )
+                        archive_dict["manifest_url"] = self.manifest_url(collection_identifier, archive_dict["identifier"])
 
                     archive_dict["thumbnail_path"] = self.get_thumbnail_path_for_archive(archive_dict, collection)
                         
@@ -61,11 +53,7 @@ class ThreeDMetadata(GenericMetadata):
                         except Exception as e:
                             self.logger.error(f"Unable to set thumbnail_path for archive: {archive_dict["identifier"]}")
 
-                    existing_item = self.query_by_index(
-                        self.env["archive_table"],
-                        "Identifier",
-                        archive_dict["identifier"],
-                    )
+                    existing_item = self.find_archive(archive_dict["identifier"])
                     if existing_item is not None:
                         if self.env["UPDATE_METADATA"]:
                             self.update_item_in_table(self.env["archive_table"], existing_item["id"], archive_dict, archive_dict["identifier"])
@@ -81,8 +69,10 @@ class ThreeDMetadata(GenericMetadata):
         keys = None
         if self.env["AWS_DEST_BUCKET"] is None or asset_path is None:
             return
+        inventory = get_s3_inventory(self.env)
+        root = self.collection_root(self.env["COLLECTION_IDENTIFIER"])
         try:
-            keys = get_matching_s3_keys(self.env["AWS_DEST_BUCKET"], asset_path)
+            keys = inventory.match(self.env["AWS_DEST_BUCKET"], asset_path, root=root)
         except:
             pass
         if keys is None:
@@ -91,12 +81,7 @@ class ThreeDMetadata(GenericMetadata):
             matching_key = key
         if matching_key is None:
             # try ignoring the filename case
-            asset_path_no_filename = asset_path.replace(asset_path.split("/")[-1], "")
-            for key in get_matching_s3_keys(
-                self.env["AWS_DEST_BUCKET"], asset_path_no_filename
-            ):
-                if key.lower() == asset_path.lower():
-                    matching_key = key
+            matching_key = inventory.find(self.env["AWS_DEST_BUCKET"], asset_path, root=root)
         return matching_key
 
 
@@ -1,9 +1,19 @@
-import boto3, logging, os, yaml
-from flask import jsonify, request
+import boto3, logging, os, time, yaml
+from flask import Response, jsonify, request, session, stream_with_context
 import utils.web_utils as utils
+from fixity.fixity_stage import fixity_status
+from utils.ingest_jobs import job_log_file, job_status
+from utils.log_tail import follow_lines, tail_lines
 
 logger = logging.getLogger(__name__)
 
+LOG_TAIL_LINES = 100
+# the job status fields the job page polls for; the rest are shown by the page itself
+POLLED_STATUS_FIELDS = ('job_id', 'state', 'stage', 'rows_processed', 'rows_total', 'rows_per_second', 'eta_seconds')
+# each open stream holds a gunicorn thread, so a stream ends after this long and the
+# browser's EventSource reconnects, picking up from the Last-Event-ID it saw
+LOG_STREAM_SECONDS = int(os.getenv('LOG_STREAM_SECONDS') or 300)
+
 
 def get_identifiers(application):
     identifiers = []
@@ -44,4 +54,80 @@ def env_defaults(application):
     except Exception as e:
         logger.error(f"env_defaults: {e}")
 
-    return jsonify(defaults)
\ No newline at end of file
+    return jsonify(defaults)
+
+
+def get_job_status(job_id):
+    if not utils.user_is_admin(session.get('user')):
+        return jsonify({'error': 'Not authorized'}), 403
+    status = job_status(job_id)
+    if status is None:
+        return jsonify({'error': f'No ingest job {job_id}'}), 404
+    return jsonify({field: status.get(field) for field in POLLED_STATUS_FIELDS})
+
+
+def stream_job_log(job_id):
+    """
+    Server-sent events following a job's log while the job runs: one event per line,
+    with the byte offset the line ends at as its id, so a reconnecting EventSource
+    resumes where it left off. Without an offset it starts with the last 100 lines.
+    Ends with a "done" event carrying the job's final state, or, while the job is still
+    running, after LOG_STREAM_SECONDS without one, for the EventSource to reconnect.
+    """
+    if not utils.user_is_admin(session.get('user')):
+        return jsonify({'error': 'Not authorized'}), 403
+    if job_status(job_id) is None:
+        return jsonify({'error': f'No ingest job {job_id}'}), 404
+    log_file = job_log_file(job_id)
+
+    offset = request.headers.get('Last-Event-ID') or request.args.get('offset')
+    lines = []
+    if offset is not None and str(offset).isdigit():
+        offset = int(offset)
+    else:
+        try:
+            lines, offset = tail_lines(log_file, LOG_TAIL_LINES)
+        except FileNotFoundError:
+            offset = 0
+
+    def job_finished():
+        status = job_status(job_id) or {}
+        return status.get('state') not in ('queued', 'running')
+
+    deadline = time.monotonic() + LOG_STREAM_SECONDS
+
+    def should_stop():
+        return time.monotonic() >= deadline or job_finished()
+
+    def events():
+        # reconnect soon after the stream is closed
+        yield "retry: 1000\n\n"
+        for line in lines:
+            yield f"data: {line.rstrip()}\n\n"
+        if lines:
+            yield f"id: {offset}\n\n"
+        for followed in follow_lines(log_file, offset, should_stop=should_stop):
+            if followed is None:
+                # a comment, to keep idle connections open through proxies
+                yield ": keepalive\n\n"
+                continue
+            line_end, line = followed
+            yield f"id: {line_end}\ndata: {line.rstrip()}\n\n"
+        if not job_finished():
+            return
+        yield f"event: done\ndata: {(job_status(job_id) or {}).get('state')}\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def get_fixity_status(job_id):
+    if not utils.user_is_admin(session.get('user')):
+        return jsonify({'error': 'Not authorized'}), 403
+    status = fixity_status(job_id)
+    if status is None:
+        return jsonify({'error': f'No fixity job {job_id}'}), 404
+    return jsonify(status)
\ No newline at end of file
@@ -1,11 +1,16 @@
-import logging, os
-from flask import redirect, render_template, request, session, url_for
+import logging, os, shutil
+from flask import abort, redirect, render_template, request, send_from_directory, session, url_for
 
 from ingest import main as dlp_ingest_main
+from utils.csv_tools import count_csv_rows
+from utils.ingest_jobs import get_ingest_jobs, job_log_file, job_results_dir, job_status
+from utils.log_tail import tail_lines
 import utils.web_utils as utils
 
 logger = logging.getLogger(__name__)
 
+LOG_TAIL_LINES = 100
+
 def index():
     # Create a user for local dev, if appropriate.
     # If someone has enough permissions to set env vars on our machines, 
@@ -41,13 +46,6 @@ def submit(application):
     collection_uploaded = []
     archive_uploaded = []
     checksum_uploaded = []
-    ingested_items = []
-    updated_items = []
-    errors = []
-    summary = []
-
-    # Clear the logfile each run
-    utils.clear_logfile(logger)
 
     logger.info("====================================================")
     logger.info("/submit -- received ingest request. Beginning ingest process")
@@ -59,15 +57,18 @@ def submit(application):
     else:
         logger.error("No user session")
 
-    utils.set_environment_defaults(application)
+    # built fresh for each request; the queued job keeps it
+    ingestConfig = utils.set_environment_defaults(application, {})
 
     if request.method == 'POST':
         ingest_type = (request.form.get('INGEST_TYPE') or 'archive').lower()
+        upload_dir = utils.new_upload_dir(application)
         try:
             collection_uploaded = utils.save_uploads(
                 application,
                 field_name='collection_metadata_input',
-                allowed_extensions=application.config['ALLOWED_EXTENSIONS']
+                allowed_extensions=application.config['ALLOWED_EXTENSIONS'],
+                upload_dir=upload_dir
             )
             if collection_uploaded:
                 logger.info(f"Collection metadata file uploaded: {collection_uploaded}")
@@ -75,7 +76,8 @@ def submit(application):
             archive_uploaded = utils.save_uploads(
                 application,
                 field_name='archive_metadata_input',
-                allowed_extensions=application.config['ALLOWED_EXTENSIONS']
+                allowed_extensions=application.config['ALLOWED_EXTENSIONS'],
+                upload_dir=upload_dir
             )
             if archive_uploaded:
                 logger.info(f"Archive metadata file uploaded: {archive_uploaded}")
@@ -83,7 +85,8 @@ def submit(application):
             checksum_uploaded = utils.save_uploads(
                 application,
                 field_name='checksum_manifest_input',
-                allowed_extensions=application.config['ALLOWED_EXTENSIONS']
+                allowed_extensions=application.config['ALLOWED_EXTENSIONS'],
+                upload_dir=upload_dir
             )
             if checksum_uploaded:
                 logger.info(f"Checksum manifest file(s) uploaded locally: {checksum_uploaded}")
@@ -105,11 +108,10 @@ def submit(application):
                 err = "Archive ingest requires an item/archive metadata CSV file"
                 logger.error(err)
 
-        utils.set_environment_overrides()
-        ingestConfig = utils.get_ingestConfig()
+        utils.set_environment_overrides(ingestConfig)
 
         metadata_filepaths = [
-            os.path.join(application.config['UPLOADS'], filename)
+            os.path.join(upload_dir, filename)
             for filename in (collection_uploaded + archive_uploaded)
         ]
         metadata_filepaths = list(dict.fromkeys(metadata_filepaths))
@@ -125,12 +127,12 @@ def submit(application):
         if selected_metadata_filename:
 
             collection_metadata_filepath = (
-                os.path.join(application.config['UPLOADS'], collection_uploaded[0])
+                os.path.join(upload_dir, collection_uploaded[0])
                 if collection_uploaded
                 else None
             )
             archive_metadata_filepath = (
-                os.path.join(application.config['UPLOADS'], archive_uploaded[0])
+                os.path.join(upload_dir, archive_uploaded[0])
                 if archive_uploaded
                 else None
             )
@@ -139,7 +141,7 @@ def submit(application):
 
             if checksum_uploaded:
                 checksum_filepaths = [
-                    os.path.join(application.config['UPLOADS'], filename)
+                    os.path.join(upload_dir, filename)
                     for filename in checksum_uploaded
                 ]
                 checksum_locations = utils.upload_files_to_collection_root(
@@ -149,84 +151,134 @@ def submit(application):
                 )
                 logger.info(f"Checksum manifest uploaded to collection root: {checksum_locations}")
 
-            # Do the ingest
-            metadata_filepath = os.path.join(application.config['UPLOADS'], selected_metadata_filename)
+            # Do the ingest, as a background job; the request returns with its id
+            metadata_filepath = os.path.join(upload_dir, selected_metadata_filename)
             logger.info(f"Config: {ingestConfig}")
-            logger.info("INGEST RESULTS---------------------")
-            result = dlp_ingest_main(None, None, metadata_filepath, ingestConfig)
-            logger.info("--------------------- ...END INGEST RESULTS")
-            if result:
-                ingested_items = result.get('ingested', [])
-                updated_items = result.get('updated', [])
-                errors = result.get('errors', [])
-                summary = result.get('summary', [])
-            # TODO: return a results object from ingest process
-            # ...and log an error if you don't get it
-            # else:
-            #     err = "No return value from ingest script dlp_ingest_main()"
-            #     logger.error(err)
-
-            # Write files for download
-            results_dir = os.path.join(application.config['APP_SRC_DIR'], 'results')
-            os.makedirs(results_dir, exist_ok=True)
-            try:
-                with open(os.path.join(results_dir, 'ingested.csv'), 'w') as f:
-                    f.write("item\n")
-                    for item in ingested_items:
-                        f.write(f"{item}\n")
-
-                with open(os.path.join(results_dir, 'updated.csv'), 'w') as f:
-                    f.write("item\n")
-                    for item in updated_items:
-                        f.write(f"{item}\n")
-
-                with open(os.path.join(results_dir, 'errors.csv'), 'w') as f:
-                    f.write("error\n")
-                    for err in errors:
-                        f.write(f"{err}\n")
-
-                with open(os.path.join(results_dir, 'summary.csv'), 'w') as f:
-                    f.write("summary\n")
-                    for line in summary:
-                        f.write(f"{line}\n")
-
-            except Exception as e:
-                err = f"Error writing results files: {e}"
-                logger.error(err)
-
-            # Read the last 100 lines of log_file to show ingest logs
-            # Get log_file path from logger config
-            log_file = utils.get_logfile(logger)
-            if log_file:
-                log_lines = []
-                try:
-                    with open(log_file, 'r') as f:
-                        all_lines = f.readlines()
-                        # Get last 100 lines, or all if fewer than 100
-                        log_lines = all_lines[-100:] if len(all_lines) > 100 else all_lines
-                except FileNotFoundError:
-                    err = "No log file found."
-                    logger.error(err)
-                    log_lines = [err]
-                except Exception as e:
-                    err = f"Error reading log file: {str(e)}"
-                    logger.error(err)
-                    log_lines = [err]
-                return render_template(
-                    'submit.html',
-                    user=user,
-                    user_is_admin=utils.user_is_admin(user),
-                    ingested_count=len(ingested_items),
-                    updated_count=len(updated_items),
-                    errors_count=len(errors),
-                    summary_count=len(summary),
-                    log_lines=log_lines,
-                    ingest_config=ingestConfig
-                )
+            stages = int(bool(ingestConfig.get('MEDIA_INGEST'))) + int(bool(ingestConfig.get('METADATA_INGEST')))
+            rows = count_csv_rows(metadata_filepath)
+            job_id = get_ingest_jobs().submit(
+                lambda progress, results_dir: run_ingest(metadata_filepath, ingestConfig, progress, results_dir, upload_dir),
+                rows_total=rows * stages if rows is not None else None,
+                user=user['email'] if user else None,
+                metadata_file=selected_metadata_filename,
+                collection_identifier=ingestConfig.get('COLLECTION_IDENTIFIER'),
+                ingest_config=ingestConfig,
+            )
+            logger.info(f"Ingest job {job_id} queued")
+            return redirect(url_for("job", job_id=job_id))
         else:
             err = "Missing required metadata file for selected ingest type"
             logger.error(err)
+            shutil.rmtree(upload_dir, ignore_errors=True)
     else:
         logger.info("/submit received GET. Redirecting home")
    
-    return redirect(url_for("index", msg="There was an exception in the process. Please check the logs. ...my bad"))
\ No newline at end of file
+    return redirect(url_for("index", msg="There was an exception in the process. Please check the logs. ...my bad"))
+
+
+def run_ingest(metadata_filepath, ingest_config, progress, results_dir, upload_dir=None):
+    ingested_items = []
+    updated_items = []
+    errors = []
+    summary = []
+    fixity_job = None
+
+    logger.info("INGEST RESULTS---------------------")
+    try:
+        result = dlp_ingest_main(None, None, metadata_filepath, ingest_config, progress)
+    finally:
+        # the job's uploads are in S3 by now; the local copies were only for the run
+        if upload_dir:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+    logger.info("--------------------- ...END INGEST RESULTS")
+    if result:
+        ingested_items = result.get('ingested', [])
+        updated_items = result.get('updated', [])
+        errors = result.get('errors', [])
+        summary = result.get('summary', [])
+        fixity_job = result.get('fixity_job')
+    else:
+        logger.error("No return value from ingest script dlp_ingest_main()")
+
+    # Write files for download, in the job's own results directory
+    os.makedirs(results_dir, exist_ok=True)
+    try:
+        with open(os.path.join(results_dir, 'ingested.csv'), 'w') as f:
+            f.write("item\n")
+            for item in ingested_items:
+                f.write(f"{item}\n")
+
+        with open(os.path.join(results_dir, 'updated.csv'), 'w') as f:
+            f.write("item\n")
+            for item in updated_items:
+                f.write(f"{item}\n")
+
+        with open(os.path.join(results_dir, 'errors.csv'), 'w') as f:
+            f.write("error\n")
+            for err in errors:
+                f.write(f"{err}\n")
+
+        with open(os.path.join(results_dir, 'summary.csv'), 'w') as f:
+            f.write("summary\n")
+            for line in summary:
+                f.write(f"{line}\n")
+
+    except Exception as e:
+        err = f"Error writing results files: {e}"
+        logger.error(err)
+
+    return {
+        'ingested_count': len(ingested_items),
+        'updated_count': len(updated_items),
+        'errors_count': len(errors),
+        'summary_count': len(summary),
+        'fixity_job': fixity_job,
+    }
+
+
+def job(job_id):
+    user = session.get('user')
+    if not utils.user_is_admin(user):
+        return redirect(url_for("index", msg="Not authorized to access page. Please login."))
+    status = job_status(job_id)
+    if status is None:
+        return redirect(url_for("index", msg=f"No ingest job {job_id}"))
+    result = status.get('result') or {}
+
+    # Read the last 100 lines of the job's log to show ingest logs, seeking back from its end
+    log_lines = []
+    log_offset = 0
+    try:
+        log_lines, log_offset = tail_lines(job_log_file(job_id), LOG_TAIL_LINES)
+    except FileNotFoundError:
+        # the log is created when the job starts
+        if status.get('state') != 'queued':
+            err = "No log file found."
+            logger.error(err)
+            log_lines = [err]
+    except Exception as e:
+        err = f"Error reading log file: {str(e)}"
+        logger.error(err)
+        log_lines = [err]
+    return render_template(
+        'submit.html',
+        user=user,
+        user_is_admin=utils.user_is_admin(user),
+        job=status,
+        ingested_count=result.get('ingested_count', 0),
+        updated_count=result.get('updated_count', 0),
+        errors_count=result.get('errors_count', 0),
+        summary_count=result.get('summary_count', 0),
+        log_lines=log_lines,
+        log_offset=log_offset,
+        fixity_job=result.get('fixity_job'),
+        ingest_config=status.get('ingest_config') or {}
+    )
+
+
+def job_results(job_id, filename):
+    if not utils.user_is_admin(session.get('user')):
+        return redirect(url_for("index", msg="Not authorized to access page. Please login."))
+    if job_status(job_id) is None:
+        abort(404)
+    return send_from_directory(job_results_dir(job_id), filename, as_attachment=True)
\ No newline at end of file
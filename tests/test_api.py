@@ -0,0 +1,61 @@
+import pytest
+from flask import Flask
+
+from routes import api
+from utils.ingest_jobs import job_status, write_job_status
+
+ADMIN = {"email": "admin@example.org", "cognito:groups": ["admin"]}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    write_job_status("job-1", {
+        "job_id": "job-1",
+        "state": "running",
+        "stage": "metadata",
+        "rows_processed": 5,
+        "rows_total": 10,
+        "rows_per_second": 2.5,
+        "eta_seconds": 2,
+        "user": "someone@example.org",
+        "metadata_file": "metadata.csv",
+        "collection_identifier": "coll",
+        "ingest_config": {"AWS_SECRET": "x"},
+        "error": None,
+    }, tmp_path)
+    monkeypatch.setattr(api, "job_status", lambda job_id: job_status(job_id, tmp_path))
+    app = Flask(__name__)
+    app.secret_key = "test"
+    app.add_url_rule("/api/jobs/<job_id>", view_func=api.get_job_status)
+    return app.test_client()
+
+
+def log_in(client, user):
+    with client.session_transaction() as session:
+        session["user"] = user
+
+
+def test_job_status_needs_an_admin(client):
+    assert client.get("/api/jobs/job-1").status_code == 403
+    log_in(client, {"email": "user@example.org", "cognito:groups": []})
+    assert client.get("/api/jobs/job-1").status_code == 403
+
+
+def test_job_status_has_only_the_polled_fields(client):
+    log_in(client, ADMIN)
+    response = client.get("/api/jobs/job-1")
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "job_id": "job-1",
+        "state": "running",
+        "stage": "metadata",
+        "rows_processed": 5,
+        "rows_total": 10,
+        "rows_per_second": 2.5,
+        "eta_seconds": 2,
+    }
+
+
+def test_unknown_job(client):
+    log_in(client, ADMIN)
+    assert client.get("/api/jobs/nope").status_code == 404
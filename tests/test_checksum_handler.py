@@ -0,0 +1,228 @@
+import hashlib
+import io
+import json
+import threading
+import time
+
+import pytest
+
+import fixity.checksum_handler as checksum_handler
+
+HEADER = "Filename,FilePath,SHA1_Hash,MD5_Hash,FileSize,FileExtension,CreatedDate\n"
+
+
+class StubS3:
+    """A collection's objects (key -> md5) and checksum manifests (key -> csv text)."""
+
+    def __init__(self, objects, manifests):
+        self.objects = objects
+        self.manifests = manifests
+        self.uploads = {}
+        self.heads = []
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        keys = sorted(key for key in list(self.objects) + list(self.manifests) if key.startswith(Prefix))
+        return {"Contents": [{"Key": key, "Size": 5, "ETag": f'"{self.objects.get(key, key)}"'} for key in keys]}
+
+    def get_object(self, Bucket, Key):
+        return {"Body": io.BytesIO(self.manifests[Key].encode())}
+
+    def head_object(self, Bucket, Key):
+        self.heads.append(Key)
+        headers = {"etag": f'"{self.objects[Key]}"', "content-type": "image/tiff", "x-amz-meta-origin": "scanner"}
+        return {"ContentType": "image/tiff", "ResponseMetadata": {"HTTPHeaders": headers}}
+
+    def upload_fileobj(self, body, Bucket, Key):
+        self.uploads[Key] = body.read().decode()
+
+    def put_object(self, Bucket, Key, Body):
+        self.uploads[Key] = Body
+
+
+class StubClient:
+    """The resource's meta.client. Writes for `slow_paths` take a while, to finish out of order."""
+
+    def __init__(self, items, slow_paths=()):
+        self.items = items
+        self.slow_paths = set(slow_paths)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    def describe_table(self, TableName):
+        return {"Table": {"KeySchema": [{"AttributeName": "id", "KeyType": "HASH"}]}}
+
+    def batch_write_item(self, RequestItems):
+        with self.lock:
+            self.in_flight += 1
+            self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        items = [request["PutRequest"]["Item"] for requests in RequestItems.values() for request in requests]
+        if any(item["s3_file_path"] in self.slow_paths for item in items):
+            time.sleep(0.2)
+        with self.lock:
+            self.items.extend(items)
+            self.in_flight -= 1
+        return {"UnprocessedItems": {}}
+
+
+class StubMeta:
+    pass
+
+
+class StubTable:
+    def __init__(self, name, client):
+        self.name = name
+        self.meta = StubMeta()
+        self.meta.client = client
+
+    def scan(self, **kwargs):
+        return {"Items": [{"s3_file_path": item["s3_file_path"]} for item in self.meta.client.items]}
+
+
+class StubDynamo:
+    """A DynamoDB resource; the handler may only write through its meta.client."""
+
+    def __init__(self, existing=(), slow_paths=()):
+        self.meta = StubMeta()
+        self.meta.client = StubClient([{"s3_file_path": key} for key in existing], slow_paths)
+
+    def Table(self, name):
+        return StubTable(name, self.meta.client)
+
+    def batch_write_item(self, RequestItems):
+        raise AssertionError("the shared resource isn't thread safe")
+
+
+def md5(name):
+    return hashlib.md5(name.encode()).hexdigest()
+
+
+def manifest(*names):
+    return HEADER + "".join(f"{name},/vol/{name},sha-{name},{md5(name)},5,tif,2020-01-02\n" for name in names)
+
+
+def collection(count):
+    # `count` manifests of two files each, the first file of each also listed in the next
+    objects = {f"cat/coll/files/f{i}.tif": md5(f"f{i}.tif") for i in range(count + 1)}
+    manifests = {f"cat/coll/checksum/m{i}.csv": manifest(f"f{i}.tif", f"f{i + 1}.tif") for i in range(count)}
+    return objects, manifests
+
+
+def run(monkeypatch, tmp_path, objects, manifests, existing=(), slow_paths=(), **event):
+    s3 = StubS3(objects, manifests)
+    dynamo = StubDynamo(existing, slow_paths)
+    monkeypatch.setattr(checksum_handler, "s3_client", s3)
+    monkeypatch.setattr(checksum_handler, "dynamo_resource", dynamo)
+    event = {
+        "COLLECTION_IDENTIFIER": "coll",
+        "FIXITY_TABLE_NAME": "fixity",
+        "S3_BUCKET_NAME": "b",
+        "S3_PREFIX": "cat",
+        "FIXITY_LEDGER": str(tmp_path / "ledger.json"),
+        **event,
+    }
+    body = json.loads(checksum_handler.checksum_handler(event, None)["body"])
+    return body, s3, dynamo.meta.client
+
+
+def results_file(s3, body, name):
+    key = f"cat/coll/ingest_results/{body['ingest_job']}/{body['ingest_job']}_{name}.csv"
+    return s3.uploads.get(key)
+
+
+def test_records_carry_the_head_object_type_and_headers(monkeypatch, tmp_path):
+    objects = {"cat/coll/a.tif": md5("a.tif")}
+    body, s3, client = run(monkeypatch, tmp_path, objects, {"cat/coll/checksum/m.csv": manifest("a.tif")})
+    assert body["ingested"] == 1
+    (record,) = client.items
+    assert record["file_type"] == "image/tiff"
+    assert record["s3_file_metadata"]["x-amz-meta-origin"] == "scanner"
+    assert record["s3_file_path"] == "cat/coll/a.tif"
+    assert record["orig_file_path"] == "/vol/a.tif"
+    assert (record["md5"], record["sha1"]) == (md5("a.tif"), "sha-a.tif")
+    assert record["collection_identifier"] == "coll"
+    assert record["ingest_job"] == body["ingest_job"]
+    assert record["etag_check"] == "match"
+    assert record["file_ingested_date"]
+    assert s3.heads == ["cat/coll/a.tif"]
+
+
+def test_existing_and_missing_files_are_reported(monkeypatch, tmp_path):
+    objects = {"cat/coll/a.tif": md5("a.tif"), "cat/coll/b.tif": md5("b.tif")}
+    manifests = {"cat/coll/checksum/m.csv": manifest("a.tif", "b.tif", "gone.tif")}
+    body, s3, client = run(monkeypatch, tmp_path, objects, manifests, existing=["cat/coll/a.tif"])
+    assert (body["listed"], body["ingested"], body["existing"], body["not_found"]) == (3, 1, 1, 1)
+    assert results_file(s3, body, "previously_ingested") == "original_file_path,s3_key\n/vol/a.tif,cat/coll/a.tif\n"
+    assert results_file(s3, body, "not_found") == "original_file_path,s3_key\n/vol/gone.tif,not found\n"
+    assert [item["s3_file_path"] for item in client.items[1:]] == ["cat/coll/b.tif"]
+
+
+@pytest.mark.parametrize("manifests_at_once", [1, 2, 3])
+def test_results_keep_manifest_order_however_many_are_stored_at_once(monkeypatch, tmp_path, manifests_at_once):
+    objects, manifests = collection(5)
+    # the first manifest's write finishes last
+    body, s3, client = run(
+        monkeypatch, tmp_path, objects, manifests, slow_paths=["cat/coll/files/f0.tif"], FIXITY_MANIFESTS=manifests_at_once
+    )
+    assert (body["listed"], body["ingested"], body["existing"]) == (10, 6, 4)
+    ingested = results_file(s3, body, "ingested").splitlines()[1:]
+    assert ingested == [f"/vol/f{i}.tif,cat/coll/files/f{i}.tif" for i in range(6)]
+    existing = results_file(s3, body, "previously_ingested").splitlines()[1:]
+    assert existing == [f"/vol/f{i}.tif,cat/coll/files/f{i}.tif" for i in range(1, 5)]
+    assert 1 <= client.most_in_flight <= manifests_at_once
+    assert sorted(item["s3_file_path"] for item in client.items) == sorted(objects)
+
+
+def test_manifests_are_stored_concurrently(monkeypatch, tmp_path):
+    objects, manifests = collection(4)
+    slow_paths = [f"cat/coll/files/f{i}.tif" for i in range(0, 5, 2)]
+    body, s3, client = run(monkeypatch, tmp_path, objects, manifests, slow_paths=slow_paths, FIXITY_MANIFESTS=2)
+    assert body["ingested"] == 5
+    assert client.most_in_flight == 2
+
+
+def test_a_second_run_skips_settled_manifests(monkeypatch, tmp_path):
+    objects, manifests = collection(2)
+    run(monkeypatch, tmp_path, objects, manifests)
+    body, s3, client = run(monkeypatch, tmp_path, objects, manifests)
+    assert (body["listed"], body["unchanged"], body["ingested"]) == (4, 4, 0)
+    assert s3.heads == []
+
+
+class UploadS3:
+    def __init__(self):
+        self.uploads = []
+
+    def upload_fileobj(self, body, Bucket, Key):
+        # whether the spooled buffer had moved to disk when it was handed over
+        self.uploads.append((Bucket, Key, body._rolled, body.read().decode()))
+
+
+RESULTS = {("/vol/a.tif", "cat/coll/a.tif"): None, ('/vol/c, "d".jpg', "cat/coll/c, \"d\".jpg"): None}
+
+
+@pytest.mark.parametrize("spool_size, rolled", [(8 * 1024 ** 2, False), (16, True)])
+def test_write_results_to_s3(monkeypatch, spool_size, rolled):
+    s3 = UploadS3()
+    monkeypatch.setattr(checksum_handler, "s3_client", s3)
+    monkeypatch.setattr(checksum_handler, "RESULTS_SPOOL_SIZE", spool_size)
+    checksum_handler.write_results_to_s3("b", "cat/coll/ingest_results/job", "job", "ingested", RESULTS)
+    (upload,) = s3.uploads
+    assert upload == (
+        "b",
+        "cat/coll/ingest_results/job/job_ingested.csv",
+        rolled,
+        'original_file_path,s3_key\n/vol/a.tif,cat/coll/a.tif\n"/vol/c, ""d"".jpg","cat/coll/c, ""d"".jpg"\n',
+    )
+
+
+def test_write_results_to_s3_streams_large_results(monkeypatch):
+    s3 = UploadS3()
+    monkeypatch.setattr(checksum_handler, "s3_client", s3)
+    monkeypatch.setattr(checksum_handler, "RESULTS_SPOOL_SIZE", 1024)
+    results = ((f"/vol/é{i}.tif", f"cat/coll/é{i}.tif") for i in range(10000))
+    checksum_handler.write_results_to_s3("b", "results", "job", "not_found", results)
+    (_, _, rolled, text) = s3.uploads[0]
+    lines = text.splitlines()
+    assert rolled and len(lines) == 10001
+    assert lines[-1] == "/vol/é9999.tif,cat/coll/é9999.tif"
@@ -0,0 +1,78 @@
+import pandas as pd
+
+from utils.column_plan import ColumnPlan
+
+SINGLE = frozenset(["identifier", "title", "start_date", "explicit"])
+MULTI = frozenset(["creator", "subject", "embargo_note"])
+
+
+def set_attribute(attributes, header, value):
+    # stands in for the handler's lookups of ROW_HEADERS
+    attributes[f"row_{header}"] = value
+    return attributes
+
+
+def per_cell(row):
+    # how rows were normalized before ColumnPlan, one cell at a time
+    attributes = {}
+    for header, value in row.items():
+        if not isinstance(header, str) or header.strip() == "" or header.lower().startswith("unnamed"):
+            continue
+        if not ((isinstance(value, str) and value.strip() != "") or isinstance(value, bool)):
+            continue
+        header = header.strip()
+        value = str(value).strip().strip("\"").strip()
+        name = header.lower().replace(" ", "_")
+        name = "embargo_note" if name == "note" else name
+        if header in ("visibility", "explicit_content", "explicit"):
+            attributes[name] = value == "" or value.lower() == "true"
+        elif header in ("parent_collection_identifier", "thumbnail_path", "filename"):
+            attributes = set_attribute(attributes, header, value)
+        elif header in SINGLE:
+            attributes[name] = value
+        elif header in MULTI:
+            attributes[name] = [part.strip() for part in value.split("||")] if value.strip() else ""
+        else:
+            attributes[name] = None
+    return attributes
+
+
+def frame():
+    return pd.DataFrame(
+        {
+            "identifier": ["a1", " a2 ", "a3", "a4"],
+            "title": ['"Quoted"', "Plain", "   ", float("nan")],
+            "creator": ["Smith || Jones", "Doe", '" "', "One||Two ||  Three"],
+            "visibility": ["TRUE", "false", '""', "yes"],
+            "explicit": ["", "True", float("nan"), "no"],
+            "Note": ["kept", "", "x", "y"],
+            "filename": ["a1.pdf", float("nan"), "a3.jpg", " "],
+            "unknown_header": ["v", "", "w", float("nan")],
+            "Unnamed: 8": ["junk", "junk", "junk", "junk"],
+            " ": ["blank header", "", "", ""],
+        },
+        dtype=object,
+    )
+
+
+def test_rows_match_per_cell_normalization():
+    df = frame()
+    plan = ColumnPlan(df.columns, SINGLE, MULTI)
+    rows = dict(plan.rows(df, set_attribute))
+    for idx, row in df.iterrows():
+        assert rows[idx] == per_cell(row), idx
+
+
+def test_rows_keep_the_chunk_index():
+    df = frame()
+    df.index = pd.RangeIndex(1000, 1000 + len(df))
+    plan = ColumnPlan(df.columns, SINGLE, MULTI)
+    assert [idx for idx, attributes in plan.rows(df, set_attribute)] == [1000, 1001, 1002, 1003]
+
+
+def test_boolean_columns_read_as_booleans():
+    df = pd.DataFrame({"identifier": ["a", "b"], "visibility": [True, False]})
+    plan = ColumnPlan(df.columns, SINGLE, MULTI)
+    rows = dict(plan.rows(df, set_attribute))
+    assert rows[0]["visibility"] is True
+    assert rows[1]["visibility"] is False
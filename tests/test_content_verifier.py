@@ -0,0 +1,197 @@
+import base64
+import hashlib
+import random
+import zlib
+
+import pytest
+
+from fixity import content_verifier
+from fixity.content_verifier import READ_SIZE, ContentVerifier, ThroughputLimit
+from fixity.etag_check import multipart_etag
+
+DATA = random.Random(7).randbytes(2 * READ_SIZE + 12345)
+PART_SIZE = READ_SIZE + 4321
+
+
+class StubBody:
+    """A streaming body; a failing one breaks after its first chunk has been hashed."""
+
+    def __init__(self, data, fail=False):
+        self.data = data
+        self.fail = fail
+
+    def iter_chunks(self, size):
+        for start in range(0, len(self.data), size):
+            yield self.data[start:start + size]
+            if self.fail:
+                raise ConnectionError("connection reset")
+
+
+class StubS3:
+    """Ranged get_object over one object. `failures` maps a range start to how many reads of it break."""
+
+    def __init__(self, data, failures=None):
+        self.data = data
+        self.failures = dict(failures or {})
+        self.ranges = []
+
+    def get_object(self, Bucket, Key, Range):
+        start, end = (int(value) for value in Range[len("bytes="):].split("-"))
+        self.ranges.append((start, end))
+        fail = bool(self.failures.get(start))
+        if fail:
+            self.failures[start] -= 1
+        return {"Body": StubBody(self.data[start:end + 1], fail)}
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.data)}
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(content_verifier.time, "sleep", lambda seconds: None)
+
+
+def parts(data, part_size):
+    return [data[start:start + part_size] for start in range(0, len(data), part_size)]
+
+
+def b64(digest):
+    return base64.b64encode(digest).decode()
+
+
+def test_hashes_the_object_in_ranges():
+    s3 = StubS3(DATA)
+    md5, sha1, etag, part_checks = ContentVerifier(s3, range_size=READ_SIZE).hash_object("b", "k", len(DATA))
+    assert (md5, sha1) == (hashlib.md5(DATA).hexdigest(), hashlib.sha1(DATA).hexdigest())
+    assert (etag, part_checks) == (None, None)
+    assert s3.ranges == [(0, READ_SIZE - 1), (READ_SIZE, 2 * READ_SIZE - 1), (2 * READ_SIZE, len(DATA) - 1)]
+
+
+def test_range_size_is_at_least_one_read():
+    assert ContentVerifier(StubS3(DATA), range_size=10).range_size == READ_SIZE
+
+
+def test_rebuilds_the_multipart_etag_across_range_boundaries():
+    _, _, etag, _ = ContentVerifier(StubS3(DATA), range_size=READ_SIZE).hash_object("b", "k", len(DATA), PART_SIZE)
+    assert etag == multipart_etag([hashlib.md5(part).digest() for part in parts(DATA, PART_SIZE)])
+    assert etag.endswith("-3")
+
+
+@pytest.mark.parametrize(
+    "algorithm, part_hash",
+    [
+        ("sha1", lambda part: hashlib.sha1(part).digest()),
+        ("crc32", lambda part: zlib.crc32(part).to_bytes(4, "big")),
+    ],
+)
+def test_part_checksums(algorithm, part_hash):
+    verifier = ContentVerifier(StubS3(DATA), range_size=READ_SIZE)
+    _, _, _, part_checks = verifier.hash_object("b", "k", len(DATA), PART_SIZE, algorithm)
+    assert part_checks == [b64(part_hash(part)) for part in parts(DATA, PART_SIZE)]
+
+
+def test_a_failed_range_is_read_again_from_the_state_before_it():
+    s3 = StubS3(DATA, failures={READ_SIZE: 2})
+    verifier = ContentVerifier(s3, range_size=READ_SIZE, retries=2)
+    md5, sha1, etag, part_checks = verifier.hash_object("b", "k", len(DATA), PART_SIZE, "crc32")
+    assert (md5, sha1) == (hashlib.md5(DATA).hexdigest(), hashlib.sha1(DATA).hexdigest())
+    assert etag == multipart_etag([hashlib.md5(part).digest() for part in parts(DATA, PART_SIZE)])
+    assert part_checks == [b64(zlib.crc32(part).to_bytes(4, "big")) for part in parts(DATA, PART_SIZE)]
+    assert s3.ranges.count((READ_SIZE, 2 * READ_SIZE - 1)) == 3
+
+
+def test_gives_up_after_the_retries():
+    verifier = ContentVerifier(StubS3(DATA, failures={0: 3}), range_size=READ_SIZE, retries=2)
+    with pytest.raises(ConnectionError):
+        verifier.hash_object("b", "k", len(DATA))
+
+
+def multipart_record(**fields):
+    record = {
+        "s3_bucket": "b",
+        "s3_file_path": "k",
+        "md5": hashlib.md5(DATA).hexdigest().upper(),
+        "sha1": hashlib.sha1(DATA).hexdigest(),
+        "etag_part_size": PART_SIZE,
+        "s3_file_metadata": {
+            "etag": f'"{multipart_etag([hashlib.md5(part).digest() for part in parts(DATA, PART_SIZE)])}"',
+            "content-length": str(len(DATA)),
+        },
+        "part_checksums": {"algorithm": "sha1", "values": [b64(hashlib.sha1(part).digest()) for part in parts(DATA, PART_SIZE)]},
+    }
+    record.update(fields)
+    return record
+
+
+def test_verify_records_a_match():
+    record = ContentVerifier(StubS3(DATA), range_size=READ_SIZE).verify(multipart_record())
+    assert record["md5_verified"] and record["sha1_verified"]
+    assert record["fixity_mismatch"] == []
+    assert record["part_checksums_verified"] is True
+    assert record["etag_check"] == "multipart_match"
+    assert record["md5_matches_etag"] is True
+    assert "part_checksums" not in record
+
+
+def test_verify_records_mismatches():
+    record = multipart_record(sha1="0" * 40)
+    record["part_checksums"]["values"][1] = b64(b"\0" * 20)
+    record = ContentVerifier(StubS3(DATA), range_size=READ_SIZE).verify(record)
+    assert record["fixity_mismatch"] == ["sha1", "part_sha1"]
+    assert record["part_checksums_verified"] is False
+    assert record["etag_check"] == "multipart_match"
+
+
+def test_verify_fails_the_etag_when_the_manifest_md5_differs():
+    record = ContentVerifier(StubS3(DATA), range_size=READ_SIZE).verify(multipart_record(md5="0" * 32))
+    assert record["fixity_mismatch"] == ["md5"]
+    assert record["etag_check"] == "multipart_mismatch"
+    assert record["md5_matches_etag"] is False
+
+
+def test_verify_asks_s3_for_the_size_when_the_record_lacks_it():
+    record = {"s3_bucket": "b", "s3_file_path": "k", "md5": hashlib.md5(DATA).hexdigest(), "sha1": ""}
+    record = ContentVerifier(StubS3(DATA), range_size=READ_SIZE).verify(record)
+    assert record["md5_verified"] and not record["sha1_verified"]
+    assert "etag_check" not in record
+
+
+def test_verify_records_errors():
+    record = ContentVerifier(StubS3(DATA, failures={0: 5}), retries=1).verify(multipart_record())
+    assert record["verification_error"] == "connection reset"
+    assert "md5_verified" not in record
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_throughput_limit_holds_reads_to_the_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(content_verifier, "time", clock)
+    limit = ThroughputLimit(100)
+    # a full bucket's worth passes at once, then reads wait for the bucket to refill
+    for _ in range(5):
+        limit.consume(50)
+    assert clock.sleeps == [0.5, 0.5, 0.5]
+    clock.now += 10
+    limit.consume(100)
+    assert len(clock.sleeps) == 3
+
+
+def test_throughput_limit_is_off_without_a_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(content_verifier, "time", clock)
+    limit = ThroughputLimit(0)
+    limit.consume(10 ** 9)
+    assert clock.sleeps == []
@@ -0,0 +1,65 @@
+import io
+
+import pandas as pd
+import pytest
+
+import utils.csv_tools as csv_tools
+from utils.csv_tools import count_csv_rows, read_csv_chunks
+
+CSV = (
+    "identifier,title,date,count\n"
+    "007,\"Hello, world\",2020-01-02,1.0\n"
+    "a2,NaN,,10\n"
+    "a3,\"multi\nline\",2021,\n"
+    "a4,Plain,NaN,0042\n"
+    "a5,Last,2022-03,3\n"
+)
+
+
+def whole(chunks):
+    return pd.concat(list(chunks))
+
+
+def test_chunks_hold_at_most_chunksize_rows_with_a_running_index():
+    chunks = list(read_csv_chunks(io.BytesIO(CSV.encode()), chunksize=2))
+    assert [len(df) for df in chunks] == [2, 2, 1]
+    assert [list(df.index) for df in chunks] == [[0, 1], [2, 3], [4]]
+
+
+def test_values_are_read_as_written():
+    df = whole(read_csv_chunks(io.BytesIO(CSV.encode()), chunksize=2))
+    assert list(df["identifier"]) == ["007", "a2", "a3", "a4", "a5"]
+    assert list(df["count"])[:2] == ["1.0", "10"]
+    assert df["count"].iloc[3] == "0042"
+    assert df["title"].iloc[0] == "Hello, world"
+    assert df["title"].iloc[2] == "multi\nline"
+    assert all(dtype == object for dtype in df.dtypes)
+
+
+def test_only_nan_is_missing():
+    df = whole(read_csv_chunks(io.BytesIO(CSV.encode())))
+    assert pd.isna(df["title"].iloc[1])
+    assert pd.isna(df["date"].iloc[3])
+    assert df["date"].iloc[1] == ""
+    assert df["count"].iloc[2] == ""
+
+
+def test_reads_from_a_path(tmp_path):
+    path = tmp_path / "metadata.csv"
+    path.write_text(CSV)
+    assert len(whole(read_csv_chunks(str(path), chunksize=3))) == 5
+    assert count_csv_rows(str(path)) == 5
+
+
+def test_pyarrow_falls_back_to_pandas_when_not_installed(monkeypatch):
+    monkeypatch.setattr(csv_tools, "pa_csv", None)
+    chunks = list(read_csv_chunks(io.BytesIO(CSV.encode()), chunksize=2, engine="pyarrow"))
+    assert [len(df) for df in chunks] == [2, 2, 1]
+
+
+def test_pyarrow_engine_reads_the_same_values():
+    pytest.importorskip("pyarrow")
+    expected = whole(read_csv_chunks(io.BytesIO(CSV.encode())))
+    df = whole(read_csv_chunks(io.BytesIO(CSV.encode()), engine="pyarrow"))
+    assert list(df.index) == list(expected.index)
+    pd.testing.assert_frame_equal(df.fillna("<NA>"), expected.fillna("<NA>"), check_dtype=False)
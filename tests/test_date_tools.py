@@ -0,0 +1,85 @@
+from datetime import date, datetime
+
+import pytest
+from dateutil.parser import parse
+
+from utils import date_tools
+from utils.date_tools import index_date, parse_date, valid_date, valid_dates
+
+# the formats dates were validated against before, tried in turn
+FORMATS = ["%Y/%m/%d %H:%M:%S", "%Y/%m/%d", "%Y/%m", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%Y-%m", "%Y"]
+
+VALUES = [
+    "2020", "0999", "2020-01", "2020-1", "2020-01-02", "2020-1-2", "2020-01-02 03:04:05",
+    "2020-01-02 3:4:5", "2020/01", "2020/01/02", "2020/01/02 23:59:59", "2020-13-01",
+    "2020-02-30", "2020/02/29", "2019/02/29", "2020-01-02T03:04:05", "2020/01-02",
+    "20200102", "Jan 2 2020", "2020-01-02 24:00:00", "2020 ", " 2020", "", "abc",
+    "2020-01-02 03:04", "1999-12-31 23:59:60",
+]
+
+
+def strptime_valid(value):
+    for date_format in FORMATS:
+        try:
+            datetime.strptime(value, date_format)
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+def dateutil_result(value):
+    try:
+        return parse(value), None
+    except Exception as e:
+        return None, type(e)
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_valid_date_matches_trying_every_format(value):
+    assert valid_date(value) == strptime_valid(value)
+
+
+def test_valid_dates_accepts_blank_cells():
+    assert valid_dates(["2020", "", None, "nope"]) == [True, True, True, False]
+
+
+@pytest.mark.parametrize("value", VALUES)
+def test_parse_date_matches_dateutil(value):
+    expected, error = dateutil_result(value)
+    if error is None:
+        assert parse_date(value) == expected
+    else:
+        with pytest.raises(error):
+            parse_date(value)
+
+
+def test_parse_date_raises_each_time():
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            parse_date("2020-13-01")
+
+
+def test_index_date():
+    assert index_date("") == ("", None)
+    assert index_date("None") == ("", None)
+    assert index_date("2020") == ("2020", None)
+    assert index_date("2020-01-02 03:04:05") == ("2020/01/02", None)
+    result, error = index_date("not a date")
+    assert result is None and isinstance(error, ValueError)
+
+
+def test_partial_dates_are_cached_per_day(monkeypatch):
+    class Today(date):
+        day_of = date(2021, 3, 7)
+
+        @classmethod
+        def today(cls):
+            return cls.day_of
+
+    monkeypatch.setattr(date_tools, "date", Today)
+    assert parse_date("2020-05") == datetime(2020, 5, 7)
+    assert index_date("May 2020") == ("2020/05/07", None)
+    Today.day_of = date(2021, 3, 8)
+    assert parse_date("2020-05") == datetime(2020, 5, 8)
+    assert index_date("May 2020") == ("2020/05/08", None)
@@ -0,0 +1,97 @@
+from utils.dynamo_tools import batch_put_items
+
+
+class StubTable:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def put_item(self, Item):
+        if Item["id"] in self.client.rejected:
+            raise Exception("ValidationException")
+        self.client.written.append(Item["id"])
+
+
+class StubDynamo:
+    """batch_write_item that leaves `unprocessed` items unprocessed the first `unprocessed_rounds` times."""
+
+    def __init__(self, unprocessed=(), unprocessed_rounds=1, fail_batches=False, rejected=()):
+        self.unprocessed = set(unprocessed)
+        self.unprocessed_rounds = unprocessed_rounds
+        self.fail_batches = fail_batches
+        self.rejected = set(rejected)
+        self.written = []
+        self.calls = 0
+
+    def batch_write_item(self, RequestItems):
+        self.calls += 1
+        if self.fail_batches:
+            raise Exception("ProvisionedThroughputExceededException")
+        unprocessed = {}
+        for table_name, requests in RequestItems.items():
+            for request in requests:
+                item_id = request["PutRequest"]["Item"]["id"]
+                if item_id in self.unprocessed and self.unprocessed_rounds > 0:
+                    unprocessed.setdefault(table_name, []).append(request)
+                else:
+                    self.written.append(item_id)
+        self.unprocessed_rounds -= 1
+        return {"UnprocessedItems": unprocessed}
+
+    def Table(self, name):
+        return StubTable(self, name)
+
+
+def items(count):
+    return [{"id": f"item-{i}"} for i in range(count)]
+
+
+def test_writes_in_batches_of_25():
+    dynamo = StubDynamo()
+    results = batch_put_items(dynamo, "Archive", items(60))
+    assert dynamo.calls == 3
+    assert sorted(dynamo.written) == sorted(item["id"] for item in items(60))
+    assert all(results.values())
+
+
+def test_retries_unprocessed_items():
+    dynamo = StubDynamo(unprocessed={"item-3", "item-7"}, unprocessed_rounds=2)
+    results = batch_put_items(dynamo, "Archive", items(10))
+    assert dynamo.calls == 3
+    assert dynamo.written.count("item-3") == 1
+    assert results["item-3"] and results["item-7"]
+
+
+def test_failed_batch_falls_back_to_single_puts():
+    dynamo = StubDynamo(fail_batches=True, rejected={"item-2"})
+    results = batch_put_items(dynamo, "Archive", items(5))
+    assert results["item-2"] is False
+    assert [item_id for item_id, ok in results.items() if ok] == ["item-0", "item-1", "item-3", "item-4"]
+
+
+def test_items_still_unprocessed_after_retries_are_reported():
+    dynamo = StubDynamo(unprocessed={"item-1"}, unprocessed_rounds=10)
+    results = batch_put_items(dynamo, "Archive", items(3), max_retries=2, backoff=0)
+    assert dynamo.calls == 3
+    assert results == {"item-0": True, "item-1": False, "item-2": True}
+
+
+
+class StubClient:
+    """A resource's meta.client: no Table(), and put_item takes the table name."""
+
+    def __init__(self, **kwargs):
+        self.dynamo = StubDynamo(**kwargs)
+
+    def batch_write_item(self, RequestItems):
+        return self.dynamo.batch_write_item(RequestItems)
+
+    def put_item(self, TableName, Item):
+        self.dynamo.Table(TableName).put_item(Item=Item)
+
+
+def test_single_puts_go_through_a_client():
+    client = StubClient(fail_batches=True, rejected={"item-1"})
+    results = batch_put_items(client, "Archive", items(3))
+    assert results == {"item-0": True, "item-1": False, "item-2": True}
+    assert client.dynamo.written == ["item-0", "item-2"]
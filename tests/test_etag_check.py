@@ -0,0 +1,84 @@
+import hashlib
+import math
+
+import pytest
+
+from fixity.etag_check import COMMON_PART_SIZES, MiB, EtagChecker, guess_part_size, multipart_etag, split_etag
+
+
+@pytest.mark.parametrize(
+    "etag, expected",
+    [
+        ('"d41d8cd98f00b204e9800998ecf8427e"', ("d41d8cd98f00b204e9800998ecf8427e", None)),
+        ('"D41D8CD98F00B204E9800998ECF8427E-12"', ("d41d8cd98f00b204e9800998ecf8427e", 12)),
+        ("abc-xyz", ("abc", None)),
+        ("", ("", None)),
+        (None, ("", None)),
+    ],
+)
+def test_split_etag(etag, expected):
+    assert split_etag(etag) == expected
+
+
+def test_multipart_etag():
+    parts = [b"a" * 5, b"b" * 5, b"c"]
+    digests = [hashlib.md5(part).digest() for part in parts]
+    assert multipart_etag(digests) == f"{hashlib.md5(b''.join(digests)).hexdigest()}-3"
+
+
+@pytest.mark.parametrize("part_size", COMMON_PART_SIZES)
+def test_guess_part_size_finds_common_sizes(part_size):
+    size = part_size * 3 + 1
+    guessed = guess_part_size(size, 4)
+    assert math.ceil(size / guessed) == 4
+
+
+def test_guess_part_size_prefers_the_cli_default():
+    assert guess_part_size(20 * MiB, 3) == 8 * MiB
+
+
+def test_guess_part_size_falls_back_to_an_even_split():
+    # no common part size splits 3000 MiB into 1000 parts
+    assert guess_part_size(3000 * MiB, 1000) == 3 * MiB
+
+
+def test_guess_part_size_gives_up():
+    assert guess_part_size(10, 3) is None
+
+
+class NoCalls:
+    def __getattr__(self, name):
+        raise AssertionError(f"unexpected S3 call {name}")
+
+
+def record(etag, md5):
+    return {"s3_bucket": "b", "s3_file_path": "k", "md5": md5, "s3_file_metadata": {"etag": etag, "content-length": 20 * MiB}}
+
+
+def test_single_part_etags_are_compared():
+    checker = EtagChecker(NoCalls())
+    assert checker.check(record('"abc"', "ABC"))["etag_check"] == "match"
+    assert checker.check(record('"abc"', "abd"))["etag_check"] == "mismatch"
+    assert checker.check(record(None, "abc"))["etag_check"] == "no_etag"
+
+
+def test_multipart_without_verification_makes_no_calls():
+    checked = EtagChecker(NoCalls()).check(record('"abc-3"', "abc"))
+    assert checked["etag_check"] == "multipart_unverified"
+    assert checked["md5_matches_etag"] is None
+    assert "etag_part_size" not in checked
+
+
+class PartsS3:
+    def __init__(self, parts):
+        self.parts = parts
+
+    def get_object_attributes(self, **kwargs):
+        return {"ObjectSize": 20 * MiB, "ObjectParts": {"Parts": self.parts, "IsTruncated": False}}
+
+
+def test_multipart_with_verification_reads_the_part_layout():
+    parts = [{"PartNumber": n, "Size": 8 * MiB, "ChecksumSHA1": f"sha1-{n}"} for n in (1, 2, 3)]
+    checked = EtagChecker(PartsS3(parts), verify=True).check(record('"abc-3"', "abc"))
+    assert checked["etag_part_size"] == 8 * MiB
+    assert checked["part_checksums"] == {"algorithm": "sha1", "values": ["sha1-1", "sha1-2", "sha1-3"]}
@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from utils import ingest_jobs
+from utils.ingest_jobs import IngestJobs, JobLogFilter, JobProgress, current_job, job_status, write_job_status
+from utils.thread_context import with_context
+
+
+def test_track_counts_a_chunk_once_the_next_is_asked_for():
+    updates = []
+    progress = JobProgress(10, updates.append)
+    chunks = progress.track([[1, 2, 3], [4, 5]], "media")
+    next(chunks)
+    assert progress.rows_processed == 0
+    next(chunks)
+    assert progress.rows_processed == 3
+    assert list(chunks) == []
+    assert [update["rows_processed"] for update in updates] == [3, 5]
+    assert updates[-1]["stage"] == "media"
+
+
+def test_stage_is_kept_until_another_is_given():
+    progress = JobProgress(None, lambda snapshot: None)
+    progress.advance(1, "media")
+    progress.advance(1)
+    assert progress.snapshot()["stage"] == "media"
+    progress.advance(1, "metadata")
+    assert progress.snapshot()["stage"] == "metadata"
+
+
+def test_snapshot_estimates_the_time_left():
+    progress = JobProgress(100, lambda snapshot: None)
+    progress.started = time.monotonic() - 10
+    progress.advance(50)
+    snapshot = progress.snapshot()
+    assert snapshot["rows_total"] == 100
+    assert 4.5 < snapshot["rows_per_second"] < 5.5
+    assert 9 <= snapshot["eta_seconds"] <= 11
+
+
+def test_snapshot_without_a_total_has_no_estimate():
+    progress = JobProgress(None, lambda snapshot: None)
+    progress.advance(5)
+    assert progress.snapshot()["eta_seconds"] is None
+
+
+def test_job_log_filter_follows_work_into_pools():
+    job_filter = JobLogFilter("job-1")
+    record = logging.LogRecord("test", logging.INFO, __file__, 0, "message", None, None)
+
+    def in_job(job_id, submit):
+        current_job.set(job_id)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(submit(lambda: job_filter.filter(record))).result()
+
+    with ThreadPoolExecutor(max_workers=2) as jobs:
+        tracked = jobs.submit(in_job, "job-1", with_context)
+        other = jobs.submit(in_job, "job-2", with_context)
+        untracked = jobs.submit(in_job, "job-1", lambda fn: fn)
+        assert tracked.result() is True
+        assert other.result() is False
+        assert untracked.result() is False
+
+
+def ago(seconds):
+    return (datetime.now() - timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def test_a_job_without_a_heartbeat_is_marked_failed(tmp_path):
+    write_job_status("dead", {"job_id": "dead", "state": "running", "updated_at": ago(3600)}, tmp_path)
+    write_job_status("alive", {"job_id": "alive", "state": "running", "updated_at": ago(5)}, tmp_path)
+    write_job_status("waiting", {"job_id": "waiting", "state": "queued", "submitted_at": ago(3600)}, tmp_path)
+    write_job_status("done", {"job_id": "done", "state": "succeeded", "updated_at": ago(3600)}, tmp_path)
+    assert job_status("dead", tmp_path)["state"] == "failed"
+    assert "worker exited" in job_status("dead", tmp_path)["error"]
+    assert job_status("alive", tmp_path)["state"] == "running"
+    assert job_status("waiting", tmp_path)["state"] == "failed"
+    assert job_status("done", tmp_path)["state"] == "succeeded"
+
+
+def test_jobs_left_running_are_failed_on_startup(tmp_path):
+    write_job_status("dead", {"job_id": "dead", "state": "running", "updated_at": ago(3600)}, tmp_path)
+    jobs = IngestJobs(status_dir=str(tmp_path))
+    jobs.executor.shutdown()
+    with open(tmp_path / "dead.json") as f:
+        assert '"failed"' in f.read()
+
+
+def test_the_heartbeat_keeps_a_long_job_fresh(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_jobs, "HEARTBEAT_SECONDS", 0.05)
+    release = threading.Event()
+    jobs = IngestJobs(status_dir=str(tmp_path))
+    job_id = jobs.submit(lambda progress, results_dir: release.wait(5))
+    try:
+        # status times are in whole seconds
+        time.sleep(1.2)
+        status = job_status(job_id, str(tmp_path))
+        assert status["state"] == "running"
+        assert status["updated_at"] > status["started_at"]
+    finally:
+        release.set()
+        jobs.executor.shutdown(wait=True)
+    assert job_status(job_id, str(tmp_path))["state"] == "succeeded"
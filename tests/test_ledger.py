@@ -0,0 +1,50 @@
+import json
+
+from fixity.ledger import ManifestLedger, row_fingerprint
+
+
+def test_row_fingerprint_depends_on_every_value():
+    assert row_fingerprint(["a", "b"]) == row_fingerprint(["a", "b"])
+    assert row_fingerprint(["a", "b"]) != row_fingerprint(["a", "c"])
+    assert row_fingerprint(["ab", ""]) != row_fingerprint(["a", "b"])
+
+
+def test_fully_settled_manifest_is_skipped_until_it_changes(tmp_path):
+    ledger = ManifestLedger(str(tmp_path / "ledger.json"), "fixity")
+    assert not ledger.unchanged("bucket", "checksum/one.csv", '"etag-1"')
+    ledger.record("bucket", "checksum/one.csv", '"etag-1"', 2, {"r1", "r2"}, 3)
+    assert ledger.unchanged("bucket", "checksum/one.csv", '"etag-1"')
+    assert not ledger.unchanged("bucket", "checksum/one.csv", '"etag-2"')
+    assert not ledger.unchanged("bucket", "checksum/one.csv", None)
+    assert ledger.entry("bucket", "checksum/one.csv")["listed"] == 3
+
+
+def test_partly_settled_manifest_is_read_again(tmp_path):
+    ledger = ManifestLedger(str(tmp_path / "ledger.json"), "fixity")
+    ledger.record("bucket", "checksum/one.csv", '"etag-1"', 3, {"r1"}, 3)
+    assert not ledger.unchanged("bucket", "checksum/one.csv", '"etag-1"')
+    assert ledger.settled("bucket", "checksum/one.csv") == {"r1"}
+    assert ledger.settled("bucket", "checksum/other.csv") == set()
+
+
+def test_entries_are_kept_per_fixity_table(tmp_path):
+    path = str(tmp_path / "ledger.json")
+    ManifestLedger(path, "fixity").record("bucket", "checksum/one.csv", '"etag-1"', 1, {"r1"}, 1)
+    assert ManifestLedger(path, "fixity").unchanged("bucket", "checksum/one.csv", '"etag-1"')
+    assert not ManifestLedger(path, "other").unchanged("bucket", "checksum/one.csv", '"etag-1"')
+
+
+def test_saves_merge_with_entries_other_runs_wrote(tmp_path):
+    path = str(tmp_path / "ledger.json")
+    first = ManifestLedger(path, "fixity")
+    second = ManifestLedger(path, "fixity")
+    first.record("bucket", "checksum/one.csv", '"etag-1"', 1, {"r1"}, 1)
+    second.record("bucket", "checksum/two.csv", '"etag-2"', 1, {"r2"}, 1)
+    with open(path) as f:
+        assert len(json.load(f)) == 2
+
+
+def test_unreadable_ledger_starts_afresh(tmp_path):
+    path = tmp_path / "ledger.json"
+    path.write_text("{not json")
+    assert ManifestLedger(str(path), "fixity").entries == {}
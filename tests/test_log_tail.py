@@ -0,0 +1,81 @@
+from utils.log_tail import follow_lines, tail_lines
+
+
+def write_lines(path, count):
+    path.write_text("".join(f"line {i}\n" for i in range(count)))
+
+
+def test_tail_lines_reads_back_across_blocks(tmp_path):
+    path = tmp_path / "ingest.log"
+    write_lines(path, 500)
+    lines, end = tail_lines(str(path), 100, block_size=64)
+    assert lines == [f"line {i}\n" for i in range(400, 500)]
+    assert end == path.stat().st_size
+
+
+def test_tail_lines_of_a_short_file(tmp_path):
+    path = tmp_path / "ingest.log"
+    write_lines(path, 3)
+    assert tail_lines(str(path), 100, block_size=4)[0] == ["line 0\n", "line 1\n", "line 2\n"]
+
+
+def test_tail_lines_keeps_an_unfinished_last_line(tmp_path):
+    path = tmp_path / "ingest.log"
+    path.write_text("a\nb\nunfinished")
+    assert tail_lines(str(path), 2)[0] == ["b\n", "unfinished"]
+
+
+def test_tail_lines_of_an_empty_file(tmp_path):
+    path = tmp_path / "ingest.log"
+    path.write_text("")
+    assert tail_lines(str(path), 10) == ([], 0)
+
+
+def test_follow_lines_yields_complete_lines_with_their_end_offsets(tmp_path):
+    path = tmp_path / "ingest.log"
+    path.write_text("one\ntwo\nthr")
+    followed = follow_lines(str(path), 0, poll_interval=0, should_stop=lambda: True)
+    assert list(followed) == [(4, "one\n"), (8, "two\n")]
+
+
+def test_follow_lines_resumes_from_an_offset(tmp_path):
+    path = tmp_path / "ingest.log"
+    path.write_text("one\ntwo\nthree\n")
+    followed = follow_lines(str(path), 4, poll_interval=0, should_stop=lambda: True)
+    assert list(followed) == [(8, "two\n"), (14, "three\n")]
+
+
+def test_follow_lines_picks_up_appended_lines(tmp_path):
+    path = tmp_path / "ingest.log"
+    path.write_text("one\npar")
+    polls = []
+
+    def should_stop():
+        polls.append(None)
+        if len(polls) == 2:
+            with open(path, "a") as f:
+                f.write("tial\nlast\n")
+        return len(polls) > 2
+
+    followed = follow_lines(str(path), 0, poll_interval=0, should_stop=should_stop)
+    assert list(followed) == [(4, "one\n"), (12, "partial\n"), (17, "last\n")]
+
+
+def test_follow_lines_restarts_a_truncated_file(tmp_path):
+    path = tmp_path / "ingest.log"
+    path.write_text("new\n")
+    followed = follow_lines(str(path), 100, poll_interval=0, should_stop=lambda: True)
+    assert list(followed) == [(4, "new\n")]
+
+
+def test_follow_lines_keeps_idle_connections_alive(tmp_path):
+    path = tmp_path / "ingest.log"
+    path.write_text("")
+    polls = []
+
+    def should_stop():
+        polls.append(None)
+        return len(polls) > 3
+
+    followed = follow_lines(str(path), 0, poll_interval=0, keepalive=0, should_stop=should_stop)
+    assert list(followed) == [None, None, None]
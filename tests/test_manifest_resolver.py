@@ -0,0 +1,125 @@
+import os
+import time
+
+import requests
+
+from utils.manifest_resolver import ManifestResolver, prune_cache
+
+MANIFEST = {"thumbnail": {"@id": "https://img.example/thumb.jpg"}}
+
+
+class Response:
+    def __init__(self, status_code, body=None, etag=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {"ETag": etag} if etag else {}
+
+    def json(self):
+        return self.body
+
+
+class StubSession:
+    """Answers requests from `responses` in turn; an exception in the list is raised."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append((url, dict(headers or {})))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def resolver(tmp_path, responses, **kwargs):
+    resolver = ManifestResolver(cache_dir=str(tmp_path / "manifests"), backoff=0, **kwargs)
+    resolver.session = StubSession(responses)
+    return resolver
+
+
+def test_results_are_memoized_for_the_run(tmp_path):
+    first = resolver(tmp_path, [Response(200, MANIFEST)])
+    assert first.thumbnail("https://iiif.example/a") == "https://img.example/thumb.jpg"
+    assert first.get("https://iiif.example/a") == MANIFEST
+    assert len(first.session.requests) == 1
+
+
+def test_a_cached_etag_is_revalidated(tmp_path):
+    first = resolver(tmp_path, [Response(200, MANIFEST, etag='"v1"')])
+    first.get("https://iiif.example/a")
+    # a later run: not modified, so the body comes from the disk cache
+    second = resolver(tmp_path, [Response(304)])
+    assert second.get("https://iiif.example/a") == MANIFEST
+    assert second.session.requests == [("https://iiif.example/a", {"If-None-Match": '"v1"'})]
+    assert second.stats["not_modified"] == 1
+    # changed: the new body replaces the cached one
+    third = resolver(tmp_path, [Response(200, {"thumbnail": {"@id": "new"}}, etag='"v2"')])
+    assert third.thumbnail("https://iiif.example/a") == "new"
+    assert resolver(tmp_path, [Response(304)]).thumbnail("https://iiif.example/a") == "new"
+
+
+def test_a_body_without_an_etag_isnt_cached(tmp_path):
+    resolver(tmp_path, [Response(200, MANIFEST)]).get("https://iiif.example/a")
+    second = resolver(tmp_path, [Response(200, MANIFEST)])
+    second.get("https://iiif.example/a")
+    assert second.session.requests == [("https://iiif.example/a", {})]
+
+
+def test_transient_errors_are_retried(tmp_path):
+    flaky = resolver(tmp_path, [requests.Timeout("slow"), Response(503), Response(200, MANIFEST)])
+    assert flaky.get("https://iiif.example/a") == MANIFEST
+    assert flaky.stats["retried"] == 2
+
+
+def test_persistent_transient_errors_arent_memoized(tmp_path):
+    down = resolver(tmp_path, [Response(503), Response(502), Response(200, MANIFEST)], retries=1)
+    assert down.get("https://iiif.example/a") is None
+    assert "https://iiif.example/a" not in down.manifests
+    assert down.get("https://iiif.example/a") == MANIFEST
+
+
+def test_a_cached_body_is_used_while_the_server_is_down(tmp_path):
+    resolver(tmp_path, [Response(200, MANIFEST, etag='"v1"')]).get("https://iiif.example/a")
+    down = resolver(tmp_path, [requests.ConnectionError("refused")] * 3, retries=2)
+    assert down.get("https://iiif.example/a") == MANIFEST
+
+
+def test_not_found_is_memoized(tmp_path):
+    missing = resolver(tmp_path, [Response(404)])
+    assert missing.get("https://iiif.example/a") is None
+    assert missing.get("https://iiif.example/a") is None
+    assert len(missing.session.requests) == 1
+
+
+class StubInventory:
+    def __init__(self, keys):
+        self.keys = keys
+
+    def find(self, bucket, key, root=None):
+        return key if key in self.keys else None
+
+
+def test_manifests_missing_from_the_bucket_arent_requested(tmp_path):
+    checked = resolver(
+        tmp_path,
+        [Response(200, MANIFEST)],
+        img_root="https://img.example/",
+        bucket="dest",
+        inventory=StubInventory({"cat/coll/a/manifest.json"}),
+    )
+    assert checked.get("https://img.example/cat/coll/b/manifest.json") is None
+    assert checked.get("https://img.example/cat/coll/a/manifest.json") == MANIFEST
+    assert checked.stats["skipped"] == 1
+    assert len(checked.session.requests) == 1
+
+
+def test_prune_cache_drops_old_then_least_recently_used_entries(tmp_path):
+    now = time.time()
+    for name, age_days in (("old", 40), ("older_used", 3), ("newer_used", 1), ("newest_used", 0)):
+        path = tmp_path / f"{name}.json"
+        path.write_text("x" * 100)
+        os.utime(path, (now - age_days * 86400,) * 2)
+    prune_cache(str(tmp_path), max_age_days=30, max_bytes=200)
+    assert sorted(os.listdir(tmp_path)) == ["newer_used.json", "newest_used.json"]
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from utils.s3_tools import S3CopyEngine, S3Inventory
+
+
+class StubS3:
+    def __init__(self, failures=None, delay=0):
+        # dest key -> copy attempts that fail before one succeeds
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.copied = []
+        self.running = 0
+        self.most_running = 0
+        self.lock = threading.Lock()
+
+    def copy(self, source, bucket, key, Config=None):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if self.failures.get(key):
+                self.failures[key] -= 1
+                raise Exception("SlowDown")
+            with self.lock:
+                self.copied.append((source["Key"], key))
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def list_objects_v2(self, **kwargs):
+        return {"Contents": []}
+
+
+def test_copies_run_concurrently_up_to_max_workers_and_report_in_order():
+    s3 = StubS3(delay=0.02)
+    engine = S3CopyEngine(s3_client=s3, max_workers=3)
+    for i in range(12):
+        engine.submit("src", f"in/{i}", "dest", f"out/{i}")
+    report = engine.report()
+    engine.shutdown()
+    assert 1 < s3.most_running <= 3
+    assert [result["dest_key"] for result in report["results"]] == [f"out/{i}" for i in range(12)]
+    assert report["summary"] == {"copied": 12}
+
+
+def test_failed_copies_are_retried_then_reported():
+    s3 = StubS3(failures={"out/flaky": 1, "out/broken": 5})
+    engine = S3CopyEngine(s3_client=s3, max_workers=2, retries=2, backoff=0)
+    engine.submit("src", "in/flaky", "dest", "out/flaky")
+    engine.submit("src", "in/broken", "dest", "out/broken", overwrite=True)
+    flaky, broken = engine.report()["results"]
+    engine.shutdown()
+    assert (flaky["status"], flaky["attempts"]) == ("copied", 2)
+    assert (broken["status"], broken["attempts"]) == ("failed", 3)
+    assert broken["error"] == "SlowDown"
+
+
+def test_dry_run_copies_nothing():
+    s3 = StubS3()
+    succeeded = []
+    engine = S3CopyEngine(s3_client=s3, dry_run=True)
+    engine.submit("src", "in/a", "dest", "out/a", on_success=succeeded.append)
+    report = engine.report()
+    engine.shutdown()
+    assert s3.copied == [] and succeeded == []
+    assert report["summary"] == {"simulated": 1}
+
+
+def test_successful_copies_update_the_inventory_and_call_back():
+    s3 = StubS3()
+    inventory = S3Inventory(s3)
+    inventory.listing("dest", "out/", root="out/")
+    succeeded = []
+    engine = S3CopyEngine(s3_client=s3, inventory=inventory)
+    engine.submit("src", "in/a", "dest", "out/a", on_success=succeeded.append, source_meta={"Size": 3, "ETag": '"e"'})
+    engine.skip("src", "in/b", "dest", "out/b")
+    report = engine.report()
+    engine.shutdown()
+    assert succeeded == ["in/a"]
+    assert inventory.head("dest", "out/a") == {"Size": 3, "ETag": '"e"', "LastModified": None}
+    assert report["summary"] == {"copied": 1, "skipped": 1}
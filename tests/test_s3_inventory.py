@@ -0,0 +1,83 @@
+from utils.s3_tools import S3Inventory
+
+
+class StubS3:
+    """list_objects_v2 over `keys`, `page_size` keys per page."""
+
+    def __init__(self, keys, page_size=1000):
+        self.keys = sorted(keys)
+        self.page_size = page_size
+        self.calls = []
+
+    def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+        self.calls.append(Prefix)
+        keys = [key for key in self.keys if key.startswith(Prefix)]
+        start = int(ContinuationToken or 0)
+        page = keys[start:start + self.page_size]
+        response = {"Contents": [{"Key": key, "Size": len(key), "ETag": f'"{key}"'} for key in page]}
+        if start + self.page_size < len(keys):
+            response["NextContinuationToken"] = str(start + self.page_size)
+        return response
+
+
+KEYS = [
+    "cat/coll/checksum/one.csv",
+    "cat/coll/checksum/two.csv",
+    "cat/coll/item1/Image.TIF",
+    "cat/coll/item1/manifest.json",
+    "cat/coll/item10/a.tif",
+    "cat/coll/folder/",
+    "cat/other/x.csv",
+]
+
+
+def test_lookups_under_a_root_share_one_paginated_listing():
+    s3 = StubS3(KEYS, page_size=2)
+    inventory = S3Inventory(s3)
+    assert inventory.find("b", "cat/coll/item1/manifest.json", root="cat/coll/") == "cat/coll/item1/manifest.json"
+    assert inventory.match("b", "cat/coll/checksum/", ".csv", root="cat/coll/") == [
+        "cat/coll/checksum/one.csv",
+        "cat/coll/checksum/two.csv",
+    ]
+    assert inventory.head("b", "cat/coll/item10/a.tif", root="cat/coll/")["Size"] == len("cat/coll/item10/a.tif")
+    assert s3.calls == ["cat/coll/"] * 3
+    assert inventory.list_calls == 3
+
+
+def test_match_stays_within_the_prefix():
+    inventory = S3Inventory(StubS3(KEYS))
+    assert inventory.match("b", "cat/coll/item1/", root="cat/coll/") == [
+        "cat/coll/item1/Image.TIF",
+        "cat/coll/item1/manifest.json",
+    ]
+
+
+def test_find_falls_back_to_ignoring_case_but_not_to_folders():
+    inventory = S3Inventory(StubS3(KEYS))
+    assert inventory.find("b", "cat/coll/item1/image.tif", root="cat/coll/") == "cat/coll/item1/Image.TIF"
+    assert inventory.find("b", "cat/coll/FOLDER/", root="cat/coll/") is None
+    assert inventory.find("b", "cat/coll/missing.tif", root="cat/coll/") is None
+
+
+def test_a_prefix_outside_every_root_is_listed_on_its_own():
+    s3 = StubS3(KEYS)
+    inventory = S3Inventory(s3)
+    inventory.listing("b", "cat/coll/", root="cat/coll/")
+    assert inventory.find("b", "cat/other/x.csv") == "cat/other/x.csv"
+    assert s3.calls == ["cat/coll/", "cat/other/x.csv"]
+    inventory.listing("b", "cat/coll/anything")
+    inventory.listing("other-bucket", "cat/coll/")
+    assert s3.calls == ["cat/coll/", "cat/other/x.csv", "cat/coll/"]
+
+
+def test_record_keeps_listings_current_and_invalidate_drops_them():
+    s3 = StubS3(KEYS)
+    inventory = S3Inventory(s3)
+    inventory.listing("b", "cat/coll/", root="cat/coll/")
+    inventory.record("b", "cat/coll/item2/New.tif", size=5, etag='"e"')
+    assert inventory.find("b", "cat/coll/item2/new.tif", root="cat/coll/") == "cat/coll/item2/New.tif"
+    assert "cat/coll/item2/New.tif" in inventory.match("b", "cat/coll/item2/", root="cat/coll/")
+    assert inventory.head("b", "cat/coll/item2/New.tif")["ETag"] == '"e"'
+    inventory.invalidate("b")
+    inventory.listing("b", "cat/coll/", root="cat/coll/")
+    assert s3.calls == ["cat/coll/", "cat/coll/"]
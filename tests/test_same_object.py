@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from utils.s3_tools import same_object
+
+EARLY = datetime(2024, 1, 1, tzinfo=timezone.utc)
+LATE = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+def meta(size=10, etag='"abc"', modified=EARLY):
+    return {"Size": size, "ETag": etag, "LastModified": modified}
+
+
+@pytest.mark.parametrize(
+    "source, dest, expected",
+    [
+        (None, meta(), False),
+        (meta(), None, False),
+        (meta(size=None), meta(size=None), False),
+        (meta(size=10), meta(size=11), False),
+        (meta(etag='"abc"'), meta(etag="abc"), True),
+        (meta(etag='"abc"'), meta(etag='"abd"'), False),
+        # multipart ETags aren't kept by a copy, so the dates decide
+        (meta(etag='"abc-2"', modified=EARLY), meta(etag='"def"', modified=LATE), True),
+        (meta(etag='"abc"', modified=EARLY), meta(etag='"def-3"', modified=EARLY), True),
+        (meta(etag='"abc-2"', modified=LATE), meta(etag='"def"', modified=EARLY), False),
+        (meta(etag='"abc-2"', modified=None), meta(etag='"def"', modified=LATE), False),
+        (meta(etag=None), meta(etag=None), False),
+    ],
+)
+def test_same_object(source, dest, expected):
+    assert same_object(source, dest) is expected
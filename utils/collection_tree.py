@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+import logging
+
+logger = logging.getLogger()
+
+
+def children_by_parent(items):
+    """
+    Parent id -> child collections, from one pass over scanned Collection items.
+    Children keep scan order, which is the order the per-parent scans returned them in.
+    """
+    children = {}
+    for item in items:
+        parents = item.get("parent_collection") or []
+        if isinstance(parents, str):
+            parents = [parents]
+        for parent_id in dict.fromkeys(parents):
+            children.setdefault(parent_id, []).append(item)
+    return children
+
+
+def map_location(item):
+    return {
+        "id": item["id"],
+        "name": item["title"],
+        "custom_key": item.get("custom_key", "").replace("ark:/53696/", ""),
+    }
+
+
+def build_collection_map(root, children):
+    """
+    Builds the collectionmap `map_object` for `root` from a children_by_parent() index.
+    Walks the tree with an explicit stack, so deep hierarchies don't hit the recursion limit.
+    A collection that is its own ancestor is left out rather than walked forever.
+    """
+    root_location = map_location(root)
+    on_path = set()
+    # (None, collection id) entries mark leaving a collection's subtree
+    stack = [(root, root_location)]
+    while stack:
+        parent, location = stack.pop()
+        if parent is None:
+            on_path.discard(location)
+            continue
+        on_path.add(parent["id"])
+        stack.append((None, parent["id"]))
+        parent_children = children.get(parent["id"], [])
+        if not parent_children:
+            continue
+        location["children"] = []
+        pending = []
+        for child in parent_children:
+            if child["id"] in on_path:
+                logger.error(f"Collection {child['id']} is its own ancestor; leaving it out of the map")
+                continue
+            child_location = map_location(child)
+            location["children"].append(child_location)
+            pending.append((child, child_location))
+        # reversed, so children are walked in scan order
+        stack.extend(reversed(pending))
+    return root_location
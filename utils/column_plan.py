@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+import functools, json, logging, re
+
+logger = logging.getLogger()
+
+# marks a blank or missing cell, which leaves its attribute unset
+MISSING = object()
+MULTI_VALUE_SEPARATOR = re.compile(r"\s*\|\|\s*")
+
+BOOLEAN_HEADERS = ("visibility", "explicit_content", "explicit")
+# headers whose value depends on more than the cell (lookups, env paths, several attributes)
+ROW_HEADERS = ("parent_collection_identifier", "thumbnail_path", "filename")
+
+
+@functools.lru_cache(maxsize=None)
+def load_headers_keys(headers_file):
+    # headers_keys.json is read once per process, not once per metadata handler
+    with open(headers_file) as f:
+        headers_keys = json.load(f)
+    return frozenset(headers_keys["single_value_headers"]), frozenset(headers_keys["multi_value_headers"])
+
+
+def attribute_name(header):
+    name = header.lower().replace(" ", "_")
+    # Map "Note" to "embargo_note"
+    return "embargo_note" if name == "note" else name
+
+
+class ColumnPlan:
+    """
+    How each column of a metadata csv becomes a record attribute, worked out once per file.
+
+    Cells are cleaned a column at a time: blank and missing cells are dropped, values are
+    stripped of whitespace and quotes, boolean headers are coerced and multi-value headers
+    are split on "||". rows() then assembles each record from the cleaned columns.
+    Headers in ROW_HEADERS are left to the handler's set_attribute(), one cell at a time.
+    Produces the same records as cleaning each row's cells one at a time: a valid header,
+    a non-blank value stripped of whitespace and quotes, then set_attribute().
+    """
+
+    def __init__(self, columns, single_value_headers, multi_value_headers):
+        self.columns = []
+        for position, column in enumerate(columns):
+            if not isinstance(column, str) or column.strip() == "" or column.lower().startswith("unnamed"):
+                continue
+            header = column.strip()
+            if header in ROW_HEADERS:
+                kind = "row"
+            elif header in BOOLEAN_HEADERS:
+                kind = "boolean"
+            elif header in single_value_headers:
+                kind = "single"
+            elif header in multi_value_headers:
+                kind = "multi"
+            else:
+                kind = "unknown"
+            self.columns.append((position, header, attribute_name(header), kind))
+
+    def clean(self, values, kind):
+        # one pass over the column; MISSING where the row has no usable value
+        if values.dtype == bool:
+            values = values.astype(str)
+        cleaned = [
+            value.strip().strip("\"").strip()
+            if isinstance(value, str) and value and not value.isspace()
+            else MISSING
+            for value in values.tolist()
+        ]
+        if kind == "boolean":
+            return [value if value is MISSING else (value == "" or value.lower() == "true") for value in cleaned]
+        if kind == "multi":
+            # the value is already stripped, so splitting on "||" and its surrounding whitespace strips each part
+            return [value if value is MISSING or value == "" else MULTI_VALUE_SEPARATOR.split(value) for value in cleaned]
+        if kind == "unknown":
+            return [value if value is MISSING else None for value in cleaned]
+        return cleaned
+
+    def rows(self, df, set_attribute):
+        """
+        Yields (row number, attribute dict) for each row of the chunk `df`.
+        `set_attribute(dict, header, value)` handles the ROW_HEADERS cells.
+        """
+        columns = [
+            (header, name, kind == "row", self.clean(df.iloc[:, position], kind))
+            for position, header, name, kind in self.columns
+        ]
+        for position, idx in enumerate(df.index):
+            attributes = {}
+            for header, name, per_row, values in columns:
+                value = values[position]
+                if value is MISSING:
+                    continue
+                if per_row:
+                    attributes = set_attribute(attributes, header, value)
+                else:
+                    attributes[name] = value
+            yield idx, attributes
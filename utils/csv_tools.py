@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+import boto3, csv, logging
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+logger = logging.getLogger()
+
+DEFAULT_CHUNK_SIZE = 1000
+PYARROW_BLOCK_SIZE = 1 << 20
+
+
+def read_csv_chunks(source, chunksize=DEFAULT_CHUNK_SIZE, engine=None):
+    """
+    Yields a metadata CSV as DataFrames of at most `chunksize` rows, so only one
+    chunk is in memory at a time. `source` is a file path or a binary file object,
+    such as an open file or an S3 StreamingBody, and is read as it is parsed.
+
+    Every column is read as text: a chunk can't infer a column's type from rows it
+    hasn't seen, and text keeps values exactly as written in the CSV. Only "NaN"
+    is read as missing, as before.
+
+    engine="pyarrow" parses with pyarrow's multi-threaded streaming reader. pyarrow
+    is optional and not in requirements.txt; without it the pandas parser is used.
+    Its chunks are sized in bytes, not rows.
+    """
+    chunksize = max(1, int(chunksize or DEFAULT_CHUNK_SIZE))
+    if engine == "pyarrow":
+        if pa_csv is not None:
+            yield from read_csv_chunks_pyarrow(source)
+            return
+        logger.warning("CSV_ENGINE is pyarrow but pyarrow isn't installed; using the default CSV parser")
+    with pd.read_csv(
+        source,
+        chunksize=chunksize,
+        na_values="NaN",
+        keep_default_na=False,
+        encoding="utf-8",
+        dtype=str,
+    ) as reader:
+        yield from reader
+
+
+def read_csv_chunks_pyarrow(source):
+    stream = open(source, "rb") if isinstance(source, str) else source
+    try:
+        # the header is read here so that every column can be typed as a string up front
+        header = next(csv.reader([stream.readline().decode("utf-8")]), [])
+        if not header:
+            return
+        reader = pa_csv.open_csv(
+            stream,
+            read_options=pa_csv.ReadOptions(column_names=header, block_size=PYARROW_BLOCK_SIZE),
+            convert_options=pa_csv.ConvertOptions(
+                column_types={name: pa.string() for name in header},
+                null_values=["NaN"],
+                strings_can_be_null=True,
+            ),
+        )
+        start = 0
+        for batch in reader:
+            df = batch.to_pandas()
+            # keep row numbers running across chunks, like the pandas reader does
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+            yield df
+    finally:
+        if stream is not source:
+            stream.close()
+
+
+def count_csv_rows(filename):
+    # data rows rather than lines, since quoted values can hold newlines; blank lines are skipped, as pandas does
+    try:
+        with open(filename, newline="", encoding="utf-8") as f:
+            return max(0, sum(1 for row in csv.reader(f) if row) - 1)
+    except Exception as e:
+        logger.warning(f"Couldn't count the rows of {filename}: {e}")
+        return None
+
+
+def metadata_body(filename, bucket=None, s3_client=None):
+    # The S3 GetObject response for `filename` in `bucket`, its Body read as it's parsed;
+    # a local file is opened into the same shape, so both are read the same way
+    if bucket:
+        return (s3_client or boto3.client("s3")).get_object(Bucket=bucket, Key=filename)
+    return {"Body": open(filename, "rb")}
+
+
+def close_body(response):
+    try:
+        response["Body"].close()
+    except Exception:
+        pass
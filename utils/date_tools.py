@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+import functools, logging, re
+from datetime import date, datetime, time
+from dateutil.parser import parse
+
+logger = logging.getLogger()
+
+# The formats validate_archive_dates() accepts, keyed by their separators in order.
+# A value can only match the format its separators select, so that is the only one tried.
+DATE_FORMATS = {
+    "//::": "%Y/%m/%d %H:%M:%S",
+    "//": "%Y/%m/%d",
+    "/": "%Y/%m",
+    "--::": "%Y-%m-%d %H:%M:%S",
+    "--": "%Y-%m-%d",
+    "-": "%Y-%m",
+    "": "%Y",
+}
+SEPARATORS = re.compile(r"[/:-]")
+# full dates that dateutil reads the same way strptime does
+FULL_DATE = re.compile(r"(\d{4})([/-])(\d{1,2})\2(\d{1,2})(?:\s+(\d{1,2}):(\d{1,2}):(\d{1,2}))?")
+YEAR = re.compile(r"\d{4}")
+
+
+@functools.lru_cache(maxsize=65536)
+def valid_date(value):
+    # True if one of DATE_FORMATS parses `value`
+    date_format = DATE_FORMATS.get("".join(SEPARATORS.findall(value)))
+    if date_format is None:
+        return False
+    try:
+        datetime.strptime(value, date_format)
+        return True
+    except ValueError:
+        return False
+
+
+def valid_dates(values):
+    # validates a whole column; blank cells count as valid, as a missing field does
+    return [not value or valid_date(value) for value in values]
+
+
+def parse_date(value):
+    """
+    dateutil's parse(), memoized. Raises what parse() raises.
+    Plain year-month-day values, with or without a time, are read by FULL_DATE instead.
+    parse() fills missing fields of partial dates from today, so results are cached per day.
+    """
+    parsed, error = parse_date_cached(value, date.today())
+    if error is not None:
+        # a fresh exception each time, so a cached one doesn't collect tracebacks
+        raise error[0](*error[1])
+    return parsed
+
+
+@functools.lru_cache(maxsize=65536)
+def parse_date_cached(value, today):
+    match = FULL_DATE.fullmatch(value)
+    if match and int(match.group(1)) >= 1000:
+        year, _, month, day, hour, minute, second = match.groups()
+        try:
+            return datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0)), None
+        except ValueError:
+            pass
+    try:
+        # the default parse() uses itself, pinned to the day the result is cached under
+        return parse(value, default=datetime.combine(today, time())), None
+    except Exception as e:
+        return None, (type(e), e.args)
+
+
+def index_date(value):
+    """
+    The search index form of a date: "" for a blank value, a bare year as is, otherwise
+    "yyyy/MM/dd". Returns (index date, None), or (None, the exception parsing raised).
+    """
+    return index_date_cached(value, date.today())
+
+
+@functools.lru_cache(maxsize=65536)
+def index_date_cached(value, today):
+    if value is None or str(value).strip().lower() == "none" or not str(value).strip():
+        return "", None
+    if YEAR.fullmatch(value):
+        return value, None
+    parsed, error = parse_date_cached(value, today)
+    if error is not None:
+        return None, error[0](*error[1])
+    return parsed.strftime("%Y/%m/%d"), None
+
+
+def index_dates(values):
+    # normalizes a whole column; each distinct value is parsed once
+    return [index_date(value) for value in values]
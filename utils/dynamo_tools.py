@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+import logging, time
+from collections import Counter
+from boto3.dynamodb.conditions import Key
+from concurrent.futures import ThreadPoolExecutor
+from utils.thread_context import with_context
+
+logger = logging.getLogger()
+
+# DynamoDB BatchWriteItem accepts at most 25 put/delete requests per call
+MAX_BATCH_WRITE = 25
+
+
+def batch_put_items(dynamodb, table_name, items, key_name="id", max_retries=5, backoff=0.05):
+    """
+    Write items with BatchWriteItem, 25 at a time, retrying UnprocessedItems with
+    exponential backoff. `dynamodb` is a boto3 DynamoDB service resource, or a
+    resource's meta.client when called from several threads.
+    If a BatchWriteItem call raises (one item that can't be serialized fails the
+    whole call), that chunk's remaining items are written one PutItem at a time,
+    so only the bad item fails.
+    Returns {key value: True/False} so callers can report success per item.
+    """
+    results = {}
+    for start in range(0, len(items), MAX_BATCH_WRITE):
+        chunk = items[start:start + MAX_BATCH_WRITE]
+        requests = [{"PutRequest": {"Item": item}} for item in chunk]
+        attempts = 0
+        while requests:
+            try:
+                response = dynamodb.batch_write_item(RequestItems={table_name: requests})
+            except Exception as e:
+                logger.error(f"BatchWriteItem to {table_name} failed, writing its items one at a time: {e}")
+                for request in requests:
+                    item = request["PutRequest"]["Item"]
+                    results[item[key_name]] = put_item(dynamodb, table_name, item)
+                requests = []
+                break
+            requests = response.get("UnprocessedItems", {}).get(table_name, [])
+            if requests:
+                attempts += 1
+                if attempts > max_retries:
+                    break
+                time.sleep(backoff * (2 ** (attempts - 1)))
+        unprocessed = set(request["PutRequest"]["Item"][key_name] for request in requests)
+        for item in chunk:
+            results.setdefault(item[key_name], item[key_name] not in unprocessed)
+    return results
+
+
+def put_item(dynamodb, table_name, item):
+    # `dynamodb` is the service resource or a resource's meta.client, both take plain values
+    try:
+        if hasattr(dynamodb, "Table"):
+            dynamodb.Table(table_name).put_item(Item=item)
+        else:
+            dynamodb.put_item(TableName=table_name, Item=item)
+        return True
+    except Exception as e:
+        logger.error(f"PutItem to {table_name} failed: {e}")
+        return False
+
+
+def query_index_concurrently(client, table_name, key_name, values, index_name=None, max_workers=8):
+    """
+    Look up many key values at once by running one Limit=1 query per value on a
+    pool of threads. `client` is a DynamoDB resource's `meta.client`: clients are
+    thread safe, unlike resources, and this one still takes and returns plain
+    Python values. Returns {value: item or None}; values whose query failed are
+    left out so the caller can fall back to a normal lookup.
+    """
+    def query(value):
+        kwargs = {
+            "TableName": table_name,
+            "KeyConditionExpression": "#k = :v",
+            "ExpressionAttributeNames": {"#k": key_name},
+            "ExpressionAttributeValues": {":v": value},
+            "Limit": 1,
+        }
+        if index_name:
+            kwargs["IndexName"] = index_name
+        response = client.query(**kwargs)
+        items = response.get("Items", [])
+        return items[0] if items else None
+
+    found = {}
+    values = list(dict.fromkeys(v for v in values if v))
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        futures = {value: executor.submit(with_context(query), value) for value in values}
+        for value, future in futures.items():
+            try:
+                found[value] = future.result()
+            except Exception as e:
+                logger.error(f"Error querying {table_name} for {key_name}={value}: {e}")
+    return found
+
+
+def get_table_access(env, table):
+    # One TableAccess per table per run. ingest.main() resets the registry at the start of each run.
+    if env.get("table_access") is None:
+        env["table_access"] = {}
+    if table.name not in env["table_access"]:
+        env["table_access"][table.name] = TableAccess(table)
+    return env["table_access"][table.name]
+
+
+class TableAccess:
+    """
+    Read access to one DynamoDB table. The key schema and GSIs are described once
+    and cached, so lookups cost a single request: a GetItem for the table's hash
+    key, or a Limit=1 Query on the GSI whose name or hash key matches.
+    Requests are counted per operation in `calls`.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.name = table.name
+        self.calls = Counter()
+        self.hash_key = None
+        self.indexes = None
+
+    def load_schema(self):
+        if self.indexes is not None:
+            return
+        self.indexes = {}
+        try:
+            self.calls["describe_table"] += 1
+            description = self.table.meta.client.describe_table(TableName=self.name)["Table"]
+            self.hash_key = self.key_from_schema(description["KeySchema"])
+            for index in description.get("GlobalSecondaryIndexes", []):
+                self.indexes[index["IndexName"]] = self.key_from_schema(index["KeySchema"])
+        except Exception as e:
+            logger.error(f"Error describing table {self.name}: {str(e)}")
+
+    def key_from_schema(self, key_schema):
+        for key in key_schema:
+            if key["KeyType"] == "HASH":
+                return key["AttributeName"]
+        return None
+
+    def index_for(self, key_name):
+        """
+        Returns (index name or None, key attribute) for a lookup by `key_name`,
+        which may be an index name ("Identifier") or an attribute name ("identifier").
+        """
+        self.load_schema()
+        if key_name in self.indexes:
+            return key_name, self.indexes[key_name]
+        key_attr = key_name.lower()
+        if key_attr == self.hash_key:
+            return None, key_attr
+        for index_name, index_key in self.indexes.items():
+            if index_key == key_attr:
+                return index_name, index_key
+        return None, key_attr
+
+    def query_one(self, key_name, value):
+        index_name, key_attr = self.index_for(key_name)
+        if index_name is None and key_attr == self.hash_key:
+            self.calls["get_item"] += 1
+            return self.table.get_item(Key={key_attr: value}).get("Item")
+        kwargs = {"KeyConditionExpression": Key(key_attr).eq(value), "Limit": 1}
+        if index_name:
+            kwargs["IndexName"] = index_name
+        self.calls["query"] += 1
+        response = self.table.query(**kwargs)
+        if "Items" in response and len(response["Items"]) == 1:
+            return response["Items"][0]
+        return None
+
+
+def batch_delete_keys(dynamodb, table_name, keys, max_retries=5, backoff=0.05):
+    # Delete counterpart of batch_put_items(); `keys` are full primary key dicts.
+    # `dynamodb` is the service resource or a resource's meta.client, both take plain values.
+    for start in range(0, len(keys), MAX_BATCH_WRITE):
+        requests = [{"DeleteRequest": {"Key": key}} for key in keys[start:start + MAX_BATCH_WRITE]]
+        attempts = 0
+        while requests:
+            try:
+                response = dynamodb.batch_write_item(RequestItems={table_name: requests})
+            except Exception as e:
+                logger.error(f"BatchWriteItem delete from {table_name} failed: {e}")
+                break
+            requests = response.get("UnprocessedItems", {}).get(table_name, [])
+            if requests:
+                attempts += 1
+                if attempts > max_retries:
+                    logger.error(f"{len(requests)} delete(s) from {table_name} left unprocessed")
+                    break
+                time.sleep(backoff * (2 ** (attempts - 1)))
@@ -0,0 +1,276 @@
+import contextvars, json, logging, os, shutil, tempfile, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger()
+
+DEFAULT_JOB_DIR = os.getenv("INGEST_JOB_DIR") or os.path.join(tempfile.gettempdir(), "dlp-ingest", "jobs")
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_RETENTION_DAYS = 14
+# a process beats for each job it holds; a queued or running job not heard from in
+# STALE_AFTER_SECONDS has lost its worker (the process exited or was killed)
+HEARTBEAT_SECONDS = 60
+STALE_AFTER_SECONDS = int(os.getenv("INGEST_JOB_STALE_SECONDS") or 600)
+JOB_LOG_FORMAT = logging.Formatter("%(asctime)s %(levelname)-8s %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
+
+# the ingest job the current thread is working for
+current_job = contextvars.ContextVar("current_job", default=None)
+# ids of the jobs running in this process
+active_jobs = set()
+# ids of the jobs queued or running in this process, which its heartbeat keeps fresh
+held_jobs = set()
+
+ingest_jobs = None
+jobs_lock = threading.Lock()
+
+
+def get_ingest_jobs():
+    # one pool per web worker process; status files let any worker answer for any job
+    global ingest_jobs
+    with jobs_lock:
+        if ingest_jobs is None:
+            ingest_jobs = IngestJobs(
+                max_workers=os.getenv("INGEST_JOB_WORKERS") or DEFAULT_JOB_WORKERS,
+                retention_days=os.getenv("INGEST_JOB_RETENTION_DAYS") or DEFAULT_RETENTION_DAYS,
+            )
+        return ingest_jobs
+
+
+def job_status(job_id, status_dir=DEFAULT_JOB_DIR):
+    try:
+        with open(os.path.join(status_dir, f"{os.path.basename(job_id)}.json")) as f:
+            status = json.load(f)
+    except FileNotFoundError:
+        return None
+    return fail_if_stale(status, status_dir)
+
+
+def fail_if_stale(status, status_dir=DEFAULT_JOB_DIR):
+    # a queued or running job whose heartbeat stopped is recorded as failed, so it doesn't show as running forever
+    if status.get("state") not in ("queued", "running") or status.get("job_id") in held_jobs:
+        return status
+    last_seen = status.get("updated_at") or status.get("submitted_at")
+    try:
+        silent = (datetime.now() - datetime.strptime(last_seen, "%Y-%m-%dT%H:%M:%S")).total_seconds()
+    except (TypeError, ValueError):
+        return status
+    if silent < STALE_AFTER_SECONDS:
+        return status
+    logger.error(f"Ingest job {status.get('job_id')} was {status['state']} with no heartbeat since {last_seen}, marking it failed")
+    status.update(
+        state="failed",
+        finished_at=now(),
+        error=f"The ingest job stopped while {status['state']}: its worker exited without finishing it",
+    )
+    write_job_status(status["job_id"], status, status_dir)
+    return status
+
+
+def fail_stale_jobs(status_dir=DEFAULT_JOB_DIR):
+    # run when a process starts taking jobs, for the ones a previous process left behind
+    try:
+        names = os.listdir(status_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith(".json"):
+            job_status(name[: -len(".json")], status_dir)
+
+
+def write_job_status(job_id, status, status_dir=DEFAULT_JOB_DIR):
+    try:
+        os.makedirs(status_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=status_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(status, f, default=str)
+        os.replace(tmp_path, os.path.join(status_dir, f"{job_id}.json"))
+    except Exception as e:
+        logger.error(f"Error writing status of ingest job {job_id}: {e}")
+
+
+def job_dir(job_id, status_dir=DEFAULT_JOB_DIR):
+    # the job's log and results files
+    return os.path.join(status_dir, os.path.basename(job_id))
+
+
+def job_log_file(job_id, status_dir=DEFAULT_JOB_DIR):
+    return os.path.join(job_dir(job_id, status_dir), "ingest.log")
+
+
+def job_results_dir(job_id, status_dir=DEFAULT_JOB_DIR):
+    return os.path.join(job_dir(job_id, status_dir), "results")
+
+
+def cleanup_jobs(status_dir=DEFAULT_JOB_DIR, retention_days=DEFAULT_RETENTION_DAYS, kind="ingest job"):
+    # removes the status, log and results of jobs that finished more than retention_days ago;
+    # also used for the fixity stage's status files, which have no job directory
+    cutoff = time.time() - float(retention_days) * 86400
+    try:
+        names = os.listdir(status_dir)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        job_id = name[: -len(".json")]
+        path = os.path.join(status_dir, name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            status = job_status(job_id, status_dir) or {}
+            if status.get("state") in ("queued", "running") and job_id in active_jobs:
+                continue
+            shutil.rmtree(job_dir(job_id, status_dir), ignore_errors=True)
+            os.remove(path)
+            logger.info(f"Removed {kind} {job_id}, finished over {retention_days} day(s) ago")
+        except Exception as e:
+            logger.error(f"Error removing {kind} {job_id}: {e}")
+
+
+class JobLogFilter(logging.Filter):
+    """
+    Passes the log records of one ingest job: those logged by a thread whose
+    current_job is the job. Work the job hands to thread pools is submitted with
+    utils.thread_context.with_context(), so its records carry the job id too.
+    """
+
+    def __init__(self, job_id):
+        super().__init__()
+        self.job_id = job_id
+
+    def filter(self, record):
+        return current_job.get() == self.job_id
+
+
+class JobProgress:
+    """
+    Rows an ingest job has processed, counted a metadata CSV chunk at a time.
+    A run reads the CSV once per stage (media, then metadata), so rows_total
+    is the CSV's row count times the number of stages.
+    """
+
+    def __init__(self, rows_total, on_update):
+        self.rows_total = rows_total
+        self.rows_processed = 0
+        self.stage = None
+        self.started = time.monotonic()
+        self.on_update = on_update
+        self.lock = threading.Lock()
+
+    def track(self, chunks, stage):
+        for df in chunks:
+            yield df
+            # the chunk's rows are done once the next one is asked for
+            self.advance(len(df), stage)
+
+    def advance(self, rows, stage=None):
+        with self.lock:
+            self.rows_processed += rows
+            self.stage = stage or self.stage
+            snapshot = self.snapshot()
+        self.on_update(snapshot)
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.rows_processed / elapsed if elapsed > 0 else 0
+        eta = None
+        if self.rows_total and rate > 0:
+            eta = round(max(0, self.rows_total - self.rows_processed) / rate)
+        return {
+            "stage": self.stage,
+            "rows_processed": self.rows_processed,
+            "rows_total": self.rows_total,
+            "rows_per_second": round(rate, 2),
+            "eta_seconds": eta,
+        }
+
+
+class IngestJobs:
+    """
+    Runs ingests on a bounded pool of worker threads, outside the web request.
+
+    submit() returns a job id at once; the job's state (queued, running, succeeded or
+    failed), progress and result are kept in a status file under `status_dir`, which
+    job_status() reads. Jobs beyond `max_workers` wait in the pool's queue.
+    Each job logs to its own file and writes its results to its own directory, under
+    job_dir(); jobs that finished more than `retention_days` ago are removed.
+    While this process holds a job, a heartbeat thread refreshes its status every
+    HEARTBEAT_SECONDS, so job_status() can tell a job whose worker died from a slow one.
+    """
+
+    def __init__(self, max_workers=DEFAULT_JOB_WORKERS, status_dir=DEFAULT_JOB_DIR, retention_days=DEFAULT_RETENTION_DAYS):
+        self.max_workers = max(1, int(max_workers))
+        self.status_dir = status_dir
+        self.retention_days = float(retention_days)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ingest-job")
+        self.status_lock = threading.Lock()
+        self.heartbeat = None
+        fail_stale_jobs(self.status_dir)
+
+    def submit(self, run, rows_total=None, **details):
+        """
+        Queues run(progress, results_dir) and returns the job's id. `run` gets the job's
+        JobProgress and results directory and returns the job's result; `details` are
+        recorded in its status as given.
+        """
+        cleanup_jobs(self.status_dir, self.retention_days)
+        job_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(job_results_dir(job_id, self.status_dir), exist_ok=True)
+        self.write_status(job_id, dict(details, job_id=job_id, state="queued", rows_total=rows_total, submitted_at=now()))
+        with self.status_lock:
+            held_jobs.add(job_id)
+            if self.heartbeat is None:
+                self.heartbeat = threading.Thread(target=self.beat, name="ingest-job-heartbeat", daemon=True)
+                self.heartbeat.start()
+        self.executor.submit(self.run, job_id, run, rows_total)
+        return job_id
+
+    def beat(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            with self.status_lock:
+                # only this pool's jobs, which have a status file under its status_dir
+                held = [job_id for job_id in held_jobs if job_status(job_id, self.status_dir) is not None]
+            for job_id in held:
+                self.update_status(job_id)
+
+    def run(self, job_id, run, rows_total):
+        current_job.set(job_id)
+        active_jobs.add(job_id)
+        handler = self.attach_log(job_id)
+        progress = JobProgress(rows_total, lambda snapshot: self.update_status(job_id, **snapshot))
+        self.update_status(job_id, state="running", started_at=now())
+        try:
+            result = run(progress, job_results_dir(job_id, self.status_dir))
+            self.update_status(job_id, **progress.snapshot(), state="succeeded", finished_at=now(), result=result)
+        except Exception as e:
+            logger.error(f"Ingest job {job_id} failed: {e}")
+            self.update_status(job_id, **progress.snapshot(), state="failed", finished_at=now(), error=str(e))
+        finally:
+            with self.status_lock:
+                held_jobs.discard(job_id)
+            active_jobs.discard(job_id)
+            current_job.set(None)
+            logging.getLogger().removeHandler(handler)
+            handler.close()
+
+    def attach_log(self, job_id):
+        handler = logging.FileHandler(job_log_file(job_id, self.status_dir), encoding="utf-8")
+        handler.setFormatter(JOB_LOG_FORMAT)
+        handler.addFilter(JobLogFilter(job_id))
+        logging.getLogger().addHandler(handler)
+        return handler
+
+    def update_status(self, job_id, **changes):
+        # with no changes, only refreshes updated_at: the heartbeat
+        with self.status_lock:
+            status = job_status(job_id, self.status_dir) or {"job_id": job_id}
+            status.update(changes, updated_at=now())
+            self.write_status(job_id, status)
+
+    def write_status(self, job_id, status):
+        write_job_status(job_id, status, self.status_dir)
+
+
+def now():
+    return datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
@@ -0,0 +1,60 @@
+import logging, os, time
+
+logger = logging.getLogger()
+
+BLOCK_SIZE = 64 * 1024
+
+
+def tail_lines(path, count=100, block_size=BLOCK_SIZE):
+    """
+    The last `count` lines of a file and the offset they end at, read in blocks
+    backwards from the end, so a large log isn't read whole.
+    """
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        data = b""
+        # one more newline than lines wanted, as the file normally ends with one
+        while position > 0 and data.count(b"\n") <= count:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            data = f.read(size) + data
+    lines = data.decode("utf-8", errors="replace").splitlines(keepends=True)
+    return lines[-count:] if count else [], end
+
+
+def follow_lines(path, offset=0, poll_interval=1.0, keepalive=15.0, should_stop=None):
+    """
+    Yields (offset, line) for each complete line written to a file from `offset` on,
+    where offset is where the line ends, and None every `keepalive` seconds that
+    nothing is written. A file truncated below `offset` is followed from its start.
+    Stops once should_stop() is true and everything written so far has been yielded.
+    """
+    partial = b""
+    idle_since = time.monotonic()
+    while True:
+        stopping = should_stop is not None and should_stop()
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if size < offset:
+            offset, partial = 0, b""
+        if size > offset:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read(size - offset)
+            line_end = offset - len(partial)
+            offset += len(data)
+            *lines, partial = (partial + data).split(b"\n")
+            for line in lines:
+                line_end += len(line) + 1
+                yield line_end, line.decode("utf-8", errors="replace") + "\n"
+            idle_since = time.monotonic()
+        if stopping:
+            return
+        if time.monotonic() - idle_since >= keepalive:
+            idle_since = time.monotonic()
+            yield None
+        time.sleep(poll_interval)
@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+import hashlib, json, logging, os, tempfile, threading, time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from utils.thread_context import with_context
+
+logger = logging.getLogger()
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "dlp-ingest", "manifests")
+CACHE_MAX_AGE_DAYS = 30
+CACHE_MAX_BYTES = 256 * 1024 ** 2
+# statuses worth asking again for; anything else is an answer
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class TransientFetchError(Exception):
+    pass
+
+
+def get_manifest_resolver(env, inventory=None):
+    # One resolver per run. ingest.main() resets it at the start of each run.
+    if env.get("manifest_resolver") is None:
+        env["manifest_resolver"] = ManifestResolver(
+            img_root=env.get("APP_IMG_ROOT_PATH"),
+            bucket=env.get("AWS_DEST_BUCKET"),
+            inventory=inventory,
+            cache_dir=env.get("MANIFEST_CACHE_DIR") or DEFAULT_CACHE_DIR,
+            max_workers=env.get("MANIFEST_WORKERS") or 8,
+        )
+    return env["manifest_resolver"]
+
+
+class ManifestResolver:
+    """
+    Fetches IIIF manifests over a pooled keep-alive session, with timeouts.
+
+    - Results are memoized for the run, misses included. Timeouts, connection errors
+      and 408/429/5xx responses are retried with backoff and, if they persist, aren't
+      memoized, so a later lookup tries again; a cached body is used meanwhile.
+    - When the manifest URL is under `img_root`, the S3 inventory of `bucket` is checked
+      first and manifests that aren't there are never requested.
+    - Bodies are cached on disk with their ETag, and revalidated with If-None-Match.
+      Entries unused for `cache_max_age_days` are removed, then the least recently used
+      ones until the cache fits in `cache_max_bytes`.
+    - prefetch() fetches a list of URLs concurrently.
+    """
+
+    def __init__(
+        self,
+        img_root=None,
+        bucket=None,
+        inventory=None,
+        cache_dir=DEFAULT_CACHE_DIR,
+        max_workers=8,
+        timeout=(5, 30),
+        retries=3,
+        backoff=0.5,
+        cache_max_age_days=CACHE_MAX_AGE_DAYS,
+        cache_max_bytes=CACHE_MAX_BYTES,
+    ):
+        self.img_root = img_root
+        self.bucket = bucket
+        self.inventory = inventory
+        self.cache_dir = cache_dir
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self.retries = max(0, int(retries))
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers, max_retries=2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.manifests = {}
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "not_modified": 0, "skipped": 0, "failed": 0, "retried": 0}
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            prune_cache(self.cache_dir, cache_max_age_days, cache_max_bytes)
+
+    def prefetch(self, urls, root=None):
+        urls = [url for url in dict.fromkeys(urls) if url and url not in self.manifests]
+        if not urls:
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            list(executor.map(with_context(lambda url: self.get(url, root)), urls))
+        logger.info(f"Prefetched {len(urls)} IIIF manifest(s): {self.stats}")
+
+    def thumbnail(self, url, root=None):
+        manifest = self.get(url, root)
+        try:
+            return manifest["thumbnail"]["@id"]
+        except (KeyError, TypeError):
+            return None
+
+    def get(self, url, root=None):
+        with self.lock:
+            if url in self.manifests:
+                return self.manifests[url]
+        manifest = None
+        if self.in_bucket(url, root):
+            try:
+                manifest = self.fetch(url)
+            except TransientFetchError as e:
+                # not memoized: the next lookup of this URL asks again
+                logger.error(f"Error fetching IIIF manifest {url}, after retries: {e}")
+                return None
+        else:
+            self.count("skipped")
+        with self.lock:
+            self.manifests[url] = manifest
+        return manifest
+
+    def in_bucket(self, url, root=None):
+        # Only URLs served from our own bucket can be checked; anything else has to be requested
+        if self.inventory is None or not self.bucket or not self.img_root or not url.startswith(self.img_root):
+            return True
+        key = url[len(self.img_root):].lstrip("/")
+        try:
+            return self.inventory.find(self.bucket, key, root=root) is not None
+        except Exception as e:
+            logger.error(f"Error checking s3://{self.bucket}/{key}: {e}")
+            return True
+
+    def fetch(self, url):
+        cache_file = self.cache_file(url)
+        cached = self.read_cache(cache_file)
+        headers = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        attempt = 0
+        while True:
+            try:
+                response = self.request(url, headers)
+                break
+            except TransientFetchError as e:
+                attempt += 1
+                if attempt > self.retries:
+                    self.count("failed")
+                    if cached:
+                        logger.warning(f"Using the cached IIIF manifest {url}: {e}")
+                        return cached["manifest"]
+                    raise
+                self.count("retried")
+                time.sleep(self.backoff * (2 ** (attempt - 1)))
+        if response is None:
+            return None
+        if response.status_code == 304 and cached:
+            self.count("not_modified")
+            return cached["manifest"]
+        try:
+            manifest = response.json()
+        except Exception as e:
+            self.count("failed")
+            logger.error(f"Error reading IIIF manifest {url}: {e}")
+            return None
+        if response.headers.get("ETag"):
+            self.write_cache(cache_file, {"etag": response.headers["ETag"], "manifest": manifest})
+        return manifest
+
+    def request(self, url, headers):
+        # -> the response, None for a definite failure (404 and the like); raises TransientFetchError
+        self.count("requests")
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise TransientFetchError(str(e))
+        except Exception as e:
+            self.count("failed")
+            logger.error(f"Error fetching IIIF manifest {url}: {e}")
+            return None
+        if response.status_code in TRANSIENT_STATUSES:
+            raise TransientFetchError(f"HTTP {response.status_code}")
+        if response.status_code != 304 and response.status_code >= 400:
+            self.count("failed")
+            logger.error(f"Error fetching IIIF manifest {url}: HTTP {response.status_code}")
+            return None
+        return response
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def cache_file(self, url):
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, hashlib.sha1(url.encode()).hexdigest() + ".json")
+
+    def read_cache(self, cache_file):
+        if not cache_file or not os.path.exists(cache_file):
+            return None
+        try:
+            with open(cache_file) as f:
+                entry = json.load(f)
+            # the modification time is when the entry was last used, for pruning
+            os.utime(cache_file)
+            return entry
+        except Exception:
+            return None
+
+    def write_cache(self, cache_file, entry):
+        if not cache_file:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, cache_file)
+        except Exception as e:
+            logger.error(f"Error writing manifest cache {cache_file}: {e}")
+
+
+
+def prune_cache(cache_dir, max_age_days=CACHE_MAX_AGE_DAYS, max_bytes=CACHE_MAX_BYTES):
+    # drops entries unused for max_age_days, then the least recently used until under max_bytes
+    try:
+        entries = []
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+    except OSError as e:
+        logger.error(f"Error reading manifest cache {cache_dir}: {e}")
+        return
+    cutoff = time.time() - max_age_days * 86400
+    total = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if mtime >= cutoff and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
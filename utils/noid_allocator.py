@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+import logging, uuid
+from datetime import datetime, timezone
+from utils.dynamo_tools import batch_delete_keys
+
+logger = logging.getLogger()
+
+# TransactWriteItems accepts at most 100 actions per call
+MAX_BLOCK_SIZE = 100
+
+
+def get_noid_allocator(env):
+    # One allocator per run. ingest.main() resets it at the start of each run.
+    if env.get("noid_allocator") is None:
+        env["noid_allocator"] = NoidAllocator(env["mint_table"], dry_run=env.get("DRY_RUN"))
+    return env["noid_allocator"]
+
+
+class NoidAllocator:
+    """
+    Hands out NOID short ids from a local pool of ids already reserved in the mint table.
+
+    A block is reserved with one TransactWriteItems call: a placeholder record per id,
+    each conditional on attribute_not_exists(short_id). Two runs can never be given
+    the same id, and minting needs no collision-check query. The real NOID record later
+    overwrites the placeholder. Ids that aren't used are handed back with release()
+    and reused; whatever is left at the end of the run is deleted by close().
+    A run that dies before close() leaves its placeholders behind; see the README
+    for finding and removing them.
+    """
+
+    def __init__(self, mint_table, block_size=25, dry_run=False, max_attempts=5):
+        self.mint_table = mint_table
+        self.block_size = max(1, min(int(block_size), MAX_BLOCK_SIZE))
+        self.dry_run = dry_run
+        self.max_attempts = max_attempts
+        self.pool = []
+        self.reserved = set()
+        self.reserve_calls = 0
+
+    def new_noid(self):
+        return str(uuid.uuid4()).replace("-", "")[:8]
+
+    def mint(self):
+        if not self.pool:
+            self.reserve_block()
+        return self.pool.pop()
+
+    def release(self, noid):
+        # back into the pool; it is still reserved for this run
+        if noid in self.reserved and noid not in self.pool:
+            self.pool.append(noid)
+
+    def reserve_block(self):
+        size = self.block_size
+        # blocks double as the run goes on, so small ingests don't over-reserve
+        self.block_size = min(self.block_size * 2, MAX_BLOCK_SIZE)
+        if self.dry_run:
+            self.pool.extend(self.new_noid() for _ in range(size))
+            return
+        now = datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+        for attempt in range(self.max_attempts):
+            block = set()
+            while len(block) < size:
+                block.add(self.new_noid())
+            try:
+                self.reserve_calls += 1
+                self.mint_table.meta.client.transact_write_items(
+                    TransactItems=[
+                        {
+                            "Put": {
+                                "TableName": self.mint_table.name,
+                                "Item": {"short_id": noid, "type": "Reserved", "created_at": now},
+                                "ConditionExpression": "attribute_not_exists(short_id)",
+                            }
+                        }
+                        for noid in block
+                    ]
+                )
+            except self.mint_table.meta.client.exceptions.TransactionCanceledException as e:
+                # an id in the block is already taken; nothing was written, so draw a new block
+                logger.info(f"NOID block reservation collided, retrying: {e}")
+                continue
+            self.reserved.update(block)
+            self.pool.extend(block)
+            logger.info(f"Reserved {len(block)} NOID(s) in {self.mint_table.name}")
+            return
+        raise RuntimeError(f"Unable to reserve a block of NOIDs in {self.mint_table.name}")
+
+    def close(self):
+        # delete the placeholders of ids reserved but never used
+        unused = [noid for noid in self.pool if noid in self.reserved]
+        self.pool = []
+        if unused and not self.dry_run:
+            batch_delete_keys(
+                self.mint_table.meta.client,
+                self.mint_table.name,
+                [{"short_id": noid} for noid in unused],
+            )
+            logger.info(f"Released {len(unused)} unused NOID reservation(s)")
+        self.reserved.difference_update(unused)
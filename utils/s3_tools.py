@@ -1,22 +1,256 @@
 #!/usr/bin/python3
+import bisect, logging, threading, time
 import boto3
+from boto3.s3.transfer import TransferConfig
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.thread_context import with_context
 
-def get_matching_s3_keys(bucket, prefix="", suffix=""):
-    s3 = boto3.client("s3")
-    kwargs = {"Bucket": bucket, "Prefix": prefix}
-    matches = []
-    while True:
-        resp = s3.list_objects_v2(**kwargs)
-        try:
-            contents = resp["Contents"]
-        except KeyError:
-            return
-        for obj in contents:
-            key = obj["Key"]
-            if key.startswith(prefix) and key.endswith(suffix):
-                matches.append(key)
+logger = logging.getLogger()
+
+
+def get_s3_inventory(env):
+    # One inventory per ingest run. ingest.main() replaces it at the start of each run.
+    if env.get("s3_inventory") is None:
+        env["s3_inventory"] = S3Inventory()
+    return env["s3_inventory"]
+
+
+class S3Inventory:
+    """
+    In-memory index of S3 listings, built once per (bucket, root prefix) per run.
+
+    Callers pass the collection root as `root` so that every per-item lookup under
+    that collection is answered from a single paginated listing. Lookups for a
+    prefix that no listed root covers fall back to listing that prefix on its own.
+    """
+
+    def __init__(self, s3_client=None):
+        self.s3_client = s3_client or boto3.client("s3")
+        self.listings = {}
+        self.list_calls = 0
+        self.lock = threading.RLock()
+
+    def listing(self, bucket, prefix="", root=None):
+        with self.lock:
+            for (listed_bucket, listed_root), listing in self.listings.items():
+                if listed_bucket == bucket and prefix.startswith(listed_root):
+                    return listing
+            root = root if root is not None and prefix.startswith(root) else prefix
+            listing = self.list_prefix(bucket, root)
+            self.listings[(bucket, root)] = listing
+            return listing
+
+    def list_prefix(self, bucket, prefix):
+        objects = {}
+        kwargs = {"Bucket": bucket, "Prefix": prefix}
+        while True:
+            resp = self.s3_client.list_objects_v2(**kwargs)
+            self.list_calls += 1
+            for obj in resp.get("Contents", []):
+                objects[obj["Key"]] = {
+                    "Size": obj.get("Size"),
+                    "ETag": obj.get("ETag"),
+                    "LastModified": obj.get("LastModified"),
+                }
+            try:
+                kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+            except KeyError:
+                break
+        logger.info(f"S3 inventory: listed {len(objects)} object(s) under s3://{bucket}/{prefix}")
+        listing = {"objects": objects, "keys": sorted(objects), "folded": {}}
+        for key in listing["keys"]:
+            listing["folded"][key.lower()] = key
+        return listing
+
+    def match(self, bucket, prefix="", suffix="", root=None):
+        # The keys under prefix that end with suffix, answered from the listing
+        listing = self.listing(bucket, prefix, root)
+        keys = listing["keys"]
+        matches = []
+        idx = bisect.bisect_left(keys, prefix)
+        while idx < len(keys) and keys[idx].startswith(prefix):
+            if keys[idx].endswith(suffix):
+                matches.append(keys[idx])
+            idx += 1
+        return matches
+
+    def find(self, bucket, path, root=None):
+        # exact, case sensitive match first, then ignore case
+        listing = self.listing(bucket, path, root)
+        if path in listing["objects"]:
+            return path
+        key = listing["folded"].get(path.lower())
+        if key and not key.endswith("/"):
+            return key
+        return None
+
+    def head(self, bucket, key, root=None):
+        return self.listing(bucket, key, root)["objects"].get(key)
+
+    def record(self, bucket, key, size=None, etag=None, last_modified=None):
+        # Keep listings current with objects written during this run
+        with self.lock:
+            for (listed_bucket, listed_root), listing in self.listings.items():
+                if listed_bucket == bucket and key.startswith(listed_root):
+                    if key not in listing["objects"]:
+                        bisect.insort(listing["keys"], key)
+                        listing["folded"][key.lower()] = key
+                    listing["objects"][key] = {
+                        "Size": size,
+                        "ETag": etag,
+                        "LastModified": last_modified,
+                    }
+
+    def invalidate(self, bucket=None):
+        with self.lock:
+            for listed in list(self.listings):
+                if bucket is None or listed[0] == bucket:
+                    del self.listings[listed]
+
+
+class S3CopyEngine:
+    """
+    Bounded, concurrent S3 server-side copy queue.
+
+    Jobs are submitted with submit() and run on a pool of `max_workers` threads.
+    Failed copies are retried with exponential backoff. wait() blocks until every
+    job has finished and returns one result per job, in submission order.
+    """
+
+    def __init__(self, s3_client=None, max_workers=8, retries=3, backoff=1.0, dry_run=False, inventory=None, verbose=False, transfer_config=None):
+        self.s3_client = s3_client or boto3.client("s3")
+        self.transfer_config = transfer_config
+        self.max_workers = max(1, int(max_workers))
+        self.retries = max(0, int(retries))
+        self.backoff = backoff
+        self.dry_run = dry_run
+        self.inventory = inventory
+        self.verbose = verbose
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="s3copy")
+        # cap queued jobs so huge collections don't build an unbounded backlog in memory
+        self.slots = threading.BoundedSemaphore(self.max_workers * 4)
+        self.futures = []
+        self.results = []
+
+    def submit(self, source_bucket, source_key, dest_bucket, dest_key, on_success=None, source_meta=None, overwrite=False):
+        job = {
+            "index": len(self.futures),
+            "source_bucket": source_bucket,
+            "source_key": source_key,
+            "dest_bucket": dest_bucket,
+            "dest_key": dest_key,
+            "source_meta": source_meta,
+            "overwrite": overwrite,
+        }
+        self.slots.acquire()
         try:
-            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
-        except KeyError:
-            break
-    return matches
\ No newline at end of file
+            future = self.executor.submit(with_context(self.run), job, on_success)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda f: self.slots.release())
+        self.futures.append(future)
+        return job["index"]
+
+    def skip(self, source_bucket, source_key, dest_bucket, dest_key, reason="unchanged"):
+        # Record a job that needs no copy so it still shows up, in order, in the report
+        future = Future()
+        future.set_result({
+            "index": len(self.futures),
+            "source_bucket": source_bucket,
+            "source_key": source_key,
+            "dest_bucket": dest_bucket,
+            "dest_key": dest_key,
+            "status": "skipped",
+            "attempts": 0,
+            "error": None,
+            "reason": reason,
+        })
+        self.futures.append(future)
+        return len(self.futures) - 1
+
+    def run(self, job, on_success=None):
+        source_meta = job.pop("source_meta", None) or {}
+        result = dict(job, status="failed", attempts=0, error=None)
+        if self.dry_run:
+            logger.info("DRYRUN: s3 copy: simulated")
+            result["status"] = "simulated"
+            return result
+        while result["attempts"] <= self.retries:
+            result["attempts"] += 1
+            try:
+                if self.verbose:
+                    logger.info(f"Copying: {job['source_bucket']}:{job['source_key']}, To: {job['dest_bucket']}:{job['dest_key']}")
+                self.s3_client.copy(
+                    {"Bucket": job["source_bucket"], "Key": job["source_key"]},
+                    job["dest_bucket"],
+                    job["dest_key"],
+                    Config=self.transfer_config,
+                )
+                result["status"] = "overwritten" if job["overwrite"] else "copied"
+                result["error"] = None
+                break
+            except Exception as e:
+                result["error"] = str(e)
+                if result["attempts"] <= self.retries:
+                    time.sleep(self.backoff * (2 ** (result["attempts"] - 1)))
+        if result["status"] in ("copied", "overwritten"):
+            if self.inventory is not None:
+                self.inventory.record(
+                    job["dest_bucket"],
+                    job["dest_key"],
+                    source_meta.get("Size"),
+                    source_meta.get("ETag"),
+                    source_meta.get("LastModified"),
+                )
+            if on_success is not None:
+                try:
+                    on_success(job["source_key"])
+                except Exception as e:
+                    logger.error(e)
+        else:
+            logger.error(f"Copy failed after {result['attempts']} attempt(s): {job['source_bucket']}:{job['source_key']} -> {job['dest_bucket']}:{job['dest_key']}: {result['error']}")
+        return result
+
+    def wait(self):
+        for future in self.futures[len(self.results):]:
+            self.results.append(future.result())
+        return self.results
+
+    def shutdown(self):
+        self.wait()
+        self.executor.shutdown(wait=True)
+
+    def report(self):
+        results = self.wait()
+        summary = {}
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+        return {"summary": summary, "results": results}
+
+
+# Single-request copies keep the source ETag for objects up to S3's 5 GiB CopyObject limit,
+# which is what lets a later sync run recognise them as unchanged.
+SYNC_TRANSFER_CONFIG = TransferConfig(multipart_threshold=5 * 1024 ** 3)
+
+
+def same_object(source_meta, dest_meta):
+    """
+    True when listing metadata says dest is already a copy of source.
+    Sizes must match. ETags must match, unless either one is a multipart ETag
+    ("<md5>-<parts>"), which a copy doesn't preserve; then a dest at least as
+    new as the source counts as the same object.
+    """
+    if not source_meta or not dest_meta:
+        return False
+    if source_meta.get("Size") is None or source_meta.get("Size") != dest_meta.get("Size"):
+        return False
+    source_etag = (source_meta.get("ETag") or "").strip('"')
+    dest_etag = (dest_meta.get("ETag") or "").strip('"')
+    if source_etag and source_etag == dest_etag:
+        return True
+    if "-" in source_etag or "-" in dest_etag:
+        source_modified = source_meta.get("LastModified")
+        dest_modified = dest_meta.get("LastModified")
+        return bool(source_modified and dest_modified and dest_modified >= source_modified)
+    return False
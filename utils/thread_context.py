@@ -0,0 +1,11 @@
+import contextvars
+
+
+def with_context(fn):
+    """
+    fn, to be run on another thread (a pool's) with the context variables of the
+    thread calling with_context(), such as the ingest job it works for. Pool threads
+    don't inherit them; each call runs in its own copy, so calls can run at once.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
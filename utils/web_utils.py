@@ -1,12 +1,10 @@
-import logging, os, re, shutil, sys, yaml
+import logging, os, re, shutil, sys, uuid, yaml
 import boto3
 from datetime import datetime
 from flask import request
 
 logger = logging.getLogger()
 
-ingestConfig = {}
-
 env_vars = [
     'APP_SRC_DIR',
     'APP_IMG_ROOT_PATH',
@@ -14,6 +12,10 @@ env_vars = [
     'AWS_DEST_BUCKET',
     'COLLECTION_CATEGORY',
     'COLLECTION_IDENTIFIER',
+    'COPY_RETRIES',
+    'COPY_WORKERS',
+    'CSV_CHUNK_SIZE',
+    'CSV_ENGINE',
     'DRY_RUN',
     'DYNAMODB_TABLE_SUFFIX',
     'DYNAMODB_NOID_TABLE',
@@ -21,9 +23,13 @@ env_vars = [
     'EMBARGO_START_DATE',
     'EMBARGO_END_DATE',
     'ENV_SELECTION',
+    'FIXITY_FUNCTION',
+    'FIXITY_MODE',
     'GENERATE_THUMBNAILS',
     'INGEST_TYPE',
     'LONG_URL_PATH',
+    'MANIFEST_CACHE_DIR',
+    'MANIFEST_WORKERS',
     'MEDIA_INGEST',
     'MEDIA_TYPE',
     'METADATA_INGEST',
@@ -31,10 +37,15 @@ env_vars = [
     'NOID_NAA',
     'MEDIA_TYPE',
     'PARENT_COLLECTION_IDENTIFIER',
+    'PREFETCH_WORKERS',
     'REGION',
     'SHORT_URL_PATH',
+    'SYNC_MEDIA',
     'UPDATE_METADATA',
     'VERBOSE',
+    'VERIFY_CONTENT',
+    'VERIFY_MAX_MBPS',
+    'VERIFY_WORKERS',
     'VISIBILITY',
     '3D_OPTIONS_ROTATION_X',
     '3D_OPTIONS_ROTATION_Y',
@@ -54,10 +65,6 @@ def check_messages():
     return msg
 
 
-def get_ingestConfig():
-    return ingestConfig
-
-
 def get_available_envs(application):
     env_file = os.path.join(application.config['APP_SRC_DIR'], "config", "available_envs.yml")
     with open(env_file, 'r') as f:
@@ -66,13 +73,6 @@ def get_available_envs(application):
     return envs or []
 
 
-def clear_logfile(logger):
-    logfile = get_logfile(logger)
-    if logfile:
-        with open(logfile, 'w'):
-            pass
-
-
 def get_logfile(logger):
     for handler in logger.root.handlers:
         if isinstance(handler, logging.FileHandler):
@@ -90,20 +90,23 @@ def environment_json(env):
     return env_json
 
 
-def set_environment(env_values):
+# Each request builds its own ingest config dict and passes it to these, so
+# concurrent requests (gunicorn threads) never share one
+def set_environment(env_values, config):
     for key, value in env_values:
         if str(key).upper() in env_vars:
             # convert string booleans from form into actual booleans
             if isinstance(value, str) and value.lower() == "true":
-                ingestConfig[str(key).upper()] = True
+                config[str(key).upper()] = True
             elif isinstance(value, str) and value.lower() == "false":
-                ingestConfig[str(key).upper()] = False
+                config[str(key).upper()] = False
             # or just add the value to the config as is
             else:
-                ingestConfig[str(key).upper()] = value
+                config[str(key).upper()] = value
+    return config
 
 
-def set_environment_defaults(application):
+def set_environment_defaults(application, config):
     defaults = None
     env_file = os.path.join(application.config['APP_SRC_DIR'], 'config', os.getenv('INGEST_ENV_YAML'))
     
@@ -114,22 +117,32 @@ def set_environment_defaults(application):
         logger.error(f"set_environment_defaults: {e}")
 
     if defaults:
-        set_environment(defaults.items())
-        set_environment({'APP_SRC_DIR': application.config['APP_SRC_DIR']}.items())
+        set_environment(defaults.items(), config)
+        set_environment({'APP_SRC_DIR': application.config['APP_SRC_DIR']}.items(), config)
     else:
         logger.info(f"Error loading environment defaults from {env_file}")
+    return config
 
 
-def set_environment_overrides():
-    set_environment(request.form.items())
+def set_environment_overrides(config):
+    return set_environment(request.form.items(), config)
 
 
 def get_identifier():
     return request.form.get('collection_identifier')
 
 
-def save_uploads(application, field_name='metadata_input', allowed_extensions=None):
+def new_upload_dir(application):
+    # a directory of its own for one submission's uploads, so a queued job's files
+    # can't be overwritten by a later upload of the same name
+    upload_dir = os.path.join(application.config['UPLOADS'], uuid.uuid4().hex)
+    os.makedirs(upload_dir, exist_ok=True)
+    return upload_dir
+
+
+def save_uploads(application, field_name='metadata_input', allowed_extensions=None, upload_dir=None):
     files = []
+    upload_dir = upload_dir or application.config['UPLOADS']
     try:
         for file in request.files.getlist(field_name):
             if not file or not file.filename:
@@ -142,7 +155,7 @@ def save_uploads(application, field_name='metadata_input', allowed_extensions=No
                     continue
 
             files.append(filename)
-            file.save(os.path.join(application.config['UPLOADS'], filename))
+            file.save(os.path.join(upload_dir, filename))
     except Exception as e:
         logger.error(f"Error: uploading file. - {e}")
     return files